@@ -3,16 +3,31 @@
 
 该模块实现了文本向量化功能，包括：
 - 向量化服务抽象
+- 带缓存的向量化服务基类
 - SentenceTransformer实现
+- ONNX Runtime（int8量化）实现
+- 进程池实现（共享内存回传结果）
+- 向量化服务工厂
 - 向量缓存机制
+- 向量化微批处理
 """
 
 from .embedding_service import EmbeddingService
+from .cached_embedding import CachedEmbeddingService
 from .sentence_transformer import SentenceTransformerEmbedding
+from .onnx_embedding import OnnxEmbedding
+from .process_pool_embedding import ProcessPoolEmbedding
 from .embedding_cache import EmbeddingCache
+from .micro_batcher import MicroBatcher
+from .factory import create_embedding_service
 
 __all__ = [
     "EmbeddingService",
-    "SentenceTransformerEmbedding", 
-    "EmbeddingCache"
+    "CachedEmbeddingService",
+    "SentenceTransformerEmbedding",
+    "OnnxEmbedding",
+    "ProcessPoolEmbedding",
+    "EmbeddingCache",
+    "MicroBatcher",
+    "create_embedding_service"
 ]
@@ -0,0 +1,504 @@
+"""
+向量缓存存储区
+
+单个内存映射文件，同时存放哈希索引和向量，打开缓存只需一次mmap：
+
+- 文件头（64字节）：魔数 | u32 版本 | u32 维度 | u64 行容量 | u64 槽位数 |
+  u64 已分配行数 | u64 有效条目数 | u64 累计访问次数 | u64 已占用槽位数
+- 哈希槽位：int32 行号（-1 空，-2 已删除），线性探测，比较键时回查行摘要
+- 每行摘要：2个u64（文本摘要的128位）
+- 每行最近访问时间（float64，-1 表示空闲行）与访问次数（int64）
+- 每行向量的CRC32（读取时校验，掉电后写了一半的行视为未命中）
+- 向量区：float32 矩阵（行容量 × 维度）
+
+写满后按最近访问时间批量淘汰最旧的行，空出的行按需复用。
+"""
+
+import logging
+import os
+import struct
+import time
+import zlib
+from pathlib import Path
+from typing import List, Optional, Tuple
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+_MAGIC = b"EMBCACHE"
+_VERSION = 1
+_HEADER = struct.Struct("<8sII")
+_HEADER_SIZE = 64
+_ALIGNMENT = 64
+
+# 文件头中 u64 计数器的下标
+_CAPACITY = 0
+_SLOT_COUNT = 1
+_ROW_COUNT = 2
+_LIVE = 3
+_TOTAL_ACCESS = 4
+_USED_SLOTS = 5
+
+# 槽位状态
+_EMPTY = -1
+_DELETED = -2
+
+# 行空闲标记（最近访问时间）
+_FREE = -1.0
+
+_MAX_LOAD_FACTOR = 0.5
+
+# 写满时一次淘汰的比例
+_EVICTION_FRACTION = 0.01
+
+
+def _align(offset: int) -> int:
+    return (offset + _ALIGNMENT - 1) // _ALIGNMENT * _ALIGNMENT
+
+
+class CacheArena:
+    """
+    向量缓存存储区
+
+    多进程共享同一文件时，写入通过文件锁串行化；读取不加锁，靠CRC校验发现不完整的行。
+    """
+
+    def __init__(self, path: str, capacity: int, dimension: int):
+        """
+        打开或创建存储区（容量或维度与现有文件不一致时重建）
+
+        Args:
+            path: 文件路径
+            capacity: 最多缓存的向量数
+            dimension: 向量维度
+        """
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+
+        if not self._compatible(capacity, dimension):
+            self._create(capacity, dimension)
+
+        self._map()
+
+        # 已知的空闲行（仅是提示，使用前在锁内复核）
+        self._free_rows: List[int] = []
+
+        logger.info(
+            f"向量缓存存储区已打开: {self.path}, 条目={self.count}/{self.capacity}, 维度={self.dimension}"
+        )
+
+    @staticmethod
+    def read_dimension(path: str) -> Optional[int]:
+        """
+        读取已有文件记录的向量维度
+
+        Args:
+            path: 文件路径
+
+        Returns:
+            Optional[int]: 维度，文件不存在或格式不兼容时返回None
+        """
+        header = _read_header(Path(path))
+        return header[1] if header is not None else None
+
+    @property
+    def count(self) -> int:
+        """
+        有效条目数
+
+        Returns:
+            int: 条目数
+        """
+        return int(self._counters[_LIVE])
+
+    @property
+    def total_access(self) -> int:
+        """
+        累计命中次数
+
+        Returns:
+            int: 访问次数
+        """
+        return int(self._counters[_TOTAL_ACCESS])
+
+    @property
+    def nbytes(self) -> int:
+        """
+        文件大小
+
+        Returns:
+            int: 字节数
+        """
+        return len(self._buffer)
+
+    def lookup(self, digest: bytes) -> Optional[int]:
+        """
+        查找摘要所在的行
+
+        Args:
+            digest: 16字节文本摘要
+
+        Returns:
+            Optional[int]: 行号，不存在时返回None
+        """
+        key = np.frombuffer(digest, dtype="<u8")
+        mask = len(self._slots) - 1
+        slot = int(key[0]) & mask
+        while True:
+            row = int(self._slots[slot])
+            if row == _EMPTY:
+                return None
+            if row >= 0 and self._digests[row, 0] == key[0] and self._digests[row, 1] == key[1]:
+                return row
+            slot = (slot + 1) & mask
+
+    def read(self, digest: bytes, touch: bool = True) -> Optional[np.ndarray]:
+        """
+        读取向量（返回副本，行可能在之后被淘汰复用）
+
+        Args:
+            digest: 16字节文本摘要
+            touch: 是否更新访问时间与次数
+
+        Returns:
+            Optional[np.ndarray]: 向量，不存在或校验失败时返回None
+        """
+        row = self.lookup(digest)
+        if row is None:
+            return None
+
+        vector = self._vectors[row].copy()
+        if zlib.crc32(vector.tobytes()) != int(self._checksums[row]):
+            logger.warning(f"向量缓存行校验失败，视为未命中: 行={row}")
+            return None
+
+        if touch:
+            self._last_access[row] = time.time()
+            self._access_counts[row] += 1
+            self._counters[_TOTAL_ACCESS] += 1
+        return vector
+
+    def put(self, digest: bytes, vector: np.ndarray) -> None:
+        """
+        写入向量（已存在时原地覆盖，写满时淘汰最久未访问的行）
+
+        Args:
+            digest: 16字节文本摘要
+            vector: 向量
+        """
+        self.put_many([(digest, vector)])
+
+    def put_many(self, items: List[Tuple[bytes, np.ndarray]]) -> None:
+        """
+        批量写入向量（只加一次文件锁）
+
+        Args:
+            items: [(16字节文本摘要, 向量), ...]
+        """
+        vectors = [np.asarray(vector, dtype=np.float32).reshape(-1) for _, vector in items]
+        for vector in vectors:
+            if vector.shape[0] != self.dimension:
+                raise ValueError(f"向量维度不匹配: 期望={self.dimension}, 实际={vector.shape[0]}")
+
+        with self._locked():
+            for (digest, _), vector in zip(items, vectors):
+                self._put_row(digest, vector)
+
+    def _put_row(self, digest: bytes, vector: np.ndarray) -> None:
+        """
+        写入一行（调用方持有文件锁）
+
+        Args:
+            digest: 16字节文本摘要
+            vector: float32向量
+        """
+        row = self.lookup(digest)
+        if row is None:
+            row = self._allocate_row()
+            self._insert_slot(digest, row)
+            self._digests[row] = np.frombuffer(digest, dtype="<u8")
+            self._access_counts[row] = 0
+            self._counters[_LIVE] += 1
+
+        self._vectors[row] = vector
+        self._checksums[row] = zlib.crc32(vector.tobytes())
+        self._last_access[row] = time.time()
+
+    def clear(self) -> None:
+        """
+        清空所有条目
+        """
+        with self._locked():
+            self._slots[:] = _EMPTY
+            self._last_access[:] = _FREE
+            self._access_counts[:] = 0
+            self._counters[_ROW_COUNT] = 0
+            self._counters[_LIVE] = 0
+            self._counters[_TOTAL_ACCESS] = 0
+            self._counters[_USED_SLOTS] = 0
+            self._free_rows = []
+
+    def flush(self) -> None:
+        """
+        把映射区刷回磁盘
+        """
+        self._buffer.flush()
+
+    def close(self) -> None:
+        """
+        刷盘并解除映射
+        """
+        if self._buffer is None:
+            return
+        self.flush()
+        self._slots = self._digests = self._last_access = None
+        self._access_counts = self._checksums = self._vectors = self._counters = None
+        self._buffer = None
+
+    def _allocate_row(self) -> int:
+        """
+        分配一行：优先复用空闲行，其次使用未分配的行，写满时批量淘汰
+
+        Returns:
+            int: 行号
+        """
+        while self._free_rows:
+            row = self._free_rows.pop()
+            if self._last_access[row] == _FREE:
+                return row
+
+        row_count = int(self._counters[_ROW_COUNT])
+        if row_count < self.capacity:
+            self._counters[_ROW_COUNT] = row_count + 1
+            return row_count
+
+        # 其他进程可能已经淘汰过，先找现成的空闲行
+        free = np.flatnonzero(self._last_access == _FREE)
+        if free.size == 0:
+            free = self._evict(max(1, int(self.capacity * _EVICTION_FRACTION)))
+        self._free_rows = free.tolist()
+        return self._free_rows.pop()
+
+    def _evict(self, count: int) -> np.ndarray:
+        """
+        淘汰最久未访问的若干行
+
+        Args:
+            count: 淘汰数量
+
+        Returns:
+            np.ndarray: 被释放的行号
+        """
+        oldest = np.argpartition(self._last_access, count - 1)[:count]
+        for row in oldest:
+            self._remove_slot(int(row))
+        self._last_access[oldest] = _FREE
+        self._counters[_LIVE] -= len(oldest)
+        logger.debug(f"向量缓存淘汰了 {len(oldest)} 个条目")
+        return oldest
+
+    def _insert_slot(self, digest: bytes, row: int) -> None:
+        """
+        在哈希槽位中登记行号（已删除的槽位过多时先重建）
+
+        Args:
+            digest: 16字节文本摘要
+            row: 行号
+        """
+        if self._counters[_USED_SLOTS] + 1 > len(self._slots) * _MAX_LOAD_FACTOR:
+            self._rehash()
+
+        mask = len(self._slots) - 1
+        slot = int(np.frombuffer(digest, dtype="<u8")[0]) & mask
+        while self._slots[slot] >= 0:
+            slot = (slot + 1) & mask
+        if self._slots[slot] == _EMPTY:
+            self._counters[_USED_SLOTS] += 1
+        self._slots[slot] = row
+
+    def _remove_slot(self, row: int) -> None:
+        """
+        把行号从哈希槽位中删除（标记为已删除，保持探测链完整）
+
+        Args:
+            row: 行号
+        """
+        mask = len(self._slots) - 1
+        slot = int(self._digests[row, 0]) & mask
+        while True:
+            current = int(self._slots[slot])
+            if current == _EMPTY:
+                return
+            if current == row:
+                self._slots[slot] = _DELETED
+                return
+            slot = (slot + 1) & mask
+
+    def _rehash(self) -> None:
+        """
+        丢弃已删除标记，按有效行重建哈希槽位
+        """
+        self._slots[:] = _EMPTY
+        mask = len(self._slots) - 1
+        live_rows = np.flatnonzero(self._last_access != _FREE)
+        live_rows = live_rows[live_rows < self._counters[_ROW_COUNT]]
+        for row in live_rows:
+            slot = int(self._digests[row, 0]) & mask
+            while self._slots[slot] != _EMPTY:
+                slot = (slot + 1) & mask
+            self._slots[slot] = row
+        self._counters[_USED_SLOTS] = len(live_rows)
+
+    def _compatible(self, capacity: int, dimension: int) -> bool:
+        """
+        检查现有文件的格式、容量和维度是否一致
+
+        Args:
+            capacity: 期望的行容量
+            dimension: 期望的维度
+
+        Returns:
+            bool: 是否可以直接使用
+        """
+        header = _read_header(self.path)
+        if header is None:
+            if self.path.exists():
+                logger.warning(f"向量缓存文件格式不兼容，重建: {self.path}")
+            return False
+        file_capacity, file_dimension = header
+        if file_dimension != dimension or file_capacity != capacity:
+            logger.info(
+                f"向量缓存容量或维度变化，重建: 容量 {file_capacity}->{capacity}, 维度 {file_dimension}->{dimension}"
+            )
+            return False
+        return True
+
+    def _create(self, capacity: int, dimension: int) -> None:
+        """
+        创建空的存储区文件（先写临时文件再原子替换）
+
+        Args:
+            capacity: 行容量
+            dimension: 向量维度
+        """
+        capacity = max(capacity, 1)
+        slot_count = 16
+        while capacity > slot_count * _MAX_LOAD_FACTOR:
+            slot_count *= 2
+
+        layout = self._layout(capacity, slot_count, dimension)
+        tmp_path = self.path.with_name(self.path.name + ".tmp")
+        with open(tmp_path, "wb") as f:
+            f.truncate(layout["size"])
+            f.write(_HEADER.pack(_MAGIC, _VERSION, dimension))
+            f.write(struct.pack("<6Q", capacity, slot_count, 0, 0, 0, 0))
+            # 槽位全部置空，所有行标记为空闲
+            f.seek(layout["slots"])
+            f.write(np.full(slot_count, _EMPTY, dtype="<i4").tobytes())
+            f.seek(layout["last_access"])
+            f.write(np.full(capacity, _FREE, dtype="<f8").tobytes())
+        os.replace(tmp_path, self.path)
+
+    @staticmethod
+    def _layout(capacity: int, slot_count: int, dimension: int) -> dict:
+        """
+        计算各区域在文件中的偏移
+
+        Args:
+            capacity: 行容量
+            slot_count: 槽位数
+            dimension: 向量维度
+
+        Returns:
+            dict: 区域名称 -> 偏移（"size" 为文件总大小）
+        """
+        layout = {"slots": _HEADER_SIZE}
+        offset = _align(_HEADER_SIZE + slot_count * 4)
+        for name, item_size in (
+            ("digests", 16), ("last_access", 8), ("access_counts", 8), ("checksums", 4)
+        ):
+            layout[name] = offset
+            offset = _align(offset + capacity * item_size)
+        layout["vectors"] = offset
+        layout["size"] = offset + capacity * dimension * 4
+        return layout
+
+    def _map(self) -> None:
+        """
+        映射文件并建立各区域的数组视图
+        """
+        self._buffer = np.memmap(self.path, dtype=np.uint8, mode="r+")
+        _, _, self.dimension = _HEADER.unpack_from(self._buffer[:_HEADER.size].tobytes())
+        self._counters = self._buffer[_HEADER.size:_HEADER.size + 48].view("<u8")
+        self.capacity = int(self._counters[_CAPACITY])
+        slot_count = int(self._counters[_SLOT_COUNT])
+
+        layout = self._layout(self.capacity, slot_count, self.dimension)
+
+        def region(name: str, count: int, dtype: str) -> np.ndarray:
+            start = layout[name]
+            return self._buffer[start:start + count * np.dtype(dtype).itemsize].view(dtype)
+
+        self._slots = region("slots", slot_count, "<i4")
+        self._digests = region("digests", self.capacity * 2, "<u8").reshape(self.capacity, 2)
+        self._last_access = region("last_access", self.capacity, "<f8")
+        self._access_counts = region("access_counts", self.capacity, "<i8")
+        self._checksums = region("checksums", self.capacity, "<u4")
+        self._vectors = region("vectors", self.capacity * self.dimension, "<f4").reshape(
+            self.capacity, self.dimension
+        )
+
+    def _locked(self):
+        """
+        跨进程写锁（不支持文件锁的平台上退化为无锁）
+
+        Returns:
+            上下文管理器
+        """
+        return _FileLock(self.path.with_name(self.path.name + ".lock"))
+
+
+def _read_header(path: Path) -> Optional[Tuple[int, int]]:
+    """
+    读取文件头
+
+    Args:
+        path: 文件路径
+
+    Returns:
+        Optional[Tuple[int, int]]: (行容量, 维度)，文件不存在或格式不兼容时返回None
+    """
+    if not path.exists() or path.stat().st_size < _HEADER_SIZE:
+        return None
+    with open(path, "rb") as f:
+        header = f.read(_HEADER_SIZE)
+    magic, version, dimension = _HEADER.unpack_from(header)
+    if magic != _MAGIC or version != _VERSION:
+        return None
+    return struct.unpack_from("<Q", header, _HEADER.size)[0], dimension
+
+
+class _FileLock:
+    """基于 fcntl.flock 的排他文件锁"""
+
+    def __init__(self, path: Path):
+        self.path = path
+        self._fd = None
+
+    def __enter__(self):
+        if fcntl is not None:
+            self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+            fcntl.flock(self._fd, fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, *exc):
+        if self._fd is not None:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+            os.close(self._fd)
+            self._fd = None
+        return False
@@ -0,0 +1,357 @@
+"""
+带缓存的向量化服务基类
+
+各向量化后端共用的部分：向量缓存、微批处理、相似度计算。
+子类只需加载模型并实现同步的批量编码 _encode_batch。
+"""
+
+import logging
+from abc import abstractmethod
+from typing import Dict, List, Tuple
+import numpy as np
+
+from .embedding_service import EmbeddingService, normalize_rows
+from .embedding_cache import EmbeddingCache
+from .micro_batcher import MicroBatcher
+
+logger = logging.getLogger(__name__)
+
+
+def bucket_by_length(lengths: List[int], bucket_size: int, max_length: int) -> Dict[int, List[int]]:
+    """
+    按词元长度分桶：长度向上取整到 bucket_size 的倍数，相近长度的文本一起推理，减少填充
+
+    Args:
+        lengths: 每条文本的词元数
+        bucket_size: 桶宽度
+        max_length: 最大序列长度
+
+    Returns:
+        Dict[int, List[int]]: 填充长度 -> 文本下标列表
+    """
+    buckets: Dict[int, List[int]] = {}
+    for i, length in enumerate(lengths):
+        padded = min(-(-max(length, 1) // bucket_size) * bucket_size, max_length)
+        buckets.setdefault(padded, []).append(i)
+    return buckets
+
+
+def plan_batches(
+    lengths: List[int],
+    bucket_size: int,
+    max_length: int,
+    token_budget: int
+) -> List[Tuple[int, List[int]]]:
+    """
+    按长度分桶后再按词元预算切分批次：短文本一批多放，长文本一批少放
+
+    Args:
+        lengths: 每条文本的词元数
+        bucket_size: 桶宽度
+        max_length: 最大序列长度
+        token_budget: 每批最多的词元数（批大小 × 填充长度）
+
+    Returns:
+        List[Tuple[int, List[int]]]: [(填充长度, 文本下标列表), ...]，按填充长度升序
+    """
+    batches = []
+    for padded_length, indices in sorted(bucket_by_length(lengths, bucket_size, max_length).items()):
+        batch_size = max(1, token_budget // padded_length)
+        for start in range(0, len(indices), batch_size):
+            batches.append((padded_length, indices[start:start + batch_size]))
+    return batches
+
+
+class CachedEmbeddingService(EmbeddingService):
+    """
+    带缓存的向量化服务基类
+    
+    并发的 embed_text 调用经微批处理器合并为一次批量编码，
+    所有编码都在专用的有界线程池中执行。
+    
+    向量缓存按模型名称、版本、后端、预处理版本和维度划分命名空间；
+    修改 _preprocess_text 的行为时需要递增 PREPROCESS_VERSION。
+    子类在调用基类构造函数前设置 model_name、revision 和 _dimension。
+    """
+    
+    PREPROCESS_VERSION = 1
+    
+    # 后端标记（输出与原始模型有差异的后端需要独立的缓存命名空间）
+    backend_tag = ""
+    
+    # 预处理保留的最大字符数（None表示不截断，由后端自行处理长文本）
+    max_text_length = 512
+    
+    def __init__(
+        self,
+        cache_dir: str,
+        batch_max_size: int = 32,
+        batch_max_wait_ms: float = 5.0,
+        encode_workers: int = 1,
+        cache_memory_bytes: int = 64 * 1024 * 1024
+    ):
+        """
+        初始化缓存与微批处理器
+        
+        Args:
+            cache_dir: 缓存目录
+            batch_max_size: 微批处理每批最多的文本数
+            batch_max_wait_ms: 微批处理收集请求的最长等待毫秒数
+            encode_workers: 执行编码的专用线程数
+            cache_memory_bytes: 内存向量缓存的字节预算
+        """
+        # 初始化缓存
+        self.cache = EmbeddingCache(
+            cache_dir,
+            dimension=self._dimension,
+            memory_budget_bytes=cache_memory_bytes,
+            namespace=self.cache_namespace
+        )
+        
+        # 微批处理器：合并并发的单文本请求
+        self.batcher = MicroBatcher(
+            self._encode_batch,
+            max_batch_size=batch_max_size,
+            max_wait_ms=batch_max_wait_ms,
+            max_workers=encode_workers
+        )
+    
+    @property
+    def dimension(self) -> int:
+        """
+        获取向量维度
+        
+        Returns:
+            int: 向量维度
+        """
+        return self._dimension
+    
+    @property
+    def cache_namespace(self) -> str:
+        """
+        向量缓存命名空间
+        
+        Returns:
+            str: 由模型名称、版本、后端、预处理版本和维度组成的命名空间
+        """
+        return (
+            f"{self.model_name}@{self.revision or 'default'}{self.backend_tag}"
+            f"|preprocess={self.PREPROCESS_VERSION}|dim={self._dimension}"
+        )
+    
+    async def embed_text(self, text: str) -> np.ndarray:
+        """
+        向量化单个文本
+        
+        Args:
+            text: 要向量化的文本
+            
+        Returns:
+            np.ndarray: 向量表示
+        """
+        try:
+            # 检查缓存
+            cached_vector = await self.cache.get(text)
+            if cached_vector is not None:
+                return cached_vector
+            
+            # 与其他并发请求合并成批，在专用线程池中执行（避免阻塞事件循环）
+            vector = await self.batcher.submit(text)
+            
+            # 缓存结果
+            await self.cache.set(text, vector)
+            
+            return vector
+            
+        except Exception as e:
+            logger.error(f"文本向量化失败: {e}")
+            # 返回零向量作为降级方案
+            return np.zeros(self._dimension, dtype=np.float32)
+    
+    async def embed_batch(self, texts: List[str]) -> np.ndarray:
+        """
+        批量向量化文本
+        
+        Args:
+            texts: 要向量化的文本列表
+            
+        Returns:
+            np.ndarray: 向量矩阵，形状为 (len(texts), dimension)
+        """
+        try:
+            if not texts:
+                return np.empty((0, self._dimension), dtype=np.float32)
+            
+            # 检查缓存（未命中内存层的文本一次性在I/O线程中读取）
+            cached_vectors = []
+            uncached_texts = []
+            uncached_indices = []
+            
+            for i, (text, cached_vector) in enumerate(zip(texts, await self.cache.get_many(texts))):
+                if cached_vector is not None:
+                    cached_vectors.append((i, cached_vector))
+                else:
+                    uncached_texts.append(text)
+                    uncached_indices.append(i)
+            
+            # 向量化未缓存的文本
+            if uncached_texts:
+                uncached_vectors = await self.batcher.run(uncached_texts)
+                
+                # 缓存新向量
+                for text, vector in zip(uncached_texts, uncached_vectors):
+                    await self.cache.set(text, vector)
+            else:
+                uncached_vectors = []
+            
+            # 合并结果
+            result = np.zeros((len(texts), self._dimension), dtype=np.float32)
+            
+            # 填充缓存的向量
+            for i, vector in cached_vectors:
+                result[i] = vector
+            
+            # 填充新向量化的向量
+            for i, vector in zip(uncached_indices, uncached_vectors):
+                result[i] = vector
+            
+            return result
+            
+        except Exception as e:
+            logger.error(f"批量文本向量化失败: {e}")
+            # 返回零向量矩阵作为降级方案
+            return np.zeros((len(texts), self._dimension), dtype=np.float32)
+    
+    async def similarity(self, text1: str, text2: str) -> float:
+        """
+        计算两个文本的相似度
+        
+        Args:
+            text1: 第一个文本
+            text2: 第二个文本
+            
+        Returns:
+            float: 相似度分数 (0-1)
+        """
+        try:
+            # 一次批量向量化两个文本
+            vectors = normalize_rows(await self.embed_batch([text1, text2]))
+            
+            # 计算余弦相似度
+            return float(np.clip(vectors[0] @ vectors[1], -1.0, 1.0))
+            
+        except Exception as e:
+            logger.error(f"计算文本相似度失败: {e}")
+            return 0.0
+    
+    async def most_similar(
+        self, 
+        query_text: str, 
+        candidate_texts: List[str], 
+        top_k: int = 5
+    ) -> List[tuple]:
+        """
+        找到与查询文本最相似的候选文本
+        
+        Args:
+            query_text: 查询文本
+            candidate_texts: 候选文本列表
+            top_k: 返回前k个最相似的结果
+            
+        Returns:
+            List[tuple]: [(text, similarity_score), ...] 按相似度降序排列
+        """
+        try:
+            if not candidate_texts or top_k <= 0:
+                return []
+            
+            # 向量化查询文本与候选文本，归一化后一次矩阵-向量乘法得到所有余弦相似度
+            query_vector = normalize_rows(await self.embed_text(query_text))
+            candidate_vectors = normalize_rows(await self.embed_batch(candidate_texts))
+            scores = np.clip(candidate_vectors @ query_vector, -1.0, 1.0)
+            
+            # argpartition 取出top_k，只对这k个排序
+            top_k = min(top_k, len(candidate_texts))
+            top = np.argpartition(-scores, top_k - 1)[:top_k]
+            top = top[np.argsort(-scores[top], kind="stable")]
+            return [(candidate_texts[i], float(scores[i])) for i in top]
+            
+        except Exception as e:
+            logger.error(f"查找最相似文本失败: {e}")
+            return []
+    
+    @abstractmethod
+    def _encode_batch(self, texts: List[str]) -> np.ndarray:
+        """
+        批量编码文本（同步方法，在专用线程池中执行）
+        
+        Args:
+            texts: 输入文本列表
+            
+        Returns:
+            np.ndarray: float32向量矩阵
+        """
+        pass
+    
+    def _preprocess_text(self, text: str) -> str:
+        """
+        预处理文本
+        
+        Args:
+            text: 原始文本
+            
+        Returns:
+            str: 预处理后的文本
+        """
+        if not text or not isinstance(text, str):
+            return ""
+        
+        # 基本清理
+        text = text.strip()
+        
+        # 限制长度（避免过长文本影响性能）
+        if self.max_text_length is not None and len(text) > self.max_text_length:
+            text = text[:self.max_text_length]
+        
+        return text
+    
+    async def get_cache_stats(self) -> dict:
+        """
+        获取缓存统计信息
+        
+        Returns:
+            dict: 缓存统计信息（含微批处理的平均批大小）
+        """
+        stats = await self.cache.get_cache_stats()
+        stats["encode_batches"] = self.batcher.batches
+        stats["average_batch_size"] = self.batcher.average_batch_size
+        return stats
+    
+    async def close(self) -> None:
+        """
+        执行完等待中的批次后释放编码线程，并把缓存刷回磁盘
+        """
+        await self.batcher.close()
+        await self.cache.flush_pending()
+        self.cache.close()
+    
+    async def clear_cache(self) -> bool:
+        """
+        清空缓存
+        
+        Returns:
+            bool: 是否清空成功
+        """
+        return await self.cache.clear()
+    
+    async def warm_up_cache(self, texts: List[str]) -> int:
+        """
+        预热缓存
+        
+        Args:
+            texts: 要预加载的文本列表
+            
+        Returns:
+            int: 成功预加载的数量
+        """
+        return await self.cache.warm_up(texts)
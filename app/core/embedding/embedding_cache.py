@@ -2,16 +2,27 @@
 向量缓存
 
 实现向量化结果的缓存机制，提高性能
+
+磁盘缓存是单个内存映射文件（见 CacheArena）：文本摘要 -> 行号的哈希索引和
+float32 向量矩阵放在一起，读写不再为每条文本打开文件、也不再pickle，
+统计信息直接读取文件头计数器，预热只需映射一次文件。
+
+读写磁盘存储区（缺页、文件锁、淘汰）都在专用的单线程I/O执行器中进行，不阻塞事件循环；
+写入先进入写回缓冲区，攒够一批或等待片刻后一次加锁批量写入。
 """
 
-import json
 import logging
+import asyncio
 import hashlib
 import pickle
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from typing import Optional, Dict, Any, List
 import numpy as np
 
+from .cache_arena import CacheArena
+
 logger = logging.getLogger(__name__)
 
 
@@ -20,52 +31,88 @@ class EmbeddingCache:
     向量缓存类
     
     提供向量化结果的缓存功能，支持持久化存储
+    
+    内存层是按字节预算淘汰的LRU；返回的向量是只读数组，调用方需要修改时自行复制。
+    
+    缓存键包含命名空间（模型名称、版本、预处理版本、维度），切换模型不会读到旧模型的向量；
+    不同维度的向量分别存放在各自的存储区文件中。
+    
+    磁盘写入是写回式的：set 返回时向量已在内存层和写回缓冲区中可见，
+    磁盘写入由后台批量完成；close 前未写入的向量会被同步写入。
     """
     
-    def __init__(self, cache_dir: str, max_size: int = 10000):
+    ARENA_PATTERN = "embeddings-{dimension}.arena"
+    
+    def __init__(
+        self,
+        cache_dir: str,
+        max_size: int = 10000,
+        dimension: Optional[int] = None,
+        memory_budget_bytes: int = 64 * 1024 * 1024,
+        namespace: str = "",
+        write_batch_size: int = 64,
+        write_delay_ms: float = 50.0
+    ):
         """
         初始化向量缓存
         
         Args:
             cache_dir: 缓存目录路径
             max_size: 最大缓存条目数
+            dimension: 向量维度（为None时沿用已有缓存文件的维度，或在首次写入时确定）
+            memory_budget_bytes: 内存缓存的字节预算
+            namespace: 缓存键命名空间（为空时与旧版按文本MD5的键兼容）
+            write_batch_size: 写回缓冲区攒够多少条后立即写盘
+            write_delay_ms: 写回缓冲区最长等待毫秒数
         """
         self.cache_dir = Path(cache_dir)
         self.cache_dir.mkdir(parents=True, exist_ok=True)
         self.max_size = max_size
+        self.memory_budget_bytes = memory_budget_bytes
+        self.namespace = namespace
+        self.write_batch_size = max(write_batch_size, 1)
+        self.write_delay = write_delay_ms / 1000.0
         
-        # 内存缓存
-        self._memory_cache: Dict[str, np.ndarray] = {}
+        # 内存缓存（LRU：命中移到末尾，超出字节预算时从头部淘汰）
+        self._memory_cache: "OrderedDict[bytes, np.ndarray]" = OrderedDict()
+        self._memory_bytes = 0
         
-        # 缓存元数据
-        self._metadata_file = self.cache_dir / "cache_metadata.json"
-        self._metadata = self._load_metadata()
+        # 写回缓冲区（尚未写入磁盘的向量）与延迟写盘定时器
+        self._pending: Dict[bytes, np.ndarray] = {}
+        self._flush_handle: Optional[asyncio.TimerHandle] = None
+        self._flush_task: Optional[asyncio.Task] = None
+        
+        # 磁盘I/O执行器（单线程：存储区的读写在同一线程内串行进行）
+        self._io = ThreadPoolExecutor(max_workers=1, thread_name_prefix="embedding-cache-io")
+        
+        # 统计
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        
+        # 磁盘缓存存储区
+        self._arena: Optional[CacheArena] = None
+        if dimension is None:
+            dimension = self._latest_dimension()
+        if dimension is not None:
+            self._open_arena(dimension)
         
         logger.info(f"向量缓存初始化完成: 目录={cache_dir}, 最大大小={max_size}")
     
-    def _get_text_hash(self, text: str) -> str:
+    def _get_text_hash(self, text: str) -> bytes:
         """
-        生成文本的哈希值作为缓存键
+        生成文本的哈希值作为缓存键（带命名空间）
         
         Args:
             text: 输入文本
             
         Returns:
-            str: 文本哈希值
-        """
-        return hashlib.md5(text.encode('utf-8')).hexdigest()
-    
-    def _get_cache_file_path(self, text_hash: str) -> Path:
-        """
-        获取缓存文件路径
-        
-        Args:
-            text_hash: 文本哈希值
-            
-        Returns:
-            Path: 缓存文件路径
+            bytes: 16字节文本摘要
         """
-        return self.cache_dir / f"{text_hash}.pkl"
+        if self.namespace:
+            text = f"{self.namespace}\0{text}"
+        return hashlib.md5(text.encode('utf-8')).digest()
     
     async def get(self, text: str) -> Optional[np.ndarray]:
         """
@@ -75,40 +122,65 @@ class EmbeddingCache:
             text: 输入文本
             
         Returns:
-            Optional[np.ndarray]: 缓存的向量，如果不存在则返回None
+            Optional[np.ndarray]: 缓存的向量（只读），如果不存在则返回None
         """
         try:
             text_hash = self._get_text_hash(text)
             
-            # 首先检查内存缓存
-            if text_hash in self._memory_cache:
+            # 首先检查内存缓存和写回缓冲区
+            vector = self._lookup_memory(text_hash)
+            if vector is not None:
                 logger.debug(f"从内存缓存获取向量: {text[:50]}...")
-                return self._memory_cache[text_hash]
-            
-            # 检查磁盘缓存
-            cache_file = self._get_cache_file_path(text_hash)
-            if cache_file.exists():
-                with open(cache_file, 'rb') as f:
-                    vector = pickle.load(f)
-                
-                # 加载到内存缓存
-                self._memory_cache[text_hash] = vector
-                
-                # 更新访问时间
-                self._metadata[text_hash] = {
-                    "last_access": self._get_current_timestamp(),
-                    "access_count": self._metadata.get(text_hash, {}).get("access_count", 0) + 1
-                }
-                
-                logger.debug(f"从磁盘缓存获取向量: {text[:50]}...")
                 return vector
             
-            return None
+            # 在I/O线程中读取磁盘缓存（读取时更新访问时间）
+            vector = (await self._run_io(self._read_many, [text_hash]))[0]
+            if vector is None:
+                self.misses += 1
+                return None
+            
+            # 加载到内存缓存
+            self.disk_hits += 1
+            vector = self._remember(text_hash, vector)
+            
+            logger.debug(f"从磁盘缓存获取向量: {text[:50]}...")
+            return vector
             
         except Exception as e:
             logger.error(f"获取缓存向量失败: {e}")
             return None
     
+    async def get_many(self, texts: List[str]) -> List[Optional[np.ndarray]]:
+        """
+        批量从缓存中获取向量（未命中内存层的文本在I/O线程中一次读取）
+        
+        Args:
+            texts: 输入文本列表
+            
+        Returns:
+            List[Optional[np.ndarray]]: 与输入顺序一致的缓存向量（只读），不存在的为None
+        """
+        try:
+            hashes = [self._get_text_hash(text) for text in texts]
+            vectors = [self._lookup_memory(text_hash) for text_hash in hashes]
+            
+            missing = [i for i, vector in enumerate(vectors) if vector is None]
+            if not missing:
+                return vectors
+            
+            disk_vectors = await self._run_io(self._read_many, [hashes[i] for i in missing])
+            for i, vector in zip(missing, disk_vectors):
+                if vector is None:
+                    self.misses += 1
+                else:
+                    self.disk_hits += 1
+                    vectors[i] = self._remember(hashes[i], vector)
+            return vectors
+            
+        except Exception as e:
+            logger.error(f"批量获取缓存向量失败: {e}")
+            return [None] * len(texts)
+    
     async def set(self, text: str, vector: np.ndarray) -> bool:
         """
         将向量存储到缓存
@@ -122,24 +194,19 @@ class EmbeddingCache:
         """
         try:
             text_hash = self._get_text_hash(text)
+            vector = np.asarray(vector, dtype=np.float32)
             
-            # 存储到内存缓存
-            self._memory_cache[text_hash] = vector.copy()
-            
-            # 存储到磁盘缓存
-            cache_file = self._get_cache_file_path(text_hash)
-            with open(cache_file, 'wb') as f:
-                pickle.dump(vector, f)
-            
-            # 更新元数据
-            self._metadata[text_hash] = {
-                "last_access": self._get_current_timestamp(),
-                "access_count": 1,
-                "text_preview": text[:100]  # 保存文本预览用于调试
-            }
+            # 首次写入时在I/O线程中创建存储区
+            if self._arena is None:
+                await self._run_io(self._ensure_arena, vector.shape[-1])
+            if vector.shape[-1] != self._arena.dimension:
+                logger.error(f"向量维度与缓存不一致: 期望={self._arena.dimension}, 实际={vector.shape[-1]}")
+                return False
             
-            # 检查缓存大小，必要时清理
-            await self._cleanup_if_needed()
+            # 存储到内存缓存，并放入写回缓冲区（写满时存储区按访问时间淘汰）
+            vector = self._remember(text_hash, vector.copy())
+            self._pending[text_hash] = vector
+            self._schedule_flush()
             
             logger.debug(f"向量已缓存: {text[:50]}...")
             return True
@@ -156,16 +223,14 @@ class EmbeddingCache:
             bool: 是否清空成功
         """
         try:
-            # 清空内存缓存
+            # 清空内存缓存和写回缓冲区
             self._memory_cache.clear()
+            self._memory_bytes = 0
+            self._pending.clear()
             
             # 清空磁盘缓存
-            for cache_file in self.cache_dir.glob("*.pkl"):
-                cache_file.unlink()
-            
-            # 清空元数据
-            self._metadata.clear()
-            self._save_metadata()
+            if self._arena is not None:
+                await self._run_io(self._arena.clear)
             
             logger.info("向量缓存已清空")
             return True
@@ -176,31 +241,29 @@ class EmbeddingCache:
     
     async def get_cache_stats(self) -> Dict[str, Any]:
         """
-        获取缓存统计信息
+        获取缓存统计信息（直接读取存储区计数器，不扫描目录）
         
         Returns:
             Dict[str, Any]: 缓存统计信息
         """
         try:
-            memory_count = len(self._memory_cache)
-            disk_count = len(list(self.cache_dir.glob("*.pkl")))
+            disk_count = self._arena.count if self._arena is not None else 0
+            cache_size = self._arena.nbytes if self._arena is not None else 0
             
-            # 计算总访问次数
-            total_access = sum(
-                meta.get("access_count", 0) 
-                for meta in self._metadata.values()
-            )
-            
-            # 计算缓存大小
-            cache_size = sum(
-                f.stat().st_size 
-                for f in self.cache_dir.glob("*.pkl")
-            )
+            lookups = self.memory_hits + self.disk_hits + self.misses
             
             return {
-                "memory_cache_count": memory_count,
+                "memory_cache_count": len(self._memory_cache),
+                "memory_cache_bytes": self._memory_bytes,
+                "memory_budget_bytes": self.memory_budget_bytes,
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "pending_writes": len(self._pending),
+                "hit_ratio": (self.memory_hits + self.disk_hits) / lookups if lookups else 0.0,
                 "disk_cache_count": disk_count,
-                "total_access_count": total_access,
+                "total_access_count": self._arena.total_access if self._arena is not None else 0,
                 "cache_size_bytes": cache_size,
                 "cache_size_mb": cache_size / (1024 * 1024),
                 "max_size": self.max_size,
@@ -211,82 +274,237 @@ class EmbeddingCache:
             logger.error(f"获取缓存统计失败: {e}")
             return {}
     
-    def _load_metadata(self) -> Dict[str, Any]:
+    async def flush_pending(self) -> int:
         """
-        加载缓存元数据
+        把写回缓冲区中的向量批量写入磁盘缓存（在I/O线程中执行）
         
         Returns:
-            Dict[str, Any]: 元数据字典
+            int: 写入的条数
         """
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        
+        items = list(self._pending.items())
+        if not items or self._arena is None:
+            return 0
+        
         try:
-            if self._metadata_file.exists():
-                with open(self._metadata_file, 'r', encoding='utf-8') as f:
-                    return json.load(f)
-            return {}
+            await self._run_io(self._arena.put_many, items)
+            return len(items)
+            
         except Exception as e:
-            logger.error(f"加载缓存元数据失败: {e}")
-            return {}
+            logger.error(f"写回向量缓存失败: {e}")
+            return 0
+        
+        finally:
+            # 写入期间被再次更新的条目留待下一批
+            for text_hash, vector in items:
+                if self._pending.get(text_hash) is vector:
+                    del self._pending[text_hash]
+    
+    async def flush(self) -> None:
+        """
+        写入写回缓冲区，并把磁盘缓存的映射区刷回磁盘
+        """
+        await self.flush_pending()
+        if self._arena is not None:
+            await self._run_io(self._arena.flush)
     
-    def _save_metadata(self) -> bool:
+    def close(self) -> None:
         """
-        保存缓存元数据
+        写入写回缓冲区，刷盘并关闭磁盘缓存（同步方法，等待进行中的I/O完成）
+        """
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        self._io.shutdown(wait=True)
+        
+        if self._arena is not None:
+            if self._pending:
+                self._arena.put_many(list(self._pending.items()))
+                self._pending.clear()
+            self._arena.close()
+            self._arena = None
+    
+    async def _run_io(self, func, *args):
+        """
+        在专用I/O线程中执行阻塞的磁盘操作
         
+        Args:
+            func: 同步函数
+            args: 参数
+            
         Returns:
-            bool: 是否保存成功
+            函数的返回值
         """
-        try:
-            with open(self._metadata_file, 'w', encoding='utf-8') as f:
-                json.dump(self._metadata, f, ensure_ascii=False, indent=2)
-            return True
-        except Exception as e:
-            logger.error(f"保存缓存元数据失败: {e}")
-            return False
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._io, func, *args)
     
-    def _get_current_timestamp(self) -> float:
+    def _schedule_flush(self) -> None:
+        """
+        安排写回：缓冲区攒满时立即写盘，否则在等待时间后写盘
         """
-        获取当前时间戳
+        if self._flush_task is not None and not self._flush_task.done():
+            # 正在写盘，完成后由 _on_flushed 安排下一批
+            return
         
-        Returns:
-            float: 当前时间戳
+        if len(self._pending) >= self.write_batch_size:
+            self._start_flush()
+        elif self._flush_handle is None:
+            loop = asyncio.get_running_loop()
+            self._flush_handle = loop.call_later(self.write_delay, self._start_flush)
+    
+    def _start_flush(self) -> None:
+        """
+        启动后台写盘任务
         """
-        import time
-        return time.time()
+        self._flush_handle = None
+        self._flush_task = asyncio.ensure_future(self.flush_pending())
+        self._flush_task.add_done_callback(self._on_flushed)
     
-    async def _cleanup_if_needed(self) -> None:
+    def _on_flushed(self, task: asyncio.Task) -> None:
         """
-        在需要时清理缓存
+        写盘任务完成：写入期间又有新的向量时继续安排写回
+        
+        Args:
+            task: 完成的写盘任务
         """
-        try:
-            if len(self._metadata) <= self.max_size:
-                return
-            
-            # 按访问时间排序，删除最旧的条目
-            sorted_items = sorted(
-                self._metadata.items(),
-                key=lambda x: x[1].get("last_access", 0)
-            )
-            
-            # 删除最旧的条目
-            items_to_remove = len(self._metadata) - self.max_size + 100  # 多删除一些避免频繁清理
-            for text_hash, _ in sorted_items[:items_to_remove]:
-                # 删除磁盘文件
-                cache_file = self._get_cache_file_path(text_hash)
-                if cache_file.exists():
-                    cache_file.unlink()
-                
-                # 删除内存缓存
-                self._memory_cache.pop(text_hash, None)
-                
-                # 删除元数据
-                self._metadata.pop(text_hash, None)
+        if self._pending and self._arena is not None:
+            self._schedule_flush()
+    
+    def _ensure_arena(self, dimension: int) -> None:
+        """
+        打开磁盘缓存存储区（已打开时不做任何事；在I/O线程中调用）
+        
+        Args:
+            dimension: 向量维度
+        """
+        if self._arena is None:
+            self._open_arena(dimension)
+    
+    def _read_many(self, hashes: List[bytes]) -> List[Optional[np.ndarray]]:
+        """
+        从磁盘缓存读取多条向量（在I/O线程中调用）
+        
+        Args:
+            hashes: 文本摘要列表
             
-            # 保存更新后的元数据
-            self._save_metadata()
+        Returns:
+            List[Optional[np.ndarray]]: 向量，不存在的为None
+        """
+        if self._arena is None:
+            return [None] * len(hashes)
+        return [self._arena.read(text_hash) for text_hash in hashes]
+    
+    def _lookup_memory(self, text_hash: bytes) -> Optional[np.ndarray]:
+        """
+        在内存缓存和写回缓冲区中查找向量（命中时更新LRU顺序和统计）
+        
+        Args:
+            text_hash: 文本摘要
             
-            logger.info(f"缓存清理完成，删除了 {items_to_remove} 个条目")
+        Returns:
+            Optional[np.ndarray]: 只读向量，未命中时返回None
+        """
+        vector = self._memory_cache.get(text_hash)
+        if vector is not None:
+            self._memory_cache.move_to_end(text_hash)
+            self.memory_hits += 1
+            return vector
+        
+        # 已被挤出内存层但尚未写盘的向量（视同磁盘命中）
+        vector = self._pending.get(text_hash)
+        if vector is not None:
+            self.disk_hits += 1
+            return self._remember(text_hash, vector)
+        return None
+    
+    def _open_arena(self, dimension: int) -> None:
+        """
+        打开磁盘缓存存储区，并导入旧版逐条pickle缓存
+        
+        Args:
+            dimension: 向量维度
+        """
+        arena_path = self.cache_dir / self.ARENA_PATTERN.format(dimension=dimension)
+        self._arena = CacheArena(str(arena_path), self.max_size, dimension)
+        self._migrate_legacy()
+    
+    def _latest_dimension(self) -> Optional[int]:
+        """
+        取最近使用的存储区文件的维度
+        
+        Returns:
+            Optional[int]: 维度，没有可用文件时返回None
+        """
+        arena_files = sorted(
+            self.cache_dir.glob(self.ARENA_PATTERN.format(dimension="*")),
+            key=lambda path: path.stat().st_mtime,
+            reverse=True
+        )
+        for arena_file in arena_files:
+            dimension = CacheArena.read_dimension(str(arena_file))
+            if dimension is not None:
+                return dimension
+        return None
+    
+    def _migrate_legacy(self) -> None:
+        """
+        把旧版的 {md5}.pkl 逐条缓存导入存储区，然后删除旧文件
+        
+        旧版键是不带命名空间的文本MD5、且不知道出自哪个模型，设置了命名空间时直接丢弃。
+        """
+        legacy_files = list(self.cache_dir.glob("*.pkl"))
+        if not legacy_files:
+            return
+        
+        migrated = 0
+        for cache_file in legacy_files:
+            if not self.namespace:
+                try:
+                    with open(cache_file, 'rb') as f:
+                        vector = np.asarray(pickle.load(f), dtype=np.float32)
+                    if vector.shape[-1] == self._arena.dimension:
+                        self._arena.put(bytes.fromhex(cache_file.stem), vector)
+                        migrated += 1
+                except Exception as e:
+                    logger.warning(f"跳过无法导入的旧缓存文件 {cache_file.name}: {e}")
+            cache_file.unlink()
+        
+        legacy_metadata = self.cache_dir / "cache_metadata.json"
+        if legacy_metadata.exists():
+            legacy_metadata.unlink()
+        
+        logger.info(f"已导入旧版缓存 {migrated}/{len(legacy_files)} 条")
+    
+    def _remember(self, text_hash: bytes, vector: np.ndarray) -> np.ndarray:
+        """
+        放入内存缓存（设为只读），超出字节预算时淘汰最久未使用的条目
+        
+        Args:
+            text_hash: 文本摘要
+            vector: 向量（缓存接管该数组）
             
-        except Exception as e:
-            logger.error(f"缓存清理失败: {e}")
+        Returns:
+            np.ndarray: 只读向量
+        """
+        vector.setflags(write=False)
+        previous = self._memory_cache.pop(text_hash, None)
+        if previous is not None:
+            self._memory_bytes -= previous.nbytes
+        
+        # 单条超过预算的向量不进入内存层
+        if vector.nbytes > self.memory_budget_bytes:
+            return vector
+        
+        self._memory_cache[text_hash] = vector
+        self._memory_bytes += vector.nbytes
+        while self._memory_bytes > self.memory_budget_bytes:
+            _, evicted = self._memory_cache.popitem(last=False)
+            self._memory_bytes -= evicted.nbytes
+            self.evictions += 1
+        return vector
     
     async def warm_up(self, texts: List[str]) -> int:
         """
@@ -299,10 +517,8 @@ class EmbeddingCache:
             int: 成功预加载的数量
         """
         try:
-            loaded_count = 0
-            for text in texts:
-                if await self.get(text) is not None:
-                    loaded_count += 1
+            vectors = await self.get_many(texts)
+            loaded_count = sum(1 for vector in vectors if vector is not None)
             
             logger.info(f"缓存预热完成，预加载了 {loaded_count}/{len(texts)} 个向量")
             return loaded_count
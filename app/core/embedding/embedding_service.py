@@ -12,6 +12,21 @@ import numpy as np
 logger = logging.getLogger(__name__)
 
 
+def normalize_rows(vectors: np.ndarray) -> np.ndarray:
+    """
+    按行归一化为单位向量（零向量保持为零）
+    
+    Args:
+        vectors: 向量或向量矩阵
+        
+    Returns:
+        np.ndarray: 归一化后的float32副本
+    """
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return np.divide(vectors, norms, out=np.zeros_like(vectors), where=norms > 0)
+
+
 class EmbeddingService(ABC):
     """
     向量化服务抽象基类
@@ -89,3 +104,21 @@ class EmbeddingService(ABC):
             List[tuple]: [(text, similarity_score), ...] 按相似度降序排列
         """
         pass
+    
+    async def similarity_matrix(self, texts_a: List[str], texts_b: List[str]) -> np.ndarray:
+        """
+        计算两组文本两两之间的余弦相似度（各批量向量化一次，一次矩阵乘法）
+        
+        Args:
+            texts_a: 第一组文本
+            texts_b: 第二组文本
+            
+        Returns:
+            np.ndarray: 形状为 (len(texts_a), len(texts_b)) 的相似度矩阵
+        """
+        if not texts_a or not texts_b:
+            return np.zeros((len(texts_a), len(texts_b)), dtype=np.float32)
+        
+        vectors_a = normalize_rows(await self.embed_batch(texts_a))
+        vectors_b = normalize_rows(await self.embed_batch(texts_b))
+        return np.clip(vectors_a @ vectors_b.T, -1.0, 1.0)
@@ -0,0 +1,75 @@
+"""
+文件名: factory.py
+功能: 向量化服务工厂，根据配置创建向量化服务
+"""
+
+from app.core.embedding.cached_embedding import CachedEmbeddingService
+from app.utils.config import config
+from app.utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+# 支持的向量化后端
+BACKENDS = ("sentence_transformer", "onnx", "process_pool")
+
+
+def create_embedding_service() -> CachedEmbeddingService:
+    """
+    创建向量化服务（工厂函数）
+
+    从配置文件的 embedding 段读取后端、模型、缓存、微批处理和后端专属参数。
+
+    返回:
+        CachedEmbeddingService: 向量化服务实例
+
+    示例:
+        >>> embedding_service = create_embedding_service()
+    """
+    embedding_config = config.get("embedding", {}) or {}
+    backend = embedding_config.get("backend", "sentence_transformer")
+    if backend not in BACKENDS:
+        raise ValueError(f"不支持的向量化后端: {backend}")
+
+    common = {
+        "model_name": embedding_config.get("model_name", "paraphrase-multilingual-MiniLM-L12-v2"),
+        "cache_dir": embedding_config.get("cache_dir", "./data/cache/embeddings"),
+        "batch_max_size": embedding_config.get("batch_max_size", 32),
+        "batch_max_wait_ms": embedding_config.get("batch_max_wait_ms", 5.0),
+        "cache_memory_bytes": embedding_config.get("cache_memory_mb", 64) * 1024 * 1024,
+        "revision": embedding_config.get("revision")
+    }
+
+    if backend == "onnx":
+        from app.core.embedding.onnx_embedding import OnnxEmbedding
+
+        service = OnnxEmbedding(
+            model_dir=embedding_config.get("onnx_model_dir", "./data/models/onnx"),
+            quantize=embedding_config.get("onnx_quantize", True),
+            intra_op_threads=embedding_config.get("onnx_threads", 0),
+            bucket_size=embedding_config.get("onnx_bucket_size", 16),
+            encode_workers=embedding_config.get("encode_workers", 1),
+            **common
+        )
+    elif backend == "process_pool":
+        from app.core.embedding.process_pool_embedding import ProcessPoolEmbedding
+
+        service = ProcessPoolEmbedding(
+            device=embedding_config.get("device", "cpu"),
+            processes=embedding_config.get("processes", 2),
+            threads_per_process=embedding_config.get("threads_per_process", 1),
+            **common
+        )
+    else:
+        from app.core.embedding.sentence_transformer import SentenceTransformerEmbedding
+
+        service = SentenceTransformerEmbedding(
+            device=embedding_config.get("device", "cpu"),
+            encode_workers=embedding_config.get("encode_workers", 1),
+            bucket_size=embedding_config.get("bucket_size", 16),
+            token_budget=embedding_config.get("token_budget", 8192),
+            chunk_long_texts=embedding_config.get("chunk_long_texts", False),
+            **common
+        )
+
+    logger.info(f"向量化服务已创建: 后端={backend}, 维度={service.dimension}")
+    return service
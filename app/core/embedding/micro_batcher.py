@@ -0,0 +1,150 @@
+"""
+向量化微批处理器
+
+把并发的单文本向量化请求合并成批：收集最多 max_wait_ms 毫秒或 max_batch_size 条请求后，
+在专用的有界线程池中执行一次批量编码，再把结果分发给各个调用方。
+CPU上一次前向计算处理一批文本的开销远小于逐条计算之和。
+"""
+
+import logging
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Set, Tuple
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+class MicroBatcher:
+    """
+    向量化微批处理器
+
+    同一批中相同的文本只编码一次；批量编码失败时，该批所有调用方收到同一个异常。
+    """
+
+    def __init__(
+        self,
+        encode_batch: Callable[[List[str]], np.ndarray],
+        max_batch_size: int = 32,
+        max_wait_ms: float = 5.0,
+        max_workers: int = 1
+    ):
+        """
+        初始化微批处理器
+
+        Args:
+            encode_batch: 同步的批量编码函数，输入文本列表，返回 (n, dimension) 矩阵
+            max_batch_size: 每批最多的文本数，攒满立即执行
+            max_wait_ms: 第一条请求到达后最多等待的毫秒数
+            max_workers: 执行编码的专用线程数（限制模型的并发前向计算）
+        """
+        self.encode_batch = encode_batch
+        self.max_batch_size = max(max_batch_size, 1)
+        self.max_wait = max(max_wait_ms, 0.0) / 1000
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="embedding")
+
+        # 等待组批的请求及其超时句柄
+        self._pending: List[Tuple[str, asyncio.Future]] = []
+        self._flush_handle: Optional[asyncio.TimerHandle] = None
+
+        # 正在执行的批次任务（持有引用，避免任务被回收）
+        self._tasks: Set[asyncio.Task] = set()
+
+        # 统计
+        self.batches = 0
+        self.items = 0
+
+    @property
+    def average_batch_size(self) -> float:
+        """
+        平均每批的文本数
+
+        Returns:
+            float: 平均批大小
+        """
+        return self.items / self.batches if self.batches else 0.0
+
+    async def submit(self, text: str) -> np.ndarray:
+        """
+        提交一条文本，等待所在批次编码完成
+
+        Args:
+            text: 输入文本
+
+        Returns:
+            np.ndarray: 向量表示
+        """
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((text, future))
+
+        if len(self._pending) >= self.max_batch_size:
+            self._flush()
+        elif self._flush_handle is None:
+            self._flush_handle = loop.call_later(self.max_wait, self._flush)
+
+        return await future
+
+    async def run(self, texts: List[str]) -> np.ndarray:
+        """
+        直接在专用线程池中编码一批文本（不参与组批）
+
+        Args:
+            texts: 输入文本列表
+
+        Returns:
+            np.ndarray: 向量矩阵
+        """
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, self.encode_batch, texts)
+
+    def _flush(self) -> None:
+        """
+        把当前等待的请求作为一批提交执行
+        """
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+
+        batch, self._pending = self._pending, []
+        if batch:
+            task = asyncio.ensure_future(self._run_batch(batch))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _run_batch(self, batch: List[Tuple[str, asyncio.Future]]) -> None:
+        """
+        编码一批文本并分发结果
+
+        Args:
+            batch: (文本, 调用方Future) 列表
+        """
+        # 相同文本只编码一次
+        rows: Dict[str, int] = {}
+        for text, _ in batch:
+            rows.setdefault(text, len(rows))
+
+        try:
+            vectors = await self.run(list(rows))
+        except Exception as e:
+            logger.error(f"批量向量化失败: {e}")
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        self.batches += 1
+        self.items += len(batch)
+        for text, future in batch:
+            # 调用方可能已取消等待
+            if not future.done():
+                future.set_result(vectors[rows[text]].copy())
+
+    async def close(self) -> None:
+        """
+        执行完等待中的批次后关闭专用线程池
+        """
+        self._flush()
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+        self.executor.shutdown(wait=False)
@@ -0,0 +1,241 @@
+"""
+ONNX Runtime向量化实现
+
+在纯CPU节点上用 ONNX Runtime 运行与 SentenceTransformerEmbedding 相同的模型，
+默认对权重做动态int8量化。首次使用时从 Hugging Face 模型导出ONNX文件并量化，
+之后只依赖 onnxruntime 和 tokenizers，不再加载 PyTorch。
+"""
+
+import logging
+from pathlib import Path
+from typing import List, Optional
+import numpy as np
+
+try:
+    import onnxruntime
+except ImportError:
+    onnxruntime = None
+
+try:
+    from tokenizers import Tokenizer
+except ImportError:
+    Tokenizer = None
+
+from .cached_embedding import CachedEmbeddingService, bucket_by_length
+
+logger = logging.getLogger(__name__)
+
+# 未带组织名的模型名称默认属于 sentence-transformers 组织（与 SentenceTransformer 一致）
+DEFAULT_ORGANIZATION = "sentence-transformers"
+
+
+def mean_pooling(hidden_states: np.ndarray, attention_mask: np.ndarray) -> np.ndarray:
+    """
+    按注意力掩码对词元向量取平均（与 sentence-transformers 的 mean pooling 一致）
+
+    Args:
+        hidden_states: (batch, seq, dimension) 词元向量
+        attention_mask: (batch, seq) 注意力掩码
+
+    Returns:
+        np.ndarray: (batch, dimension) 句向量
+    """
+    mask = attention_mask[..., None].astype(np.float32)
+    summed = (hidden_states * mask).sum(axis=1)
+    counts = np.clip(mask.sum(axis=1), 1e-9, None)
+    return (summed / counts).astype(np.float32)
+
+
+class OnnxEmbedding(CachedEmbeddingService):
+    """
+    基于ONNX Runtime的向量化实现
+
+    可直接替换 SentenceTransformerEmbedding：同样的模型、平均池化和预处理。
+    量化后的向量与原模型略有差异，缓存使用独立的命名空间。
+    """
+
+    def __init__(
+        self,
+        model_name: str = "paraphrase-multilingual-MiniLM-L12-v2",
+        cache_dir: str = "./data/cache/embeddings",
+        model_dir: str = "./data/models/onnx",
+        quantize: bool = True,
+        intra_op_threads: int = 0,
+        bucket_size: int = 16,
+        max_seq_length: int = 128,
+        batch_max_size: int = 32,
+        batch_max_wait_ms: float = 5.0,
+        encode_workers: int = 1,
+        cache_memory_bytes: int = 64 * 1024 * 1024,
+        revision: Optional[str] = None
+    ):
+        """
+        初始化ONNX向量化服务
+
+        Args:
+            model_name: 模型名称
+            cache_dir: 缓存目录
+            model_dir: 导出的ONNX模型目录
+            quantize: 是否使用动态int8量化的模型
+            intra_op_threads: 单次推理的算子内线程数（0表示由ONNX Runtime决定）
+            bucket_size: 按词元长度分桶的桶宽度
+            max_seq_length: 最大序列长度（超出部分截断）
+            batch_max_size: 微批处理每批最多的文本数
+            batch_max_wait_ms: 微批处理收集请求的最长等待毫秒数
+            encode_workers: 执行编码的专用线程数
+            cache_memory_bytes: 内存向量缓存的字节预算
+            revision: 模型版本（Hugging Face 分支、标签或提交，None表示默认版本）
+        """
+        if onnxruntime is None or Tokenizer is None:
+            raise ImportError(
+                "onnxruntime或tokenizers库未安装。请运行: pip install onnxruntime tokenizers"
+            )
+
+        self.model_name = model_name
+        self.revision = revision
+        self.quantize = quantize
+        self.bucket_size = max(bucket_size, 1)
+        self.max_seq_length = max_seq_length
+        self.backend_tag = "|onnx-int8" if quantize else "|onnx"
+
+        # 初始化模型
+        try:
+            model_path = self._prepare_model(Path(model_dir))
+            self.tokenizer = Tokenizer.from_file(str(model_path.parent / "tokenizer.json"))
+            self.tokenizer.no_padding()
+            self.tokenizer.enable_truncation(max_length=max_seq_length)
+            self._pad_id = next(
+                (token_id for token_id in map(self.tokenizer.token_to_id, ("<pad>", "[PAD]"))
+                 if token_id is not None),
+                0
+            )
+
+            options = onnxruntime.SessionOptions()
+            options.intra_op_num_threads = intra_op_threads
+            options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+            self.session = onnxruntime.InferenceSession(
+                str(model_path), options, providers=["CPUExecutionProvider"]
+            )
+            self._input_names = {node.name for node in self.session.get_inputs()}
+            self._dimension = int(self.session.get_outputs()[0].shape[-1])
+        except Exception as e:
+            logger.error(f"加载ONNX模型失败: {e}")
+            raise
+
+        # 初始化缓存与微批处理器
+        super().__init__(
+            cache_dir,
+            batch_max_size=batch_max_size,
+            batch_max_wait_ms=batch_max_wait_ms,
+            encode_workers=encode_workers,
+            cache_memory_bytes=cache_memory_bytes
+        )
+
+        logger.info(
+            f"ONNX向量化服务初始化完成: 模型={model_name}, 维度={self._dimension}, "
+            f"量化={quantize}, 线程={intra_op_threads or '自动'}"
+        )
+
+    def _encode_batch(self, texts: List[str]) -> np.ndarray:
+        """
+        批量编码文本（同步方法）：按词元长度分桶，每桶填充到相同长度后推理一次
+
+        Args:
+            texts: 输入文本列表
+
+        Returns:
+            np.ndarray: 向量矩阵
+        """
+        try:
+            encodings = self.tokenizer.encode_batch([self._preprocess_text(text) for text in texts])
+            result = np.zeros((len(texts), self._dimension), dtype=np.float32)
+
+            buckets = bucket_by_length(
+                [len(encoding.ids) for encoding in encodings], self.bucket_size, self.max_seq_length
+            )
+            for padded_length, indices in buckets.items():
+                input_ids = np.full((len(indices), padded_length), self._pad_id, dtype=np.int64)
+                attention_mask = np.zeros((len(indices), padded_length), dtype=np.int64)
+                for row, i in enumerate(indices):
+                    ids = encodings[i].ids
+                    input_ids[row, :len(ids)] = ids
+                    attention_mask[row, :len(ids)] = 1
+
+                feeds = {"input_ids": input_ids, "attention_mask": attention_mask}
+                if "token_type_ids" in self._input_names:
+                    feeds["token_type_ids"] = np.zeros_like(input_ids)
+                hidden_states = self.session.run(None, feeds)[0]
+                result[indices] = mean_pooling(hidden_states, attention_mask)
+
+            return result
+
+        except Exception as e:
+            logger.error(f"批量文本编码失败: {e}")
+            return np.zeros((len(texts), self._dimension), dtype=np.float32)
+
+    def _prepare_model(self, model_dir: Path) -> Path:
+        """
+        准备ONNX模型文件：不存在时从 Hugging Face 模型导出，需要时做动态int8量化
+
+        Args:
+            model_dir: 模型根目录
+
+        Returns:
+            Path: 要加载的ONNX文件路径
+        """
+        target_dir = model_dir / f"{self.model_name.replace('/', '--')}@{self.revision or 'default'}"
+        fp32_path = target_dir / "model.onnx"
+        int8_path = target_dir / "model.int8.onnx"
+
+        if not fp32_path.exists() or not (target_dir / "tokenizer.json").exists():
+            self._export(target_dir, fp32_path)
+
+        if not self.quantize:
+            return fp32_path
+
+        if not int8_path.exists():
+            from onnxruntime.quantization import QuantType, quantize_dynamic
+
+            logger.info(f"对ONNX模型做动态int8量化: {int8_path}")
+            quantize_dynamic(str(fp32_path), str(int8_path), weight_type=QuantType.QInt8)
+        return int8_path
+
+    def _export(self, target_dir: Path, fp32_path: Path) -> None:
+        """
+        从 Hugging Face 模型导出ONNX文件和分词器（仅首次需要 torch 和 transformers）
+
+        Args:
+            target_dir: 导出目录
+            fp32_path: ONNX文件路径
+        """
+        try:
+            import torch
+            from transformers import AutoModel, AutoTokenizer
+        except ImportError:
+            raise ImportError(
+                "导出ONNX模型需要torch和transformers库。请运行: pip install torch transformers"
+            )
+
+        model_id = self.model_name if "/" in self.model_name else f"{DEFAULT_ORGANIZATION}/{self.model_name}"
+        logger.info(f"导出ONNX模型: {model_id} -> {fp32_path}")
+
+        tokenizer = AutoTokenizer.from_pretrained(model_id, revision=self.revision)
+        model = AutoModel.from_pretrained(model_id, revision=self.revision).eval()
+
+        sample = tokenizer(["导出示例", "export sample"], padding=True, return_tensors="pt")
+        input_names = [name for name in ("input_ids", "attention_mask", "token_type_ids") if name in sample]
+        dynamic_axes = {name: {0: "batch", 1: "sequence"} for name in input_names}
+        dynamic_axes["last_hidden_state"] = {0: "batch", 1: "sequence"}
+
+        target_dir.mkdir(parents=True, exist_ok=True)
+        with torch.no_grad():
+            torch.onnx.export(
+                model,
+                tuple(sample[name] for name in input_names),
+                str(fp32_path),
+                input_names=input_names,
+                output_names=["last_hidden_state"],
+                dynamic_axes=dynamic_axes,
+                opset_version=14
+            )
+        tokenizer.save_pretrained(str(target_dir))
@@ -0,0 +1,224 @@
+"""
+进程池向量化实现
+
+模型运行在独立的工作进程中，分词和前后处理不再与 FastAPI 事件循环争用GIL。
+结果通过共享内存回传：父进程分配 (n, dimension) 的共享缓冲区，
+各工作进程把自己那部分行直接写入，不经过管道pickle。
+"""
+
+import logging
+import importlib.util
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing.shared_memory import SharedMemory
+from typing import Any, Callable, List, Optional
+import numpy as np
+
+from .cached_embedding import CachedEmbeddingService
+
+logger = logging.getLogger(__name__)
+
+# 拆分到多个工作进程时每份的最少文本数
+MIN_ROWS_PER_TASK = 8
+
+# 工作进程内的模型（由 _init_worker 加载）
+_worker_model = None
+
+
+def load_sentence_transformer(
+    model_name: str,
+    device: str,
+    revision: Optional[str],
+    threads: int
+) -> Any:
+    """
+    在工作进程中加载SentenceTransformer模型
+
+    Args:
+        model_name: 模型名称
+        device: 计算设备
+        revision: 模型版本
+        threads: 每个进程的PyTorch线程数
+
+    Returns:
+        Any: 模型
+    """
+    import torch
+    from sentence_transformers import SentenceTransformer
+
+    torch.set_num_threads(threads)
+    model_kwargs = {"revision": revision} if revision else {}
+    return SentenceTransformer(model_name, device=device, **model_kwargs)
+
+
+def _init_worker(model_loader: Callable[..., Any], *loader_args: Any) -> None:
+    """
+    工作进程初始化：加载一次模型
+
+    Args:
+        model_loader: 模型加载函数（需可pickle）
+        loader_args: 加载函数的参数
+    """
+    global _worker_model
+    _worker_model = model_loader(*loader_args)
+
+
+def _worker_dimension() -> int:
+    """
+    查询工作进程中模型的向量维度
+
+    Returns:
+        int: 向量维度
+    """
+    return int(_worker_model.get_sentence_embedding_dimension())
+
+
+def _worker_encode(texts: List[str], shm_name: str, row_offset: int, total_rows: int) -> None:
+    """
+    在工作进程中编码文本，结果写入共享缓冲区的对应行
+
+    Args:
+        texts: 预处理后的文本
+        shm_name: 共享内存名称
+        row_offset: 写入的起始行
+        total_rows: 共享缓冲区的总行数
+    """
+    # 工作进程与父进程共用资源跟踪器，共享内存由父进程负责删除
+    shm = SharedMemory(name=shm_name)
+    try:
+        vectors = _worker_model.encode(texts, convert_to_numpy=True)
+        output = np.ndarray(
+            (total_rows, vectors.shape[1]), dtype=np.float32, buffer=shm.buf
+        )
+        output[row_offset:row_offset + len(texts)] = vectors
+        del output
+    finally:
+        shm.close()
+
+
+class ProcessPoolEmbedding(CachedEmbeddingService):
+    """
+    基于进程池的向量化实现
+
+    每个工作进程各自加载一份模型；一批文本按进程数拆分后并行编码。
+    缓存与微批处理在父进程中进行，与 SentenceTransformerEmbedding 共用缓存命名空间。
+    """
+
+    def __init__(
+        self,
+        model_name: str = "paraphrase-multilingual-MiniLM-L12-v2",
+        cache_dir: str = "./data/cache/embeddings",
+        device: str = "cpu",
+        processes: int = 2,
+        threads_per_process: int = 1,
+        batch_max_size: int = 32,
+        batch_max_wait_ms: float = 5.0,
+        cache_memory_bytes: int = 64 * 1024 * 1024,
+        revision: Optional[str] = None,
+        model_loader: Optional[Callable[..., Any]] = None
+    ):
+        """
+        初始化进程池向量化服务
+
+        Args:
+            model_name: 模型名称
+            cache_dir: 缓存目录
+            device: 计算设备 (cpu/cuda)
+            processes: 工作进程数
+            threads_per_process: 每个工作进程的PyTorch线程数
+            batch_max_size: 微批处理每批最多的文本数
+            batch_max_wait_ms: 微批处理收集请求的最长等待毫秒数
+            cache_memory_bytes: 内存向量缓存的字节预算
+            revision: 模型版本（Hugging Face 分支、标签或提交，None表示默认版本）
+            model_loader: 工作进程中的模型加载函数（默认加载SentenceTransformer，需可pickle）
+        """
+        if model_loader is None and importlib.util.find_spec("sentence_transformers") is None:
+            raise ImportError(
+                "sentence-transformers库未安装。请运行: pip install sentence-transformers"
+            )
+
+        self.model_name = model_name
+        self.revision = revision
+        self.processes = max(processes, 1)
+
+        # 启动工作进程（spawn：避免fork后继承父进程的线程与模型状态）；
+        # 同时提交与进程数相同的探测任务，让所有进程立即启动并加载模型
+        try:
+            self.pool = ProcessPoolExecutor(
+                max_workers=self.processes,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_worker,
+                initargs=(
+                    model_loader or load_sentence_transformer,
+                    model_name,
+                    device,
+                    revision,
+                    threads_per_process
+                )
+            )
+            probes = [self.pool.submit(_worker_dimension) for _ in range(self.processes)]
+            self._dimension = [probe.result() for probe in probes][0]
+        except Exception as e:
+            logger.error(f"启动向量化工作进程失败: {e}")
+            raise
+
+        # 初始化缓存与微批处理器（每个工作进程对应一个等待线程）
+        super().__init__(
+            cache_dir,
+            batch_max_size=batch_max_size,
+            batch_max_wait_ms=batch_max_wait_ms,
+            encode_workers=self.processes,
+            cache_memory_bytes=cache_memory_bytes
+        )
+
+        logger.info(
+            f"进程池向量化服务初始化完成: 模型={model_name}, 维度={self._dimension}, 进程数={self.processes}"
+        )
+
+    def _encode_batch(self, texts: List[str]) -> np.ndarray:
+        """
+        批量编码文本（同步方法）：拆分到各工作进程，结果写入同一块共享内存
+
+        Args:
+            texts: 输入文本列表
+
+        Returns:
+            np.ndarray: 向量矩阵
+        """
+        if not texts:
+            return np.empty((0, self._dimension), dtype=np.float32)
+
+        shm = None
+        try:
+            processed = [self._preprocess_text(text) for text in texts]
+            shm = SharedMemory(create=True, size=len(texts) * self._dimension * 4)
+
+            chunk = max(MIN_ROWS_PER_TASK, -(-len(texts) // self.processes))
+            futures = [
+                self.pool.submit(_worker_encode, processed[start:start + chunk], shm.name, start, len(texts))
+                for start in range(0, len(texts), chunk)
+            ]
+            for future in futures:
+                future.result()
+
+            # 复制出共享内存后即可释放缓冲区
+            shared = np.ndarray((len(texts), self._dimension), dtype=np.float32, buffer=shm.buf)
+            result = shared.copy()
+            del shared
+            return result
+
+        except Exception as e:
+            logger.error(f"批量文本编码失败: {e}")
+            return np.zeros((len(texts), self._dimension), dtype=np.float32)
+
+        finally:
+            if shm is not None:
+                shm.close()
+                shm.unlink()
+
+    async def close(self) -> None:
+        """
+        执行完等待中的批次后关闭工作进程
+        """
+        await super().close()
+        self.pool.shutdown(wait=False, cancel_futures=True)
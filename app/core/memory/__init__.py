@@ -14,6 +14,8 @@
 - ImportanceScorer: 重要性评分器
 - MemoryCompressor: 记忆压缩器
 - ForgettingMechanism: 遗忘机制
+- BM25Index: 记忆关键词倒排索引
+- MemoryIngestionQueue: 记忆后台写入队列
 """
 
 from .memory_manager import MemoryManager
@@ -21,11 +23,15 @@ from .memory_classifier import MemoryClassifier
 from .importance_scorer import ImportanceScorer
 from .memory_compressor import MemoryCompressor
 from .forgetting_mechanism import ForgettingMechanism
+from .keyword_index import BM25Index
+from .ingestion_queue import MemoryIngestionQueue
 
 __all__ = [
     "MemoryManager",
     "MemoryClassifier", 
     "ImportanceScorer",
     "MemoryCompressor",
-    "ForgettingMechanism"
+    "ForgettingMechanism",
+    "BM25Index",
+    "MemoryIngestionQueue"
 ]
\ No newline at end of file
@@ -4,6 +4,7 @@
 实现结合向量检索、关键词检索、时间过滤和重要性排序的混合检索策略
 """
 
+import asyncio
 import logging
 import re
 from typing import Dict, List, Optional, Any, Tuple
@@ -14,21 +15,59 @@ from app.models.memory import MemoryStore
 logger = logging.getLogger(__name__)
 
 
+def reciprocal_rank_fusion(
+    rankings: List[List[int]],
+    weights: List[float],
+    k: int = 60
+) -> Dict[int, float]:
+    """
+    加权倒数排名融合（RRF）：每个排名列表贡献 weight / (k + rank)，rank 从1开始
+    
+    Args:
+        rankings: 各检索器按相关度降序的ID列表
+        weights: 各检索器的权重
+        k: 平滑常数（越大越削弱头部排名的优势）
+        
+    Returns:
+        Dict[int, float]: ID -> 融合分数
+    """
+    fused: Dict[int, float] = {}
+    for ranking, weight in zip(rankings, weights):
+        for rank, item_id in enumerate(ranking, start=1):
+            fused[item_id] = fused.get(item_id, 0.0) + weight / (k + rank)
+    return fused
+
+
 class HybridRetriever:
     """
     混合检索器
     
     结合多种检索策略：
     - 向量检索（语义相似度）
-    - 关键词检索（精确匹配）
+    - 关键词检索（提供BM25索引时按BM25打分，否则在数据库中匹配）
     - 时间过滤（最近优先）
     - 重要性排序（高分优先）
+    
+    混合检索并发执行向量检索和关键词检索，用加权RRF融合两者的排名，
+    再叠加记忆自身的综合分数（重要性、时间、访问、长度、类型）；
+    所有候选记忆用一次 WHERE id IN (...) 查询取回。
     """
     
+    # 关键词检索从数据库取 limit 的多少倍候选再按匹配分数排序
+    KEYWORD_CANDIDATE_FACTOR = 4
+    
+    # 混合检索中每个检索器取 limit 的多少倍候选参与融合
+    HYBRID_CANDIDATE_FACTOR = 2
+    
     def __init__(
         self,
         vector_store=None,
-        memory_dao=None
+        memory_dao=None,
+        keyword_index=None,
+        vector_weight: float = 1.0,
+        keyword_weight: float = 1.0,
+        prior_weight: float = 0.5,
+        rrf_k: int = 60
     ):
         """
         初始化混合检索器
@@ -36,9 +75,19 @@ class HybridRetriever:
         Args:
             vector_store: 向量存储实例
             memory_dao: 记忆DAO实例
+            keyword_index: BM25关键词索引实例（可选）
+            vector_weight: 向量检索排名在RRF中的权重
+            keyword_weight: 关键词检索排名在RRF中的权重
+            prior_weight: 记忆综合分数的权重（按排名第一的RRF贡献折算）
+            rrf_k: RRF平滑常数
         """
         self.vector_store = vector_store
         self.memory_dao = memory_dao
+        self.keyword_index = keyword_index
+        self.vector_weight = vector_weight
+        self.keyword_weight = keyword_weight
+        self.prior_weight = prior_weight
+        self.rrf_k = rrf_k
         
         logger.info("混合检索器初始化完成")
     
@@ -94,38 +143,14 @@ class HybridRetriever:
             memory_types: 记忆类型过滤
             
         Returns:
-            List[MemoryStore]: 检索结果
+            List[MemoryStore]: 检索结果，按相似度降序
         """
-        try:
-            if not self.vector_store:
-                logger.warning("向量存储不可用，降级到关键词检索")
-                return await self._keyword_retrieve(query, conversation_id, limit, memory_types)
-            
-            # 使用向量存储进行语义搜索
-            vector_results = await self.vector_store.search_memories(
-                query=query,
-                memory_type=memory_types[0] if memory_types else None,
-                top_k=limit * 2  # 获取更多结果用于后续过滤
-            )
-            
-            # 获取完整记忆对象
-            memory_ids = [result[0] for result in vector_results]
-            memories = []
-            
-            for memory_id in memory_ids:
-                memory = self.memory_dao.get_by_id(memory_id)
-                if memory and memory.conversation_id == conversation_id:
-                    memories.append(memory)
-            
-            # 按相似度排序
-            id_to_score = {result[0]: result[1] for result in vector_results}
-            memories.sort(key=lambda m: id_to_score.get(m.id, 0), reverse=True)
-            
-            return memories[:limit]
-            
-        except Exception as e:
-            logger.error(f"向量检索失败: {e}")
-            return []
+        if not self.vector_store:
+            logger.warning("向量存储不可用，降级到关键词检索")
+            return await self._keyword_retrieve(query, conversation_id, limit, memory_types)
+        
+        hits = await self._vector_hits(query, conversation_id, limit, memory_types)
+        return self._hydrate([memory_id for memory_id, _ in hits])
     
     async def _keyword_retrieve(
         self,
@@ -137,6 +162,29 @@ class HybridRetriever:
         """
         关键词检索
         
+        Args:
+            query: 查询内容
+            conversation_id: 会话ID
+            limit: 返回数量限制
+            memory_types: 记忆类型过滤
+            
+        Returns:
+            List[MemoryStore]: 检索结果，按关键词分数降序
+        """
+        loaded: Dict[int, MemoryStore] = {}
+        hits = await self._keyword_hits(query, conversation_id, limit, memory_types, loaded)
+        return self._hydrate([memory_id for memory_id, _ in hits], loaded)
+    
+    async def _hybrid_retrieve(
+        self,
+        query: str,
+        conversation_id: int,
+        limit: int,
+        memory_types: Optional[List[str]] = None
+    ) -> List[MemoryStore]:
+        """
+        混合检索：并发检索、加权RRF融合、一次查询取回候选并叠加综合分数
+        
         Args:
             query: 查询内容
             conversation_id: 会话ID
@@ -147,45 +195,47 @@ class HybridRetriever:
             List[MemoryStore]: 检索结果
         """
         try:
-            # 获取会话的所有记忆
-            all_memories = self.memory_dao.get_by_conversation(conversation_id)
-            
-            # 按类型过滤
-            if memory_types:
-                filtered_memories = [
-                    m for m in all_memories 
-                    if m.memory_type in memory_types
-                ]
-            else:
-                filtered_memories = all_memories
+            candidate_limit = limit * self.HYBRID_CANDIDATE_FACTOR
+            loaded: Dict[int, MemoryStore] = {}
             
-            # 关键词匹配
-            keywords = self._extract_keywords(query)
-            relevant_memories = []
+            # 向量检索与关键词检索并发执行
+            vector_hits, keyword_hits = await asyncio.gather(
+                self._vector_hits(query, conversation_id, candidate_limit, memory_types),
+                self._keyword_hits(query, conversation_id, candidate_limit, memory_types, loaded)
+            )
             
-            for memory in filtered_memories:
-                score = self._calculate_keyword_score(memory.content, keywords)
-                if score > 0:
-                    relevant_memories.append((memory, score))
+            # 加权RRF融合两路排名
+            fused = reciprocal_rank_fusion(
+                [[memory_id for memory_id, _ in vector_hits], [memory_id for memory_id, _ in keyword_hits]],
+                [self.vector_weight, self.keyword_weight],
+                self.rrf_k
+            )
+            if not fused:
+                return []
             
-            # 按关键词匹配分数排序
-            relevant_memories.sort(key=lambda x: x[1], reverse=True)
+            # 一次查询取回全部候选，叠加记忆自身的综合分数
+            prior_scale = self.prior_weight / (self.rrf_k + 1)
+            scored = [
+                (memory, fused[memory.id] + prior_scale * self._calculate_comprehensive_score(memory, query))
+                for memory in self._hydrate(list(fused), loaded)
+            ]
+            scored.sort(key=lambda x: x[1], reverse=True)
             
-            return [memory for memory, _ in relevant_memories[:limit]]
+            return [memory for memory, _ in scored[:limit]]
             
         except Exception as e:
-            logger.error(f"关键词检索失败: {e}")
+            logger.error(f"混合检索失败: {e}")
             return []
     
-    async def _hybrid_retrieve(
+    async def _vector_hits(
         self,
         query: str,
         conversation_id: int,
         limit: int,
         memory_types: Optional[List[str]] = None
-    ) -> List[MemoryStore]:
+    ) -> List[Tuple[int, float]]:
         """
-        混合检索
+        向量检索命中（会话和类型过滤在索引内完成，不访问数据库）
         
         Args:
             query: 查询内容
@@ -194,31 +244,101 @@ class HybridRetriever:
             memory_types: 记忆类型过滤
             
         Returns:
-            List[MemoryStore]: 检索结果
+            List[Tuple[int, float]]: [(记忆ID, 相似度), ...]，按相似度降序
         """
+        if not self.vector_store:
+            return []
+        
         try:
-            # 向量检索
-            vector_memories = await self._vector_retrieve(
-                query, conversation_id, limit * 2, memory_types
+            hits = await self.vector_store.search_memories(
+                query=query,
+                memory_type=memory_types,
+                top_k=limit,
+                conversation_id=conversation_id
             )
+            return sorted(((hit[0], hit[1]) for hit in hits), key=lambda hit: hit[1], reverse=True)
             
-            # 关键词检索
-            keyword_memories = await self._keyword_retrieve(
-                query, conversation_id, limit * 2, memory_types
-            )
+        except Exception as e:
+            logger.error(f"向量检索失败: {e}")
+            return []
+    
+    async def _keyword_hits(
+        self,
+        query: str,
+        conversation_id: int,
+        limit: int,
+        memory_types: Optional[List[str]],
+        loaded: Dict[int, MemoryStore]
+    ) -> List[Tuple[int, float]]:
+        """
+        关键词检索命中
+        
+        提供BM25索引时直接在索引中打分；否则在数据库中按重要性取候选，
+        再按关键词匹配分数排序，取回的记忆放入 loaded 供后续复用。
+        
+        Args:
+            query: 查询内容
+            conversation_id: 会话ID
+            limit: 返回数量限制
+            memory_types: 记忆类型过滤
+            loaded: 已取回的记忆（ID -> 记忆）
+            
+        Returns:
+            List[Tuple[int, float]]: [(记忆ID, 关键词分数), ...]，按分数降序
+        """
+        try:
+            if self.keyword_index is not None:
+                # 会话首次检索时从数据库加载索引
+                self.keyword_index.ensure_conversation(
+                    conversation_id,
+                    lambda: self.memory_dao.get_memories_by_conversation(conversation_id, include_expired=True)
+                )
+                return self.keyword_index.search(query, conversation_id, limit, memory_types)
             
-            # 合并结果
-            all_memories = self._merge_results(vector_memories, keyword_memories)
+            keywords = self._extract_keywords(query)
+            if not keywords:
+                return []
+            
+            # 过滤、关键词匹配、按重要性取候选在数据库中完成（延迟与会话记忆总数无关）
+            memories = self.memory_dao.search_relevant_memories(
+                conversation_id=conversation_id,
+                keywords=keywords,
+                memory_types=memory_types,
+                limit=limit * self.KEYWORD_CANDIDATE_FACTOR
+            )
+            loaded.update((memory.id, memory) for memory in memories)
             
-            # 重新排序
-            ranked_memories = self._rerank(all_memories, query)
+            # 候选内按关键词匹配分数排序
+            hits = [(memory.id, self._calculate_keyword_score(memory.content, keywords)) for memory in memories]
+            hits.sort(key=lambda x: x[1], reverse=True)
             
-            return ranked_memories[:limit]
+            return hits[:limit]
             
         except Exception as e:
-            logger.error(f"混合检索失败: {e}")
+            logger.error(f"关键词检索失败: {e}")
             return []
     
+    def _hydrate(
+        self,
+        memory_ids: List[int],
+        loaded: Optional[Dict[int, MemoryStore]] = None
+    ) -> List[MemoryStore]:
+        """
+        按ID取回记忆（尚未取回的ID用一次 IN 查询），保持输入顺序
+        
+        Args:
+            memory_ids: 记忆ID列表
+            loaded: 已取回的记忆（ID -> 记忆）
+            
+        Returns:
+            List[MemoryStore]: 记忆列表（已删除的记忆被跳过）
+        """
+        memories = dict(loaded or {})
+        missing = [memory_id for memory_id in memory_ids if memory_id not in memories]
+        if missing:
+            memories.update((memory.id, memory) for memory in self.memory_dao.get_memories_by_ids(missing))
+        return [memories[memory_id] for memory_id in memory_ids if memory_id in memories]
+    
     def _extract_keywords(self, query: str) -> List[str]:
         """
         提取查询关键词
@@ -284,87 +404,6 @@ class HybridRetriever:
             logger.error(f"关键词分数计算失败: {e}")
             return 0.0
     
-    def _merge_results(
-        self,
-        vector_memories: List[MemoryStore],
-        keyword_memories: List[MemoryStore]
-    ) -> List[MemoryStore]:
-        """
-        合并检索结果
-        
-        Args:
-            vector_memories: 向量检索结果
-            keyword_memories: 关键词检索结果
-            
-        Returns:
-            List[MemoryStore]: 合并后的结果
-        """
-        try:
-            # 使用字典去重
-            memory_dict = {}
-            
-            # 添加向量检索结果（权重较高）
-            for i, memory in enumerate(vector_memories):
-                memory_dict[memory.id] = {
-                    'memory': memory,
-                    'vector_score': 1.0 - (i * 0.1),  # 递减分数
-                    'keyword_score': 0.0
-                }
-            
-            # 添加关键词检索结果
-            for i, memory in enumerate(keyword_memories):
-                if memory.id in memory_dict:
-                    # 如果已存在，更新关键词分数
-                    memory_dict[memory.id]['keyword_score'] = 1.0 - (i * 0.1)
-                else:
-                    # 如果不存在，添加新记录
-                    memory_dict[memory.id] = {
-                        'memory': memory,
-                        'vector_score': 0.0,
-                        'keyword_score': 1.0 - (i * 0.1)
-                    }
-            
-            # 转换为列表
-            all_memories = [data['memory'] for data in memory_dict.values()]
-            
-            return all_memories
-            
-        except Exception as e:
-            logger.error(f"结果合并失败: {e}")
-            return vector_memories + keyword_memories
-    
-    def _rerank(
-        self,
-        memories: List[MemoryStore],
-        query: str
-    ) -> List[MemoryStore]:
-        """
-        重新排序记忆
-        
-        Args:
-            memories: 记忆列表
-            query: 查询内容
-            
-        Returns:
-            List[MemoryStore]: 重新排序后的记忆列表
-        """
-        try:
-            # 计算综合分数
-            scored_memories = []
-            
-            for memory in memories:
-                score = self._calculate_comprehensive_score(memory, query)
-                scored_memories.append((memory, score))
-            
-            # 按分数排序
-            scored_memories.sort(key=lambda x: x[1], reverse=True)
-            
-            return [memory for memory, _ in scored_memories]
-            
-        except Exception as e:
-            logger.error(f"重新排序失败: {e}")
-            return memories
-    
     def _calculate_comprehensive_score(
         self,
         memory: MemoryStore,
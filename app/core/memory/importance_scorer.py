@@ -7,18 +7,69 @@
 - 任务相关性（与当前任务的关联）
 - 引用频率（被访问的次数）
 - 时间因素（最近的信息权重高）
+
+默认在本地计算新颖性、情感强度和任务相关性（向量距离、情感词典、与当前任务的相似度），
+不调用LLM；启用LLM评分时三个维度合并为一次调用。
 """
 
+import json
 import logging
 import math
-from typing import Dict, Optional
+import re
+from typing import Dict, List, Optional
 from datetime import datetime, timedelta
 
+import numpy as np
+
+from app.core.embedding.embedding_service import normalize_rows
 from app.core.llm.base import BaseLLM
 from app.models.memory import MemoryStore
+from .keyword_index import tokenize
 
 logger = logging.getLogger(__name__)
 
+# 情感词典：情感词 -> 强度（中文按子串匹配，英文按整词匹配）
+EMOTION_LEXICON = {
+    # 强烈情感
+    "愤怒": 1.0, "生气": 0.9, "气死": 1.0, "讨厌": 0.8, "恨": 0.9, "崩溃": 1.0, "绝望": 1.0,
+    "害怕": 0.9, "恐惧": 1.0, "难过": 0.8, "伤心": 0.9, "痛苦": 1.0, "哭": 0.8,
+    "兴奋": 0.9, "激动": 0.9, "太棒了": 0.9, "爱": 0.8, "感动": 0.8,
+    "hate": 0.9, "angry": 0.9, "furious": 1.0, "terrified": 1.0, "devastated": 1.0,
+    "love": 0.8, "excited": 0.9, "amazing": 0.8, "awesome": 0.8,
+    # 明显倾向
+    "喜欢": 0.6, "不喜欢": 0.6, "担心": 0.6, "焦虑": 0.7, "失望": 0.7, "开心": 0.6,
+    "高兴": 0.6, "烦": 0.6, "郁闷": 0.6, "压力": 0.5, "后悔": 0.6, "惊讶": 0.5,
+    "like": 0.5, "dislike": 0.6, "worried": 0.6, "anxious": 0.7, "happy": 0.6,
+    "sad": 0.7, "upset": 0.7, "disappointed": 0.7, "afraid": 0.7, "annoyed": 0.6,
+    # 轻微色彩
+    "满意": 0.4, "不满": 0.5, "还行": 0.2, "希望": 0.3, "谢谢": 0.2, "可惜": 0.4,
+    "glad": 0.4, "hope": 0.3, "thanks": 0.2, "unfortunately": 0.4
+}
+
+# 程度副词：出现时情感强度放大
+INTENSIFIERS = ("非常", "特别", "超级", "极其", "太", "真的", "really", "very", "so", "extremely")
+
+
+def _lexicon_pattern(terms) -> re.Pattern:
+    """
+    构建词典匹配正则：长词优先，英文词加单词边界
+    
+    Args:
+        terms: 词语列表
+        
+    Returns:
+        re.Pattern: 匹配任一词语的正则
+    """
+    alternatives = [
+        rf"\b{re.escape(term)}\b" if term.isascii() else re.escape(term)
+        for term in sorted(terms, key=len, reverse=True)
+    ]
+    return re.compile("|".join(alternatives))
+
+
+_EMOTION_PATTERN = _lexicon_pattern(EMOTION_LEXICON)
+_INTENSIFIER_PATTERN = _lexicon_pattern(INTENSIFIERS)
+
 
 class ImportanceScorer:
     """
@@ -27,14 +78,23 @@ class ImportanceScorer:
     基于多维度计算记忆的重要性分数（0-1范围）
     """
     
-    def __init__(self, llm: BaseLLM):
+    def __init__(
+        self,
+        llm: Optional[BaseLLM] = None,
+        use_llm: bool = False,
+        vector_store=None
+    ):
         """
         初始化重要性评分器
         
         Args:
-            llm: 大语言模型实例，用于智能评分
+            llm: 大语言模型实例，仅在启用LLM评分时使用
+            use_llm: 是否用LLM评估新颖性、情感强度和任务相关性（一次合并调用）
+            vector_store: 记忆向量存储（可选，用于本地计算新颖性和相关性）
         """
         self.llm = llm
+        self.use_llm = use_llm
+        self.vector_store = vector_store
         self.weights = {
             "novelty": 0.25,      # 新颖性权重
             "emotional": 0.20,    # 情感强度权重
@@ -53,16 +113,17 @@ class ImportanceScorer:
         
         Args:
             memory: 记忆对象
-            context: 上下文信息，如当前任务、用户状态等
+            context: 上下文信息，如当前任务（current_task）、已计算的记忆向量（vector）
             
         Returns:
             float: 重要性分数（0-1）
         """
         try:
             # 计算各个维度的分数
-            novelty_score = await self._calculate_novelty_score(memory, context)
-            emotional_score = await self._calculate_emotional_score(memory, context)
-            relevance_score = await self._calculate_relevance_score(memory, context)
+            dimension_scores = await self._dimension_scores(memory, context)
+            novelty_score = dimension_scores["novelty"]
+            emotional_score = dimension_scores["emotional"]
+            relevance_score = dimension_scores["relevance"]
             frequency_score = self._calculate_frequency_score(memory)
             recency_score = self._calculate_recency_score(memory)
             
@@ -123,137 +184,198 @@ class ImportanceScorer:
             logger.error(f"衰减分数计算失败: {e}")
             return original_score
     
-    async def _calculate_novelty_score(
+    async def _dimension_scores(
         self,
         memory: MemoryStore,
         context: Optional[Dict] = None
-    ) -> float:
+    ) -> Dict[str, float]:
         """
-        计算新颖性分数
+        计算新颖性、情感强度和任务相关性三个维度的分数
         
         Args:
             memory: 记忆对象
             context: 上下文信息
             
+        Returns:
+            Dict[str, float]: {"novelty": ..., "emotional": ..., "relevance": ...}
+        """
+        if self.use_llm and self.llm is not None:
+            return await self._llm_dimension_scores(memory, context)
+        
+        vector = await self._memory_vector(memory, context)
+        return {
+            "novelty": await self._local_novelty_score(memory, vector),
+            "emotional": self._lexicon_emotional_score(memory.content),
+            "relevance": await self._local_relevance_score(memory, vector, context)
+        }
+    
+    async def _memory_vector(
+        self,
+        memory: MemoryStore,
+        context: Optional[Dict] = None
+    ) -> Optional[np.ndarray]:
+        """
+        获取记忆向量：优先使用上下文中已计算的向量，否则向量化一次（命中向量缓存时无推理开销）
+        
+        Args:
+            memory: 记忆对象
+            context: 上下文信息
+            
+        Returns:
+            Optional[np.ndarray]: 归一化后的记忆向量，向量存储不可用时返回None
+        """
+        try:
+            vector = (context or {}).get("vector")
+            if vector is None:
+                if self.vector_store is None:
+                    return None
+                vector = await self.vector_store.embedding_service.embed_text(memory.content)
+            return normalize_rows(vector)
+            
+        except Exception as e:
+            logger.warning(f"记忆向量化失败: {e}")
+            return None
+    
+    async def _local_novelty_score(
+        self,
+        memory: MemoryStore,
+        vector: Optional[np.ndarray]
+    ) -> float:
+        """
+        计算新颖性分数：1 - 与同一会话中最相近的已有记忆的相似度
+        
+        Args:
+            memory: 记忆对象
+            vector: 归一化后的记忆向量
+            
         Returns:
             float: 新颖性分数（0-1）
         """
         try:
-            # 构建新颖性评估提示
-            prompt = f"""
-请评估以下记忆内容的新颖性（是否包含新知识或新信息）：
-
-记忆内容：{memory.content}
-
-评估标准：
-- 1.0: 包含全新的知识、概念或信息
-- 0.8: 包含部分新信息或新角度
-- 0.6: 包含一些新细节或补充信息
-- 0.4: 主要是已知信息的重新组织
-- 0.2: 完全是已知信息
-- 0.0: 重复或冗余信息
-
-请只返回一个0-1之间的数字，保留2位小数。
-"""
+            if vector is None or self.vector_store is None:
+                return 0.5
             
-            response = await self.llm.achat(prompt)
-            score = self._parse_score_response(response)
+            # 多取一条，跳过记忆自身（重新评分时它已在索引中）
+            hits = await self.vector_store.search(
+                vector,
+                top_k=2,
+                filter_metadata={"conversation_id": memory.conversation_id}
+            )
+            similarities = [score for vector_id, score, _ in hits if vector_id != memory.id]
+            if not similarities:
+                return 1.0
             
-            return score
+            return float(1.0 - np.clip(max(similarities), 0.0, 1.0))
             
         except Exception as e:
             logger.error(f"新颖性评分失败: {e}")
             return 0.5
     
-    async def _calculate_emotional_score(
-        self,
-        memory: MemoryStore,
-        context: Optional[Dict] = None
-    ) -> float:
+    def _lexicon_emotional_score(self, content: str) -> float:
         """
-        计算情感强度分数
+        基于情感词典计算情感强度分数
+        
+        情感词按强度累加，程度副词放大、感叹号加分，再用 1 - e^(-x) 压缩到0-1。
         
         Args:
-            memory: 记忆对象
-            context: 上下文信息
+            content: 记忆内容
             
         Returns:
             float: 情感强度分数（0-1）
         """
         try:
-            # 构建情感强度评估提示
-            prompt = f"""
-请评估以下记忆内容的情感强度（用户情绪反应的强烈程度）：
-
-记忆内容：{memory.content}
-
-评估标准：
-- 1.0: 包含强烈的情感表达（愤怒、兴奋、悲伤、恐惧等）
-- 0.8: 包含明显的情感倾向（喜欢、不喜欢、担心等）
-- 0.6: 包含轻微的情感色彩（满意、不满意等）
-- 0.4: 包含中性但带有个人色彩的信息
-- 0.2: 主要是客观信息，情感色彩很淡
-- 0.0: 完全客观、无情感色彩的信息
-
-请只返回一个0-1之间的数字，保留2位小数。
-"""
+            text = (content or "").lower()
+            intensity = sum(EMOTION_LEXICON[match] for match in _EMOTION_PATTERN.findall(text))
+            if intensity and _INTENSIFIER_PATTERN.search(text):
+                intensity *= 1.5
+            intensity += 0.3 * min(text.count("!") + text.count("！"), 3)
             
-            response = await self.llm.achat(prompt)
-            score = self._parse_score_response(response)
-            
-            return score
+            return float(min(1.0, 0.1 + 1.0 - math.exp(-intensity)))
             
         except Exception as e:
             logger.error(f"情感强度评分失败: {e}")
             return 0.3
     
-    async def _calculate_relevance_score(
+    async def _local_relevance_score(
         self,
         memory: MemoryStore,
+        vector: Optional[np.ndarray],
         context: Optional[Dict] = None
     ) -> float:
         """
-        计算任务相关性分数
+        计算任务相关性分数：记忆与当前任务（活跃对话）的余弦相似度，
+        向量不可用时退化为两者词元的重合比例
         
         Args:
             memory: 记忆对象
+            vector: 归一化后的记忆向量
             context: 上下文信息
             
         Returns:
             float: 任务相关性分数（0-1）
         """
         try:
-            if not context or "current_task" not in context:
+            if not context or not context.get("current_task"):
                 return 0.5
             
             current_task = context["current_task"]
+            if vector is not None and self.vector_store is not None:
+                task_vector = normalize_rows(
+                    await self.vector_store.embedding_service.embed_text(current_task)
+                )
+                return float(np.clip(vector @ task_vector, 0.0, 1.0))
+            
+            memory_tokens = set(tokenize(memory.content))
+            task_tokens = set(tokenize(current_task))
+            if not memory_tokens or not task_tokens:
+                return 0.0
+            return len(memory_tokens & task_tokens) / len(task_tokens)
             
-            # 构建相关性评估提示
+        except Exception as e:
+            logger.error(f"任务相关性评分失败: {e}")
+            return 0.5
+    
+    async def _llm_dimension_scores(
+        self,
+        memory: MemoryStore,
+        context: Optional[Dict] = None
+    ) -> Dict[str, float]:
+        """
+        用一次LLM调用同时评估新颖性、情感强度和任务相关性
+        
+        Args:
+            memory: 记忆对象
+            context: 上下文信息
+            
+        Returns:
+            Dict[str, float]: {"novelty": ..., "emotional": ..., "relevance": ...}
+        """
+        scores = {"novelty": 0.5, "emotional": 0.3, "relevance": 0.5}
+        current_task = (context or {}).get("current_task")
+        
+        try:
+            task_info = f"\n当前任务：{current_task}" if current_task else ""
+            relevance_rule = "- relevance: 与当前任务的相关性（1.0 至关重要，0.0 完全无关）\n" if current_task else ""
             prompt = f"""
-请评估以下记忆内容与当前任务的相关性：
-
-当前任务：{current_task}
+请评估以下记忆内容，每个维度给出一个0-1之间的分数，保留2位小数：
+{task_info}
 记忆内容：{memory.content}
 
-评估标准：
-- 1.0: 直接相关，对完成任务至关重要
-- 0.8: 高度相关，对完成任务很有帮助
-- 0.6: 中等相关，对完成任务有一定帮助
-- 0.4: 低度相关，可能对完成任务有帮助
-- 0.2: 几乎不相关，对完成任务帮助很小
-- 0.0: 完全不相关，对完成任务没有帮助
-
-请只返回一个0-1之间的数字，保留2位小数。
+评估维度：
+- novelty: 新颖性，是否包含新知识或新信息（1.0 全新，0.0 重复或冗余）
+- emotional: 情感强度，用户情绪反应的强烈程度（1.0 强烈情感表达，0.0 完全客观）
+{relevance_rule}
+请只返回JSON对象，例如：{{"novelty": 0.60, "emotional": 0.20{', "relevance": 0.80' if current_task else ''}}}
 """
             
             response = await self.llm.achat(prompt)
-            score = self._parse_score_response(response)
-            
-            return score
+            keys = list(scores) if current_task else ["novelty", "emotional"]
+            scores.update(self._parse_scores_response(response, keys))
+            return scores
             
         except Exception as e:
-            logger.error(f"任务相关性评分失败: {e}")
-            return 0.5
+            logger.error(f"LLM综合评分失败: {e}")
+            return scores
     
     def _calculate_frequency_score(self, memory: MemoryStore) -> float:
         """
@@ -385,7 +507,6 @@ class ImportanceScorer:
         """
         try:
             # 提取数字
-            import re
             numbers = re.findall(r'0\.\d{1,2}|1\.0{1,2}', response)
             if numbers:
                 score = float(numbers[0])
@@ -405,3 +526,30 @@ class ImportanceScorer:
         except Exception as e:
             logger.error(f"评分响应解析失败: {e}")
             return 0.5
+    
+    def _parse_scores_response(self, response: str, keys: List[str]) -> Dict[str, float]:
+        """
+        解析合并评分响应（JSON对象），缺失或无法解析的维度不返回
+        
+        Args:
+            response: LLM响应
+            keys: 需要的维度名称
+            
+        Returns:
+            Dict[str, float]: 解析出的各维度分数
+        """
+        try:
+            match = re.search(r'\{.*\}', response, re.S)
+            result = json.loads(match.group(0)) if match else {}
+            
+            scores = {}
+            for key in keys:
+                if isinstance(result.get(key), (int, float)):
+                    scores[key] = max(0.0, min(1.0, float(result[key])))
+            if len(scores) < len(keys):
+                logger.warning(f"评分响应缺少维度: {response}")
+            return scores
+            
+        except (json.JSONDecodeError, AttributeError) as e:
+            logger.warning(f"无法解析评分响应为JSON: {e}")
+            return {}
@@ -0,0 +1,197 @@
+"""
+记忆写入队列
+
+把记忆的分类、评分、向量化和入库移出请求路径：调用方提交原始对话内容后立即返回，
+后台工作协程从有界队列中攒批，通过 MemoryManager.add_memories 一次批量分类、
+一次批量向量化、一次数据库提交。队列满时提交方等待（背压），而不是无限堆积。
+"""
+
+import asyncio
+import logging
+from typing import Any, Callable, Dict, List, Optional
+
+from sqlalchemy.orm import Session
+
+from .memory_manager import MemoryManager
+
+logger = logging.getLogger(__name__)
+
+
+class MemoryIngestionQueue:
+    """
+    记忆写入队列
+
+    每一批都用 session_factory 打开新的数据库会话、构建新的记忆管理器，写完即关闭会话；
+    后台写入从不使用（也不会提交）请求自己的会话。
+    """
+
+    def __init__(
+        self,
+        session_factory: Callable[[], Session],
+        manager_factory: Callable[[Session], MemoryManager],
+        max_pending: int = 1000,
+        batch_size: int = 32,
+        batch_wait_ms: float = 50.0,
+        workers: int = 2
+    ):
+        """
+        初始化记忆写入队列
+
+        Args:
+            session_factory: 数据库会话工厂（如 SessionLocal）
+            manager_factory: 用数据库会话构建记忆管理器的函数
+            max_pending: 队列中最多等待的记忆数，超出时提交方等待
+            batch_size: 每批最多写入的记忆数，攒满立即写入
+            batch_wait_ms: 取到第一条记忆后最多等待的毫秒数
+            workers: 后台工作协程数
+        """
+        self.session_factory = session_factory
+        self.manager_factory = manager_factory
+        self.max_pending = max(max_pending, 1)
+        self.batch_size = max(batch_size, 1)
+        self.batch_wait = max(batch_wait_ms, 0.0) / 1000
+        self.workers = max(workers, 1)
+
+        # 队列在首次提交时创建，绑定到当时运行的事件循环
+        self._queue: Optional[asyncio.Queue] = None
+        self._workers: List[asyncio.Task] = []
+
+        # 统计
+        self.batches = 0
+        self.ingested = 0
+        self.failed = 0
+
+    @property
+    def pending(self) -> int:
+        """
+        队列中等待写入的记忆数
+
+        Returns:
+            int: 等待写入的记忆数
+        """
+        return self._queue.qsize() if self._queue is not None else 0
+
+    async def submit(
+        self,
+        conversation_id: int,
+        content: str,
+        memory_type: Optional[str] = None,
+        metadata: Optional[Dict] = None,
+        importance_score: Optional[float] = None
+    ) -> None:
+        """
+        提交一条记忆，入队后立即返回（队列满时等待空位）
+
+        Args:
+            conversation_id: 会话ID
+            content: 记忆内容
+            memory_type: 记忆类型（可选，会自动分类）
+            metadata: 元数据
+            importance_score: 重要性分数（可选，会自动评分）
+        """
+        await self.submit_many([{
+            "conversation_id": conversation_id,
+            "content": content,
+            "memory_type": memory_type,
+            "metadata": metadata,
+            "importance_score": importance_score
+        }])
+
+    async def submit_many(self, items: List[Dict[str, Any]]) -> None:
+        """
+        批量提交记忆（格式同 MemoryManager.add_memories 的输入项）
+
+        Args:
+            items: 记忆列表
+        """
+        self._ensure_started()
+        for item in items:
+            await self._queue.put(item)
+
+    async def flush(self) -> None:
+        """
+        等待已提交的记忆全部写入
+        """
+        if self._queue is not None:
+            await self._queue.join()
+
+    async def close(self) -> None:
+        """
+        写入剩余记忆后停止工作协程
+        """
+        await self.flush()
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        获取队列统计信息
+
+        Returns:
+            Dict[str, Any]: 统计信息
+        """
+        return {
+            "pending": self.pending,
+            "batches": self.batches,
+            "ingested": self.ingested,
+            "failed": self.failed,
+            "average_batch_size": self.ingested / self.batches if self.batches else 0.0
+        }
+
+    def _ensure_started(self) -> None:
+        """
+        首次提交时创建队列并启动工作协程
+        """
+        if self._queue is None:
+            self._queue = asyncio.Queue(maxsize=self.max_pending)
+        if not self._workers:
+            self._workers = [
+                asyncio.ensure_future(self._worker()) for _ in range(self.workers)
+            ]
+
+    async def _worker(self) -> None:
+        """
+        工作协程：取一批记忆，用独立的数据库会话写入，循环直到被取消
+        """
+        while True:
+            batch = await self._next_batch()
+            db = None
+            try:
+                db = self.session_factory()
+                await self.manager_factory(db).add_memories(batch)
+                self.batches += 1
+                self.ingested += len(batch)
+            except Exception as e:
+                self.failed += len(batch)
+                logger.error(f"记忆批量写入失败（{len(batch)}条）: {e}")
+            finally:
+                if db is not None:
+                    db.close()
+                for _ in batch:
+                    self._queue.task_done()
+
+    async def _next_batch(self) -> List[Dict[str, Any]]:
+        """
+        等待第一条记忆，再在 batch_wait 内继续收集，最多 batch_size 条
+
+        Returns:
+            List[Dict[str, Any]]: 一批记忆
+        """
+        loop = asyncio.get_running_loop()
+        batch = [await self._queue.get()]
+        deadline = loop.time() + self.batch_wait
+
+        while len(batch) < self.batch_size:
+            if not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+                continue
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), remaining))
+            except asyncio.TimeoutError:
+                break
+        return batch
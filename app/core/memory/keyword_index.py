@@ -0,0 +1,340 @@
+"""
+记忆关键词倒排索引
+
+进程内的BM25倒排索引，替代逐行子串扫描的关键词检索：
+- 中日韩文字按相邻两字切分（bigram），其余文字按单词切分
+- 每个会话一个索引分区，BM25统计量在会话内计算
+- 会话首次检索时从数据库整体加载，之后随记忆的增删增量更新
+"""
+
+import logging
+import math
+import re
+from array import array
+from collections import Counter, OrderedDict
+from datetime import datetime, timezone
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from app.models.memory import MemoryStore
+
+logger = logging.getLogger(__name__)
+
+# 中日韩文字（统一表意文字、扩展A、兼容表意文字、假名、韩文音节）
+CJK_CHARS = "\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff\u3040-\u30ff\uac00-\ud7af"
+_SEGMENT = re.compile(f"[{CJK_CHARS}]+|[^{CJK_CHARS}]+")
+_CJK_RUN = re.compile(f"[{CJK_CHARS}]+")
+
+# 墓碑数超过有效记忆数（且不少于该值）时重建会话分区
+COMPACTION_MIN_DEAD = 64
+
+# 英文停用词（中文按两字切分后极少出现纯停用词，不做过滤）
+STOP_WORDS = {
+    'the', 'a', 'an', 'and', 'or', 'but', 'in', 'on', 'at', 'to', 'for',
+    'of', 'is', 'are', 'was', 'were', 'be', 'it', 'this', 'that', 'with'
+}
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    分词：中日韩文字切成相邻两字的词元（单字片段保留单字），其余文字按单词切分并转小写
+    
+    Args:
+        text: 文本
+        
+    Returns:
+        List[str]: 词元列表（保留重复，用于词频统计）
+    """
+    tokens = []
+    for word in re.findall(r'[^\W_]+', (text or "").lower()):
+        for segment in _SEGMENT.findall(word):
+            if _CJK_RUN.fullmatch(segment):
+                if len(segment) == 1:
+                    tokens.append(segment)
+                else:
+                    tokens.extend(segment[i:i + 2] for i in range(len(segment) - 1))
+            elif segment not in STOP_WORDS:
+                tokens.append(segment)
+    return tokens
+
+
+class _ConversationIndex:
+    """
+    单个会话的倒排索引分区（列式存储，检索时零拷贝转为numpy数组一次性打分）
+    
+    每条记忆占一个槽位；删除只做标记，墓碑过多时重建分区。
+    """
+    
+    def __init__(self):
+        # 词元 -> (槽位列表, 词频列表)
+        self.postings: Dict[str, Tuple[array, array]] = {}
+        # 槽位列：记忆ID、文档长度、类型编号、过期时间戳（无过期为inf）、是否有效
+        self.memory_ids = array("q")
+        self.lengths = array("f")
+        self.type_codes = array("h")
+        self.expires = array("d")
+        self.alive = array("b")
+        # 槽位 -> {词元: 词频}（重建分区时使用）
+        self.slot_terms: List[Optional[Dict[str, int]]] = []
+        # 记忆ID -> 槽位
+        self.slots: Dict[int, int] = {}
+        # 记忆类型 -> 编号
+        self.type_ids: Dict[str, int] = {}
+        self.total_length = 0.0
+    
+    def __len__(self) -> int:
+        return len(self.slots)
+    
+    def add(self, memory_id: int, content: str, memory_type: str, expires_at: Optional[datetime]) -> None:
+        self.remove(memory_id)
+        self._append(memory_id, Counter(tokenize(content)), memory_type, expires_at)
+    
+    def remove(self, memory_id: int) -> bool:
+        slot = self.slots.pop(memory_id, None)
+        if slot is None:
+            return False
+        
+        self.alive[slot] = 0
+        self.total_length -= self.lengths[slot]
+        self.slot_terms[slot] = None
+        return True
+    
+    def needs_compaction(self) -> bool:
+        dead = len(self.alive) - len(self.slots)
+        return dead >= COMPACTION_MIN_DEAD and dead > len(self.slots)
+    
+    def compacted(self) -> "_ConversationIndex":
+        """只保留有效槽位，重建一个新分区"""
+        index = _ConversationIndex()
+        code_types = {code: memory_type for memory_type, code in self.type_ids.items()}
+        for memory_id, slot in sorted(self.slots.items(), key=lambda item: item[1]):
+            expires = self.expires[slot]
+            index._append(
+                memory_id,
+                self.slot_terms[slot],
+                code_types[self.type_codes[slot]],
+                None if math.isinf(expires) else datetime.fromtimestamp(expires, timezone.utc).replace(tzinfo=None)
+            )
+        return index
+    
+    def _append(
+        self,
+        memory_id: int,
+        terms: Dict[str, int],
+        memory_type: str,
+        expires_at: Optional[datetime]
+    ) -> None:
+        slot = len(self.memory_ids)
+        for term, frequency in terms.items():
+            posting = self.postings.get(term)
+            if posting is None:
+                posting = self.postings[term] = (array("i"), array("f"))
+            posting[0].append(slot)
+            posting[1].append(frequency)
+        
+        length = sum(terms.values())
+        self.memory_ids.append(memory_id)
+        self.lengths.append(length)
+        self.type_codes.append(self.type_ids.setdefault(memory_type, len(self.type_ids)))
+        self.expires.append(
+            expires_at.replace(tzinfo=timezone.utc).timestamp() if expires_at is not None else math.inf
+        )
+        self.alive.append(1)
+        self.slot_terms.append(terms)
+        self.slots[memory_id] = slot
+        self.total_length += length
+
+
+class BM25Index:
+    """
+    记忆的BM25倒排索引
+    
+    按会话分区：只有已加载的会话接受增量更新，未加载的会话在首次检索时
+    通过 ensure_conversation 从数据库整体加载，保证索引与数据库一致。
+    常驻的会话分区数量超过上限时淘汰最久未使用的分区。
+    """
+    
+    def __init__(self, k1: float = 1.5, b: float = 0.75, max_conversations: int = 1024):
+        """
+        初始化BM25索引
+        
+        Args:
+            k1: 词频饱和参数
+            b: 文档长度归一化参数
+            max_conversations: 常驻内存的最大会话分区数
+        """
+        self.k1 = k1
+        self.b = b
+        self.max_conversations = max(max_conversations, 1)
+        
+        # 会话ID -> 索引分区（LRU）
+        self._conversations: "OrderedDict[int, _ConversationIndex]" = OrderedDict()
+        
+        logger.info(f"BM25关键词索引初始化完成: k1={k1}, b={b}")
+    
+    def __len__(self) -> int:
+        return sum(len(index) for index in self._conversations.values())
+    
+    def has_conversation(self, conversation_id: int) -> bool:
+        """
+        会话是否已加载
+        
+        Args:
+            conversation_id: 会话ID
+            
+        Returns:
+            bool: 是否已加载
+        """
+        return conversation_id in self._conversations
+    
+    def load_conversation(self, conversation_id: int, memories: Iterable[MemoryStore]) -> int:
+        """
+        用会话的全部记忆（重新）构建该会话的索引分区
+        
+        Args:
+            conversation_id: 会话ID
+            memories: 会话的记忆
+            
+        Returns:
+            int: 索引的记忆数
+        """
+        index = _ConversationIndex()
+        for memory in memories:
+            index.add(memory.id, memory.content, memory.memory_type, memory.expires_at)
+        
+        self._conversations[conversation_id] = index
+        self._conversations.move_to_end(conversation_id)
+        while len(self._conversations) > self.max_conversations:
+            self._conversations.popitem(last=False)
+        
+        logger.debug(f"会话关键词索引已加载: 会话={conversation_id}, 记忆数={len(index)}")
+        return len(index)
+    
+    def ensure_conversation(
+        self,
+        conversation_id: int,
+        loader: Callable[[], Iterable[MemoryStore]]
+    ) -> None:
+        """
+        会话未加载时用 loader 从数据库加载
+        
+        Args:
+            conversation_id: 会话ID
+            loader: 返回会话全部记忆的函数
+        """
+        if conversation_id not in self._conversations:
+            self.load_conversation(conversation_id, loader())
+    
+    def add(self, memory: MemoryStore) -> bool:
+        """
+        增量添加（或更新）一条记忆；会话未加载时忽略，首次检索时会整体加载
+        
+        Args:
+            memory: 已保存的记忆
+            
+        Returns:
+            bool: 是否写入了索引
+        """
+        index = self._conversations.get(memory.conversation_id)
+        if index is None:
+            return False
+        index.add(memory.id, memory.content, memory.memory_type, memory.expires_at)
+        self._compact_if_needed(memory.conversation_id)
+        return True
+    
+    def remove(self, memory_id: int, conversation_id: Optional[int] = None) -> bool:
+        """
+        删除一条记忆
+        
+        Args:
+            memory_id: 记忆ID
+            conversation_id: 会话ID（未知时在所有已加载的会话中查找）
+            
+        Returns:
+            bool: 是否删除了索引项
+        """
+        if conversation_id is None:
+            conversation_id = next(
+                (cid for cid, index in self._conversations.items() if memory_id in index.slots), None
+            )
+        index = self._conversations.get(conversation_id)
+        if index is None or not index.remove(memory_id):
+            return False
+        self._compact_if_needed(conversation_id)
+        return True
+    
+    def search(
+        self,
+        query: str,
+        conversation_id: int,
+        limit: int = 5,
+        memory_types: Optional[List[str]] = None,
+        include_expired: bool = False
+    ) -> List[Tuple[int, float]]:
+        """
+        BM25检索
+        
+        Args:
+            query: 查询内容
+            conversation_id: 会话ID
+            limit: 返回数量限制
+            memory_types: 记忆类型过滤（可选）
+            include_expired: 是否包含过期记忆
+            
+        Returns:
+            List[Tuple[int, float]]: [(记忆ID, BM25分数), ...]，按分数降序
+        """
+        index = self._conversations.get(conversation_id)
+        if index is None or not index.slots or limit <= 0:
+            return []
+        self._conversations.move_to_end(conversation_id)
+        
+        document_count = len(index.slots)
+        lengths = np.frombuffer(index.lengths, dtype=np.float32)
+        alive = np.frombuffer(index.alive, dtype=np.int8) == 1
+        average_length = index.total_length / document_count or 1.0
+        
+        # 逐个查询词元累加BM25分数（每个词元的倒排表一次向量化计算）
+        scores = np.zeros(len(lengths), dtype=np.float32)
+        matched = False
+        for term in set(tokenize(query)):
+            posting = index.postings.get(term)
+            if posting is None:
+                continue
+            slots = np.frombuffer(posting[0], dtype=np.int32)
+            frequencies = np.frombuffer(posting[1], dtype=np.float32)
+            document_frequency = int(np.count_nonzero(alive[slots]))
+            idf = math.log(1 + (document_count - document_frequency + 0.5) / (document_frequency + 0.5))
+            norm = self.k1 * (1 - self.b + self.b * lengths[slots] / average_length)
+            scores[slots] += idf * frequencies * (self.k1 + 1) / (frequencies + norm)
+            matched = True
+        if not matched:
+            return []
+        
+        # 过滤已删除、类型不符和已过期的记忆
+        visible = alive & (scores > 0)
+        if memory_types:
+            codes = [index.type_ids[t] for t in memory_types if t in index.type_ids]
+            visible &= np.isin(np.frombuffer(index.type_codes, dtype=np.int16), codes)
+        if not include_expired:
+            visible &= np.frombuffer(index.expires, dtype=np.float64) > datetime.now(timezone.utc).timestamp()
+        
+        candidates = np.flatnonzero(visible)
+        if len(candidates) > limit:
+            candidates = candidates[np.argpartition(-scores[candidates], limit - 1)[:limit]]
+        candidates = candidates[np.argsort(-scores[candidates], kind="stable")]
+        
+        memory_ids = np.frombuffer(index.memory_ids, dtype=np.int64)
+        return [(int(memory_ids[slot]), float(scores[slot])) for slot in candidates]
+    
+    def _compact_if_needed(self, conversation_id: int) -> None:
+        """
+        墓碑过多时重建会话分区
+        
+        Args:
+            conversation_id: 会话ID
+        """
+        index = self._conversations[conversation_id]
+        if index.needs_compaction():
+            self._conversations[conversation_id] = index.compacted()
@@ -25,14 +25,16 @@ class MemoryClassifier:
     使用LLM或规则判断记忆类型，支持批量分类
     """
     
-    def __init__(self, llm: BaseLLM):
+    def __init__(self, llm: Optional[BaseLLM] = None, use_llm: bool = True):
         """
         初始化记忆分类器
         
         Args:
             llm: 大语言模型实例，用于智能分类
+            use_llm: 是否使用LLM分类（False时只用规则分类，不产生LLM调用）
         """
         self.llm = llm
+        self.use_llm = use_llm and llm is not None
         self.memory_types = {
             "short_term": "短期记忆 - 会话内临时信息，如当前对话的上下文",
             "long_term": "长期记忆 - 重要的跨会话信息，如用户偏好、重要事实",
@@ -55,6 +57,9 @@ class MemoryClassifier:
         Returns:
             str: 记忆类型
         """
+        if not self.use_llm:
+            return self._rule_based_classification(content)
+        
         try:
             # 构建分类提示
             prompt = self._build_classification_prompt(content, context)
@@ -88,6 +93,8 @@ class MemoryClassifier:
         """
         if not contents:
             return []
+        if not self.use_llm:
+            return [self._rule_based_classification(content) for content in contents]
         
         try:
             # 构建批量分类提示
@@ -8,10 +8,12 @@
 - 记忆的压缩和遗忘
 """
 
+import asyncio
 import logging
 from typing import Dict, List, Optional, Any
 from datetime import datetime
 
+import numpy as np
 from sqlalchemy.orm import Session
 
 from app.core.llm.base import BaseLLM
@@ -21,6 +23,7 @@ from .memory_classifier import MemoryClassifier
 from .importance_scorer import ImportanceScorer
 from .memory_compressor import MemoryCompressor
 from .forgetting_mechanism import ForgettingMechanism
+from .keyword_index import tokenize
 
 logger = logging.getLogger(__name__)
 
@@ -32,7 +35,15 @@ class MemoryManager:
     统一管理记忆的整个生命周期，协调各个子模块
     """
     
-    def __init__(self, db: Session, llm: BaseLLM, vector_store=None):
+    def __init__(
+        self,
+        db: Session,
+        llm: BaseLLM,
+        vector_store=None,
+        embedding_dtype: str = "float32",
+        keyword_index=None,
+        llm_scoring: bool = False
+    ):
         """
         初始化记忆管理器
         
@@ -40,15 +51,20 @@ class MemoryManager:
             db: 数据库会话
             llm: 大语言模型实例
             vector_store: 向量存储实例（可选）
+            embedding_dtype: 写入 memory_store.embedding 的向量精度（float32 或 float16）
+            keyword_index: BM25关键词索引（可选，进程内共享，随记忆增删增量更新）
+            llm_scoring: 是否用LLM分类和评分（默认在本地完成，添加记忆不调用LLM）
         """
         self.db = db
         self.llm = llm
         self.vector_store = vector_store
+        self.embedding_dtype = np.dtype(embedding_dtype)
+        self.keyword_index = keyword_index
         
         # 初始化DAO和子模块
         self.memory_dao = MemoryDAO(db)
-        self.classifier = MemoryClassifier(llm)
-        self.scorer = ImportanceScorer(llm)
+        self.classifier = MemoryClassifier(llm, use_llm=llm_scoring)
+        self.scorer = ImportanceScorer(llm, use_llm=llm_scoring, vector_store=vector_store)
         self.compressor = MemoryCompressor(llm)
         self.forgetting = ForgettingMechanism()
         
@@ -59,7 +75,8 @@ class MemoryManager:
         conversation_id: int,
         content: str,
         memory_type: Optional[str] = None,
-        metadata: Optional[Dict] = None
+        metadata: Optional[Dict] = None,
+        context: Optional[Dict] = None
     ) -> MemoryStore:
         """
         添加新记忆
@@ -69,6 +86,7 @@ class MemoryManager:
             content: 记忆内容
             memory_type: 记忆类型（可选，会自动分类）
             metadata: 元数据
+            context: 评分上下文（可选），如当前任务 current_task，用于计算任务相关性
             
         Returns:
             MemoryStore: 创建的记忆对象
@@ -86,13 +104,28 @@ class MemoryManager:
                 memory_metadata=metadata or {}
             )
             
-            # 计算重要性分数
-            importance_score = await self.scorer.score_memory(memory)
+            # 向量化一次，向量随记忆一起存入数据库，重建索引时无需再推理
+            vector = None
+            if self.vector_store:
+                try:
+                    vector = await self.vector_store.embedding_service.embed_text(content)
+                    memory.set_embedding_vector(vector, self.embedding_dtype)
+                except Exception as e:
+                    logger.warning(f"记忆向量化失败: {e}")
+            
+            # 计算重要性分数（复用同一向量计算新颖性和相关性）
+            importance_score = await self.scorer.score_memory(
+                memory, self._scoring_context(context, vector)
+            )
             memory.importance_score = importance_score
             
             # 保存到数据库
             saved_memory = self.memory_dao.create(memory)
             
+            # 更新关键词索引
+            if self.keyword_index is not None:
+                self.keyword_index.add(saved_memory)
+            
             # 添加到向量存储（如果可用）
             if self.vector_store:
                 try:
@@ -100,7 +133,8 @@ class MemoryManager:
                         memory_id=saved_memory.id,
                         content=content,
                         memory_type=memory_type,
-                        metadata=metadata or {}
+                        metadata={**(metadata or {}), "conversation_id": conversation_id},
+                        vector=vector
                     )
                 except Exception as e:
                     logger.warning(f"添加记忆到向量存储失败: {e}")
@@ -114,6 +148,104 @@ class MemoryManager:
             logger.error(f"添加记忆失败: {e}")
             raise
     
+    async def add_memories(self, items: List[Dict[str, Any]]) -> List[MemoryStore]:
+        """
+        批量添加记忆：一次批量分类、一次批量向量化、一次数据库提交
+        
+        Args:
+            items: 记忆列表，每项包含 conversation_id、content，
+                可选 memory_type（缺省时自动分类）、metadata、importance_score（缺省时自动评分）、context
+            
+        Returns:
+            List[MemoryStore]: 创建的记忆对象列表（与输入顺序一致）
+        """
+        if not items:
+            return []
+        
+        try:
+            # 批量分类未指定类型的记忆
+            memory_types = [item.get("memory_type") for item in items]
+            unclassified = [i for i, memory_type in enumerate(memory_types) if memory_type is None]
+            if unclassified:
+                classified = await self.classifier.batch_classify([items[i]["content"] for i in unclassified])
+                for i, memory_type in zip(unclassified, classified):
+                    memory_types[i] = memory_type
+            
+            memories = [
+                MemoryStore(
+                    conversation_id=item["conversation_id"],
+                    content=item["content"],
+                    memory_type=memory_type,
+                    memory_metadata=item.get("metadata") or {}
+                )
+                for item, memory_type in zip(items, memory_types)
+            ]
+            
+            # 批量向量化
+            vectors = [None] * len(items)
+            if self.vector_store:
+                try:
+                    vectors = list(await self.vector_store.embedding_service.embed_batch(
+                        [memory.content for memory in memories]
+                    ))
+                    for memory, vector in zip(memories, vectors):
+                        memory.set_embedding_vector(vector, self.embedding_dtype)
+                except Exception as e:
+                    logger.warning(f"记忆批量向量化失败: {e}")
+            
+            # 并发评分（已指定重要性的记忆不评分）
+            async def score(memory: MemoryStore, item: Dict[str, Any], vector) -> float:
+                if item.get("importance_score") is not None:
+                    return item["importance_score"]
+                return await self.scorer.score_memory(memory, self._scoring_context(item.get("context"), vector))
+            
+            scores = await asyncio.gather(*(
+                score(memory, item, vector) for memory, item, vector in zip(memories, items, vectors)
+            ))
+            for memory, importance_score in zip(memories, scores):
+                memory.importance_score = importance_score
+            
+            # 一次提交保存整批记忆
+            saved_memories = self.memory_dao.create_memories(memories)
+            
+            for memory, vector in zip(saved_memories, vectors):
+                if self.keyword_index is not None:
+                    self.keyword_index.add(memory)
+                if self.vector_store:
+                    try:
+                        await self.vector_store.add_memory(
+                            memory_id=memory.id,
+                            content=memory.content,
+                            memory_type=memory.memory_type,
+                            metadata={**memory.memory_metadata, "conversation_id": memory.conversation_id},
+                            vector=vector
+                        )
+                    except Exception as e:
+                        logger.warning(f"添加记忆到向量存储失败: {e}")
+            
+            logger.info(f"批量添加记忆完成: {len(saved_memories)}条")
+            return saved_memories
+            
+        except Exception as e:
+            logger.error(f"批量添加记忆失败: {e}")
+            raise
+    
+    @staticmethod
+    def _scoring_context(context: Optional[Dict], vector) -> Optional[Dict]:
+        """
+        构建评分上下文：带上已计算的记忆向量，评分时不再重复向量化
+        
+        Args:
+            context: 调用方提供的上下文
+            vector: 记忆向量（可为None）
+            
+        Returns:
+            Optional[Dict]: 评分上下文
+        """
+        if vector is None:
+            return context
+        return {**(context or {}), "vector": vector}
+    
     async def get_relevant_memories(
         self,
         conversation_id: int,
@@ -134,31 +266,16 @@ class MemoryManager:
             List[MemoryStore]: 相关记忆列表
         """
         try:
-            # 获取会话的所有记忆
-            all_memories = self.memory_dao.get_by_conversation(conversation_id)
-            
-            # 按类型过滤
-            if memory_types:
-                filtered_memories = [
-                    m for m in all_memories 
-                    if m.memory_type in memory_types
-                ]
-            else:
-                filtered_memories = all_memories
-            
-            # 简单的关键词匹配（后续会升级为语义搜索）
-            relevant_memories = self._simple_relevance_search(
-                filtered_memories, query
-            )
-            
-            # 按重要性排序并限制数量
-            relevant_memories.sort(
-                key=lambda m: m.importance_score or 0,
-                reverse=True
+            # 简单的关键词匹配（后续会升级为语义搜索）：
+            # 查询按关键词索引的规则分词（中文切成两字词元，整句不会成为一个关键词），
+            # 类型、过期过滤、匹配、按重要性排序和数量限制都在数据库中完成
+            result = self.memory_dao.search_relevant_memories(
+                conversation_id=conversation_id,
+                keywords=list(dict.fromkeys(tokenize(query))),
+                memory_types=memory_types,
+                limit=limit
             )
             
-            result = relevant_memories[:limit]
-            
             logger.debug(f"找到{len(result)}条相关记忆")
             return result
             
@@ -198,18 +315,14 @@ class MemoryManager:
             # 使用向量存储进行语义搜索
             vector_results = await self.vector_store.search_memories(
                 query=query,
-                memory_type=memory_types[0] if memory_types else None,
-                top_k=limit
+                memory_type=memory_types,
+                top_k=limit,
+                conversation_id=conversation_id
             )
             
-            # 获取完整记忆对象
+            # 一次查询获取完整记忆对象（保持相似度顺序）
             memory_ids = [result[0] for result in vector_results]
-            memories = []
-            
-            for memory_id in memory_ids:
-                memory = self.memory_dao.get_by_id(memory_id)
-                if memory:
-                    memories.append(memory)
+            memories = self.memory_dao.get_memories_by_ids(memory_ids)
             
             logger.debug(f"语义搜索完成: 查询='{query}', 找到{len(memories)}条结果")
             return memories
@@ -224,6 +337,24 @@ class MemoryManager:
                 limit=limit
             )
     
+    async def rebuild_vector_store(self, chunk_size: int = 1000) -> int:
+        """
+        用数据库中保存的向量嵌入重建向量索引（不调用向量化模型）
+        
+        Args:
+            chunk_size: 每次从数据库读取的行数
+            
+        Returns:
+            int: 重建的向量数，向量存储不可用或失败时返回-1
+        """
+        if not self.vector_store:
+            logger.warning("向量存储不可用，无法重建索引")
+            return -1
+        
+        return await self.vector_store.rebuild_from_rows(
+            self.memory_dao.iter_embedding_chunks(chunk_size)
+        )
+    
     async def upgrade_to_long_term(
         self,
         short_term_memories: List[MemoryStore]
@@ -248,17 +379,23 @@ class MemoryManager:
                     
                     # 重新计算重要性分数
                     new_importance = await self.scorer.score_memory(memory)
-                    memory.importance_score = new_importance
                     
-                    # 更新元数据
-                    metadata = memory.memory_metadata or {}
+                    # 更新元数据（复制后赋值，JSON列才会被识别为已修改）
+                    metadata = dict(memory.memory_metadata or {})
                     metadata["upgraded_at"] = datetime.utcnow().isoformat()
                     metadata["original_type"] = "short_term"
-                    memory.memory_metadata = metadata
                     
                     # 保存到数据库
-                    updated_memory = self.memory_dao.update(memory)
+                    updated_memory = self.memory_dao.update_by_id(memory.id, {
+                        "memory_type": "long_term",
+                        "importance_score": new_importance,
+                        "memory_metadata": metadata
+                    })
+                    if updated_memory is None:
+                        continue
                     upgraded_memories.append(updated_memory)
+                    if self.keyword_index is not None:
+                        self.keyword_index.add(updated_memory)
                     
                     logger.debug(f"记忆已升级为长期记忆: ID={memory.id}")
             
@@ -291,14 +428,15 @@ class MemoryManager:
             
             # 保存压缩后的记忆
             saved_memory = self.memory_dao.create(compressed_memory)
+            if self.keyword_index is not None:
+                self.keyword_index.add(saved_memory)
             
             # 标记原始记忆为已压缩
             for memory in memories:
-                metadata = memory.memory_metadata or {}
+                metadata = dict(memory.memory_metadata or {})
                 metadata["compressed_into"] = saved_memory.id
                 metadata["compressed_at"] = datetime.utcnow().isoformat()
-                memory.memory_metadata = metadata
-                self.memory_dao.update(memory)
+                self.memory_dao.update_by_id(memory.id, {"memory_metadata": metadata})
             
             logger.info(f"成功压缩{len(memories)}条记忆为1条摘要记忆")
             return saved_memory
@@ -321,8 +459,8 @@ class MemoryManager:
             Dict[str, Any]: 遗忘结果统计
         """
         try:
-            # 获取会话的所有记忆
-            memories = self.memory_dao.get_by_conversation(conversation_id)
+            # 获取会话的所有记忆（已过期的记忆同样参与遗忘）
+            memories = self.memory_dao.get_memories_by_conversation(conversation_id, include_expired=True)
             
             # 应用遗忘机制
             result = await self.forgetting.apply_forgetting(memories)
@@ -331,8 +469,11 @@ class MemoryManager:
             forgotten_count = 0
             for memory in result["forgotten_memories"]:
                 try:
-                    self.memory_dao.delete(memory.id)
+                    if not self.memory_dao.delete_by_id(memory.id, soft_delete=False):
+                        continue
                     forgotten_count += 1
+                    if self.keyword_index is not None:
+                        self.keyword_index.remove(memory.id, memory.conversation_id)
                 except Exception as e:
                     logger.error(f"删除记忆失败: ID={memory.id}, 错误={e}")
             
@@ -373,7 +514,7 @@ class MemoryManager:
             }
             
             # 获取会话的所有记忆
-            all_memories = self.memory_dao.get_by_conversation(conversation_id)
+            all_memories = self.memory_dao.get_memories_by_conversation(conversation_id)
             maintenance_result["total_memories"] = len(all_memories)
             
             if not all_memories:
@@ -464,38 +605,6 @@ class MemoryManager:
             logger.error(f"升级判断失败: {e}")
             return False
     
-    def _simple_relevance_search(
-        self,
-        memories: List[MemoryStore],
-        query: str
-    ) -> List[MemoryStore]:
-        """
-        简单的相关性搜索（后续会升级为语义搜索）
-        
-        Args:
-            memories: 记忆列表
-            query: 查询内容
-            
-        Returns:
-            List[MemoryStore]: 相关记忆列表
-        """
-        try:
-            query_lower = query.lower()
-            relevant_memories = []
-            
-            for memory in memories:
-                content_lower = memory.content.lower()
-                
-                # 简单的关键词匹配
-                if any(keyword in content_lower for keyword in query_lower.split()):
-                    relevant_memories.append(memory)
-            
-            return relevant_memories
-            
-        except Exception as e:
-            logger.error(f"相关性搜索失败: {e}")
-            return []
-    
     def get_memory_statistics(
         self,
         conversation_id: int
@@ -510,7 +619,7 @@ class MemoryManager:
             Dict[str, Any]: 统计信息
         """
         try:
-            memories = self.memory_dao.get_by_conversation(conversation_id)
+            memories = self.memory_dao.get_memories_by_conversation(conversation_id)
             
             # 按类型统计
             type_stats = {}
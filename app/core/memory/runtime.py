@@ -0,0 +1,132 @@
+"""
+记忆运行时
+
+进程级共享的记忆组件：向量化服务、记忆向量存储、BM25关键词索引、记忆写入队列。
+应用启动时按配置创建一次（start），关闭时释放（close）；
+每个请求用 create_memory_manager 以请求自己的数据库会话构建记忆管理器，
+写入队列则为每一批打开自己的数据库会话。
+"""
+
+import logging
+from typing import Optional
+
+from sqlalchemy.orm import Session
+
+from app.core.llm.base import BaseLLM
+from app.models.database import SessionLocal
+from app.utils.config import config
+from .ingestion_queue import MemoryIngestionQueue
+from .keyword_index import BM25Index
+from .memory_manager import MemoryManager
+
+logger = logging.getLogger(__name__)
+
+
+class MemoryRuntime:
+    """
+    记忆运行时
+    
+    组件未启动或创建失败时为None，记忆管理器退化为不使用该组件。
+    """
+    
+    def __init__(self):
+        """初始化记忆运行时（组件在 start 时创建）"""
+        self.embedding_service = None
+        self.vector_store = None
+        self.keyword_index: Optional[BM25Index] = None
+        self.ingestion_queue: Optional[MemoryIngestionQueue] = None
+        self._ingestion_llm: Optional[BaseLLM] = None
+        self.started = False
+    
+    async def start(self) -> None:
+        """
+        按配置创建共享的记忆组件
+        """
+        if self.started:
+            return
+        
+        memory_config = config.get("memory", {}) or {}
+        self.keyword_index = BM25Index(
+            max_conversations=memory_config.get("keyword_index_conversations", 1024)
+        )
+        
+        if memory_config.get("vector_search", True):
+            try:
+                from app.core.embedding.factory import create_embedding_service
+                from app.core.vectordb.factory import create_memory_vector_store
+                
+                self.embedding_service = create_embedding_service()
+                self.vector_store = create_memory_vector_store(self.embedding_service)
+            except Exception as e:
+                logger.warning(f"向量检索不可用，记忆检索只使用关键词: {e}")
+                if self.embedding_service is not None:
+                    await self.embedding_service.close()
+                self.embedding_service = None
+                self.vector_store = None
+        
+        ingestion_config = memory_config.get("ingestion", {}) or {}
+        if ingestion_config.get("enabled", True):
+            if memory_config.get("llm_scoring", False):
+                try:
+                    from app.core.llm.factory import create_llm
+                    
+                    self._ingestion_llm = create_llm()
+                except Exception as e:
+                    logger.warning(f"后台写入无法创建LLM，记忆改用本地分类和评分: {e}")
+            self.ingestion_queue = MemoryIngestionQueue(
+                SessionLocal,
+                lambda db: self.create_memory_manager(db, self._ingestion_llm),
+                max_pending=ingestion_config.get("max_pending", 1000),
+                batch_size=ingestion_config.get("batch_size", 32),
+                batch_wait_ms=ingestion_config.get("batch_wait_ms", 50),
+                workers=ingestion_config.get("workers", 2)
+            )
+        
+        self.started = True
+        logger.info(
+            f"记忆运行时已启动: 向量检索={self.vector_store is not None}, "
+            f"后台写入={self.ingestion_queue is not None}"
+        )
+    
+    async def close(self) -> None:
+        """
+        释放共享的记忆组件（先写完队列中的记忆，再保存向量存储快照，把向量缓存刷回磁盘）
+        """
+        if self.ingestion_queue is not None:
+            await self.ingestion_queue.close()
+            self.ingestion_queue = None
+        self._ingestion_llm = None
+        if self.vector_store is not None:
+            await self.vector_store.save()
+            self.vector_store = None
+        if self.embedding_service is not None:
+            await self.embedding_service.close()
+            self.embedding_service = None
+        self.keyword_index = None
+        self.started = False
+        logger.info("记忆运行时已关闭")
+    
+    def create_memory_manager(self, db: Session, llm: Optional[BaseLLM]) -> MemoryManager:
+        """
+        用给定的数据库会话构建记忆管理器，共享运行时的组件
+        
+        Args:
+            db: 数据库会话
+            llm: 大语言模型实例
+        
+        Returns:
+            MemoryManager: 记忆管理器
+        """
+        memory_config = config.get("memory", {}) or {}
+        return MemoryManager(
+            db,
+            llm,
+            vector_store=self.vector_store,
+            keyword_index=self.keyword_index,
+            embedding_dtype=memory_config.get("embedding_dtype", "float32"),
+            llm_scoring=memory_config.get("llm_scoring", False)
+        )
+
+
+# 创建全局单例
+memory_runtime = MemoryRuntime()
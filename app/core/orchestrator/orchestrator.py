@@ -396,6 +396,8 @@ class Orchestrator:
         """
         存储执行记忆
         
+        记忆服务配置了写入队列时只入队即返回，分类、评分、向量化和入库不计入响应延迟。
+        
         Args:
             request: 编排器请求
             result: 执行结果
@@ -408,23 +410,20 @@ class Orchestrator:
             # 构建记忆内容
             memory_content = f"用户: {request.content}\n助手: {result}"
             
-            # 根据执行模式决定记忆类型
+            # 根据执行模式决定重要性（记忆类型由分类器判断，执行模式记录在元数据中）
             if mode == ExecutionMode.REFLECTION:
-                memory_type = "reflection"
                 importance = 0.8  # 反思模式的结果通常更重要
             elif mode == ExecutionMode.PLANNING:
-                memory_type = "planning"
                 importance = 0.7
             else:
-                memory_type = "conversation"
                 importance = 0.5
             
-            # 存储记忆
+            # 存储记忆（写入队列模式下立即返回）
             await self.memory_service.store_memory(
                 content=memory_content,
                 user_id=request.user_id,
                 conversation_id=request.conversation_id,
-                memory_type=memory_type,
+                memory_type=None,
                 importance=importance,
                 metadata={
                     "mode": mode.value,
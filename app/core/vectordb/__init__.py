@@ -4,18 +4,27 @@
 该模块实现了基于FAISS的向量存储和检索功能，包括：
 - 向量存储基类
 - 记忆向量存储
+- 向量分片（墓碑与压缩、按用户/会话分区）
+- 向量存储工厂
+- 更换模型时的批量重新向量化
 - FAISS持久化
 - 元数据管理
 """
 
 from .base_store import BaseVectorStore
 from .memory_vector_store import MemoryVectorStore
+from .vector_shard import VectorShard
+from .factory import create_memory_vector_store
+from .reembed_job import ReembedJob
 from .persistence.faiss_persister import FAISSPersister
 from .persistence.metadata_manager import MetadataManager
 
 __all__ = [
     "BaseVectorStore",
     "MemoryVectorStore",
+    "VectorShard",
+    "create_memory_vector_store",
+    "ReembedJob",
     "FAISSPersister",
     "MetadataManager"
 ]
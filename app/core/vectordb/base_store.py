@@ -70,6 +70,30 @@ class BaseVectorStore(ABC):
         """
         pass
     
+    async def search_batch(
+        self,
+        query_vectors: np.ndarray,
+        top_k: int = 5,
+        filter_metadata: Optional[Dict[str, Any]] = None
+    ) -> List[List[Tuple[int, float, Dict[str, Any]]]]:
+        """
+        批量搜索相似向量
+        
+        默认逐个调用 search()；支持矩阵查询的实现应重写为一次搜索。
+        
+        Args:
+            query_vectors: 查询向量矩阵，形状为 (n, dimension)
+            top_k: 每个查询返回前k个结果
+            filter_metadata: 元数据过滤条件（对所有查询生效）
+            
+        Returns:
+            List[List[Tuple[int, float, Dict[str, Any]]]]: 每个查询的搜索结果
+        """
+        return [
+            await self.search(query_vector, top_k, filter_metadata)
+            for query_vector in query_vectors
+        ]
+    
     @abstractmethod
     async def remove_vector(self, vector_id: int) -> bool:
         """
@@ -0,0 +1,54 @@
+"""
+文件名: factory.py
+功能: 向量存储工厂，根据配置创建记忆向量存储
+"""
+
+from typing import Optional
+
+from app.core.vectordb.memory_vector_store import MemoryVectorStore
+from app.utils.config import config
+from app.utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+
+def create_memory_vector_store(embedding_service, persist_dir: Optional[str] = None) -> MemoryVectorStore:
+    """
+    创建记忆向量存储（工厂函数）
+    
+    从配置文件的 vector_store 段读取索引类型、升级阈值、召回参数、量化、分区、压缩和快照参数。
+    
+    参数:
+        embedding_service: 向量化服务
+        persist_dir (str, optional): 持久化目录，覆盖配置中的目录
+    
+    返回:
+        MemoryVectorStore: 记忆向量存储实例
+    
+    示例:
+        >>> store = create_memory_vector_store(embedding_service)
+    """
+    store_config = config.get("vector_store", {}) or {}
+    
+    store = MemoryVectorStore(
+        embedding_service,
+        persist_dir or store_config.get("persist_dir", "./data/vectors/memory"),
+        index_type=store_config.get("index_type", "Flat"),
+        nlist=store_config.get("nlist", 100),
+        compaction_threshold=store_config.get("compaction_threshold", 0.2),
+        partition_key=store_config.get("partition_key"),
+        max_resident_shards=store_config.get("max_resident_shards", 64),
+        promotion_threshold=store_config.get("promotion_threshold", 10000),
+        nprobe=store_config.get("nprobe", 16),
+        ef_search=store_config.get("ef_search", 64),
+        hnsw_m=store_config.get("hnsw_m", 32),
+        quantization=store_config.get("quantization"),
+        pq_m=store_config.get("pq_m"),
+        rerank_factor=store_config.get("rerank_factor", 4),
+        snapshot_interval=store_config.get("snapshot_interval", 10000),
+        wal_sync=store_config.get("wal_sync", True),
+        mmap_indices=store_config.get("mmap_indices", False)
+    )
+    
+    logger.info(f"记忆向量存储已创建: 分区字段={store.partition_key}")
+    return store
@@ -6,7 +6,10 @@
 
 import logging
 import asyncio
-from typing import Dict, List, Optional, Any, Tuple
+from collections import OrderedDict
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Any, Set, Tuple, Union
 import numpy as np
 
 try:
@@ -15,11 +18,36 @@ except ImportError:
     faiss = None
 
 from .base_store import BaseVectorStore
+from .vector_shard import VectorShard
 from .persistence.faiss_persister import FAISSPersister
 from .persistence.metadata_manager import MetadataManager
+from .persistence.raw_vector_file import RawVectorFile
+from .persistence.write_ahead_log import OP_ADD, OP_REMOVE, WriteAheadLog
 
 logger = logging.getLogger(__name__)
 
+# 每个分区内的分片桶（非短期记忆均存入长期分片）
+SHARD_BUCKETS = ("short_term", "long_term")
+
+# 缺少分区字段的向量所在的分区
+DEFAULT_PARTITION = "default"
+
+# 支持的目标索引类型
+INDEX_TYPES = ("Flat", "IVFFlat", "HNSW")
+
+# 支持的量化方式
+QUANTIZATIONS = (None, "SQ8", "PQ")
+
+# 量化器训练最多使用的样本数
+QUANTIZER_MAX_TRAINING_POINTS = 65536
+
+# IVF训练时每个聚类中心至少需要的样本数，以及最多使用的样本数
+IVF_MIN_POINTS_PER_CENTROID = 39
+IVF_MAX_POINTS_PER_CENTROID = 256
+
+# PQ每个子量化器的聚类中心数（8位编码），训练样本不能少于该值
+PQ_CENTROIDS = 256
+
 
 class MemoryVectorStore(BaseVectorStore):
     """
@@ -27,6 +55,21 @@ class MemoryVectorStore(BaseVectorStore):
     
     基于FAISS实现的记忆向量存储和检索系统
     支持分层索引、增量更新、持久化和时间衰减检索
+    
+    可按 user_id / conversation_id 分区：每个分区拥有独立的短期/长期分片，
+    分片按需从磁盘加载，常驻内存的分片数量由LRU限制。
+    
+    分片总是以Flat索引起步，有效向量达到阈值后在后台用真实向量
+    训练/构建目标索引（IVFFlat 或 HNSW）并原子替换。
+    
+    可选SQ8/PQ量化：内存中只保留压缩编码，原始向量存放在磁盘文件中，
+    用于对候选结果精确重排序。
+    
+    每次增删先追加到预写日志，定期做原子快照并截断日志，
+    启动后首次访问时重放快照之后的日志。
+    
+    可选以只读内存映射方式加载分片：多个工作进程共享页缓存，
+    启动耗时与索引大小无关，分片首次写入时再复制为私有索引。
     """
     
     def __init__(
@@ -34,7 +77,20 @@ class MemoryVectorStore(BaseVectorStore):
         embedding_service,
         persist_dir: str,
         index_type: str = "Flat",
-        nlist: int = 100
+        nlist: int = 100,
+        compaction_threshold: float = 0.2,
+        partition_key: Optional[str] = None,
+        max_resident_shards: int = 64,
+        promotion_threshold: int = 10000,
+        nprobe: int = 16,
+        ef_search: int = 64,
+        hnsw_m: int = 32,
+        quantization: Optional[str] = None,
+        pq_m: Optional[int] = None,
+        rerank_factor: int = 4,
+        snapshot_interval: int = 10000,
+        wal_sync: bool = True,
+        mmap_indices: bool = False
     ):
         """
         初始化记忆向量存储
@@ -42,39 +98,96 @@ class MemoryVectorStore(BaseVectorStore):
         Args:
             embedding_service: 向量化服务
             persist_dir: 持久化目录
-            index_type: 索引类型 ("Flat" 或 "IVFFlat")
-            nlist: IVFFlat索引的聚类中心数量
+            index_type: 目标索引类型 ("Flat"、"IVFFlat" 或 "HNSW")
+            nlist: IVFFlat索引的最大聚类中心数量
+            compaction_threshold: 触发后台压缩的墓碑比例
+            partition_key: 分区字段（"user_id" 或 "conversation_id"，None表示不分区）
+            max_resident_shards: 常驻内存的最大分片数量
+            promotion_threshold: 分片从Flat升级为目标索引的有效向量数
+            nprobe: IVFFlat搜索时探测的聚类数（越大召回越高、越慢）
+            ef_search: HNSW搜索时的候选队列长度（越大召回越高、越慢）
+            hnsw_m: HNSW每个节点的邻居数
+            quantization: 量化方式（None、"SQ8" 或 "PQ"）
+            pq_m: PQ子量化器数量（需整除维度，默认约为维度的1/8）
+            rerank_factor: 量化索引取回 top_k * rerank_factor 个候选再精确重排序
+            snapshot_interval: 预写日志累计多少条记录后做一次快照
+            wal_sync: 预写日志每条记录是否fsync
+            mmap_indices: 是否以只读内存映射方式加载已持久化的分片
         """
         if faiss is None:
             raise ImportError(
                 "faiss-cpu库未安装。请运行: pip install faiss-cpu"
             )
         
+        if index_type not in INDEX_TYPES:
+            raise ValueError(f"不支持的索引类型: {index_type}")
+        if quantization not in QUANTIZATIONS:
+            raise ValueError(f"不支持的量化方式: {quantization}")
+        if index_type == "HNSW" and quantization == "PQ":
+            raise ValueError("HNSW索引仅支持SQ8量化")
+        
         self.embedding_service = embedding_service
         self.persist_dir = persist_dir
         self.index_type = index_type
         self.nlist = nlist
+        self.compaction_threshold = compaction_threshold
+        self.partition_key = partition_key
+        self.max_resident_shards = max(max_resident_shards, 1)
+        self.promotion_threshold = promotion_threshold
+        self.nprobe = nprobe
+        self.ef_search = ef_search
+        self.hnsw_m = hnsw_m
+        self.quantization = quantization
+        self.rerank_factor = rerank_factor
+        self.mmap_indices = mmap_indices
         
         # 持久化管理器
         self.persister = FAISSPersister(persist_dir)
         self.metadata_manager = MetadataManager(persist_dir)
         
-        # FAISS索引
-        self.short_term_index = None
-        self.long_term_index = None
+        # 预写日志：LSN从已持久化的快照继续递增
+        self.wal = WriteAheadLog(str(Path(persist_dir) / "vector_store.wal"), sync=wal_sync)
+        self.wal.advance_lsn(self.metadata_manager.wal_lsn)
+        self.snapshot_interval = snapshot_interval
+        
+        # 日志重放在首次访问时进行（构造函数中无法等待异步操作）
+        self._recovered = False
+        self._recovering = False
+        self._recovery_lock = asyncio.Lock()
+        
+        # 常驻内存的向量分片（按最近使用排序，超出上限时淘汰最久未用的）
+        self.shards: "OrderedDict[str, VectorShard]" = OrderedDict()
+        
+        # 磁盘上已持久化、可按需加载的分片
+        self._persisted_shards: Set[str] = set()
+        
+        # 分片加载锁：同一分片只加载一次
+        self._shard_load_lock = asyncio.Lock()
+        
+        # 正在运行的后台压缩任务
+        self._compaction_tasks: Dict[str, asyncio.Task] = {}
+        
+        # 正在运行的后台索引升级任务
+        self._promotion_tasks: Dict[str, asyncio.Task] = {}
+        
+        # 升级失败的分片：有效向量数达到该值前不再重试
+        self._promotion_retry_at: Dict[str, int] = {}
         
         # 索引配置
         self._dimension = embedding_service.dimension
-        self.save_interval = 100  # 每100个向量保存一次
+        self.pq_m = pq_m or self._default_pq_m(self._dimension)
+        if quantization == "PQ" and self._dimension % self.pq_m != 0:
+            raise ValueError(f"PQ子量化器数量必须整除维度: pq_m={self.pq_m}, 维度={self._dimension}")
         self.vector_count = 0
         
-        # 初始化索引
+        # 初始化索引（分片在首次使用时创建或加载）
         self._initialize_indices()
+        self._load_indices()
         
-        # 加载已存在的索引（在初始化时跳过，避免异步问题）
-        # self._load_indices()
-        
-        logger.info(f"记忆向量存储初始化完成: 维度={self.dimension}, 索引类型={index_type}")
+        logger.info(
+            f"记忆向量存储初始化完成: 维度={self.dimension}, 索引类型={index_type}, "
+            f"量化={quantization}, 分区字段={partition_key}"
+        )
     
     @property
     def dimension(self) -> int:
@@ -86,24 +199,181 @@ class MemoryVectorStore(BaseVectorStore):
         """
         return self._dimension
     
+    @property
+    def short_term_index(self) -> Optional['faiss.Index']:
+        """短期记忆索引"""
+        shard = self.shards.get("short_term")
+        return shard.index if shard else None
+    
+    @property
+    def long_term_index(self) -> Optional['faiss.Index']:
+        """长期记忆索引"""
+        shard = self.shards.get("long_term")
+        return shard.index if shard else None
+    
+    def _create_index(self) -> 'faiss.Index':
+        """
+        创建新分片的FAISS索引
+        
+        新分片总是使用Flat索引（精确搜索，无需训练），外包ID映射以支持删除和按ID取回；
+        数据量达到阈值后再升级为目标索引。
+        
+        Returns:
+            faiss.Index: 新索引
+        """
+        return faiss.IndexIDMap2(faiss.IndexFlatIP(self.dimension))
+    
+    @staticmethod
+    def _default_pq_m(dimension: int) -> int:
+        """
+        默认PQ子量化器数量：不超过维度1/8的最大约数（每个向量约 d/8 字节）
+        
+        Args:
+            dimension: 向量维度
+            
+        Returns:
+            int: 子量化器数量
+        """
+        for m in range(max(dimension // 8, 1), 0, -1):
+            if dimension % m == 0:
+                return m
+        return 1
+    
+    def _build_index(self, vector_ids: np.ndarray, vectors: np.ndarray) -> 'faiss.Index':
+        """
+        用真实向量构建目标类型的索引（同步方法，在线程池中执行）
+        
+        Args:
+            vector_ids: int64向量ID数组
+            vectors: float32向量矩阵
+            
+        Returns:
+            faiss.Index: 已训练并写入全部向量的索引
+        """
+        metric = faiss.METRIC_INNER_PRODUCT
+        sample_size = QUANTIZER_MAX_TRAINING_POINTS
+        
+        if self.index_type == "IVFFlat":
+            # 聚类中心数随数据量增长，保证每个中心有足够的训练样本
+            nlist = max(1, min(self.nlist, len(vectors) // IVF_MIN_POINTS_PER_CENTROID))
+            quantizer = faiss.IndexFlatIP(self.dimension)
+            if self.quantization == "SQ8":
+                index = faiss.IndexIVFScalarQuantizer(
+                    quantizer, self.dimension, nlist, faiss.ScalarQuantizer.QT_8bit, metric
+                )
+            elif self.quantization == "PQ":
+                index = faiss.IndexIVFPQ(quantizer, self.dimension, nlist, self.pq_m, 8, metric)
+            else:
+                index = faiss.IndexIVFFlat(quantizer, self.dimension, nlist, metric)
+                sample_size = nlist * IVF_MAX_POINTS_PER_CENTROID
+            # 哈希直接映射：支持按ID删除和取回
+            index.set_direct_map_type(faiss.DirectMap.Hashtable)
+            index.train(self._training_sample(vectors, sample_size))
+        elif self.index_type == "HNSW":
+            if self.quantization == "SQ8":
+                inner = faiss.IndexHNSWSQ(
+                    self.dimension, faiss.ScalarQuantizer.QT_8bit, self.hnsw_m, metric
+                )
+                inner.train(self._training_sample(vectors, sample_size))
+            else:
+                inner = faiss.IndexHNSWFlat(self.dimension, self.hnsw_m, metric)
+            index = faiss.IndexIDMap2(inner)
+        elif self.quantization == "SQ8":
+            inner = faiss.IndexScalarQuantizer(self.dimension, faiss.ScalarQuantizer.QT_8bit, metric)
+            inner.train(self._training_sample(vectors, sample_size))
+            index = faiss.IndexIDMap2(inner)
+        elif self.quantization == "PQ":
+            inner = faiss.IndexPQ(self.dimension, self.pq_m, 8, metric)
+            inner.train(self._training_sample(vectors, sample_size))
+            index = faiss.IndexIDMap2(inner)
+        else:
+            index = self._create_index()
+        
+        self._apply_search_params(index)
+        if len(vector_ids):
+            index.add_with_ids(vectors, vector_ids)
+        return index
+    
+    @staticmethod
+    def _training_sample(vectors: np.ndarray, max_samples: int) -> np.ndarray:
+        """
+        从真实向量中抽取训练样本
+        
+        Args:
+            vectors: float32向量矩阵
+            max_samples: 最多使用的样本数
+            
+        Returns:
+            np.ndarray: 训练样本
+        """
+        if len(vectors) <= max_samples:
+            return vectors
+        rng = np.random.default_rng(0)
+        return vectors[rng.choice(len(vectors), max_samples, replace=False)]
+    
+    def _new_shard(self, name: str, index: 'faiss.Index', mapped: bool = False) -> VectorShard:
+        """
+        创建分片（量化模式下附带原始向量文件）
+        
+        Args:
+            name: 分片名称
+            index: FAISS索引
+            mapped: 索引是否以内存映射方式加载
+            
+        Returns:
+            VectorShard: 向量分片
+        """
+        raw_vectors = None
+        if self.quantization is not None:
+            raw_vectors = RawVectorFile(str(Path(self.persist_dir) / f"{name}.vec"), self.dimension)
+        return VectorShard(
+            name, index, raw_vectors=raw_vectors, rerank_factor=self.rerank_factor, mapped=mapped
+        )
+    
+    def _apply_search_params(self, index: 'faiss.Index') -> None:
+        """
+        将召回/延迟参数（nprobe、efSearch）应用到索引
+        
+        Args:
+            index: FAISS索引
+        """
+        inner = VectorShard._inner_index(index)
+        if isinstance(inner, faiss.IndexIVF):
+            inner.nprobe = min(self.nprobe, inner.nlist)
+        elif isinstance(inner, faiss.IndexHNSW):
+            inner.hnsw.efSearch = self.ef_search
+    
+    def set_search_params(
+        self,
+        nprobe: Optional[int] = None,
+        ef_search: Optional[int] = None
+    ) -> None:
+        """
+        调整搜索的召回/延迟权衡，立即作用于常驻分片，换入的分片在加载时应用
+        
+        Args:
+            nprobe: IVFFlat探测的聚类数
+            ef_search: HNSW候选队列长度
+        """
+        if nprobe is not None:
+            self.nprobe = nprobe
+        if ef_search is not None:
+            self.ef_search = ef_search
+        
+        for shard in self.shards.values():
+            self._apply_search_params(shard.index)
+    
     def _initialize_indices(self) -> None:
         """
         初始化FAISS索引
+        
+        不分区时预先创建短期/长期分片；分区模式下分片在首次写入时创建。
         """
         try:
-            if self.index_type == "Flat":
-                # 使用Flat索引（精确搜索，适合小规模数据）
-                self.short_term_index = faiss.IndexFlatIP(self.dimension)
-                self.long_term_index = faiss.IndexFlatIP(self.dimension)
-                
-            elif self.index_type == "IVFFlat":
-                # 使用IVFFlat索引（近似搜索，适合大规模数据）
-                quantizer = faiss.IndexFlatIP(self.dimension)
-                self.short_term_index = faiss.IndexIVFFlat(quantizer, self.dimension, self.nlist)
-                self.long_term_index = faiss.IndexIVFFlat(quantizer, self.dimension, self.nlist)
-                
-            else:
-                raise ValueError(f"不支持的索引类型: {self.index_type}")
+            self.shards = OrderedDict()
+            if self.partition_key is None:
+                for bucket in SHARD_BUCKETS:
+                    self.shards[bucket] = self._new_shard(bucket, self._create_index())
             
             logger.info(f"FAISS索引初始化完成: 类型={self.index_type}")
             
@@ -111,25 +381,174 @@ class MemoryVectorStore(BaseVectorStore):
             logger.error(f"初始化FAISS索引失败: {e}")
             raise
     
+    def _shard_name(self, memory_type: str, partition_value: Any = None) -> str:
+        """
+        根据记忆类型和分区值确定分片名称
+        
+        Args:
+            memory_type: 记忆类型
+            partition_value: 分区字段的值
+            
+        Returns:
+            str: 分片名称（如 "short_term" 或 "user_id_42/long_term"）
+        """
+        bucket = "short_term" if memory_type == "short_term" else "long_term"
+        if self.partition_key is None:
+            return bucket
+        return f"{self._partition_prefix(partition_value)}/{bucket}"
+    
+    def _partition_prefix(self, partition_value: Any) -> str:
+        """
+        分区目录名称
+        
+        Args:
+            partition_value: 分区字段的值
+            
+        Returns:
+            str: 分区名称
+        """
+        value = DEFAULT_PARTITION if partition_value is None else partition_value
+        return f"{self.partition_key}_{value}"
+    
+    async def _acquire_shard(self, name: str, create: bool = True) -> Optional[VectorShard]:
+        """
+        获取分片：常驻时直接返回，否则从磁盘加载或新建，并按LRU淘汰
+        
+        Args:
+            name: 分片名称
+            create: 分片不存在时是否新建
+            
+        Returns:
+            Optional[VectorShard]: 分片，不存在且不新建时返回None
+        """
+        shard = self.shards.get(name)
+        if shard is not None:
+            self.shards.move_to_end(name)
+            return shard
+        
+        async with self._shard_load_lock:
+            shard = self.shards.get(name)
+            if shard is not None:
+                self.shards.move_to_end(name)
+                return shard
+            
+            index = None
+            if name in self._persisted_shards:
+                index = await self.persister.load_index(name, mmap=self.mmap_indices)
+            if index is None and not create:
+                return None
+            
+            if index is not None:
+                shard = self._new_shard(name, index, mapped=self.mmap_indices)
+            else:
+                shard = self._new_shard(name, self._create_index())
+            if index is not None:
+                self._apply_search_params(shard.index)
+                index_metadata = await self.persister.load_index_metadata(name) or {}
+                shard.applied_lsn = index_metadata.get("wal_lsn", 0)
+                # 重放日志期间元数据尚未追上，重放结束后再统一对齐
+                if not self._recovering:
+                    self._reconcile_shard(shard)
+            
+            self.shards[name] = shard
+            await self._evict_shards(keep=name)
+            return shard
+    
+    def _reconcile_shard(self, shard: VectorShard) -> None:
+        """
+        对齐加载的分片与元数据：磁盘上存在但已不在映射表中的向量记为墓碑
+        
+        Args:
+            shard: 刚加载的分片
+        """
+        stored = shard.stored_ids()
+        if stored.size == 0:
+            return
+        
+        live = self.metadata_manager.id_table(shard.name).ids
+        stale = np.setdiff1d(stored, live, assume_unique=True)
+        if stale.size:
+            shard.tombstones.update(int(vector_id) for vector_id in stale)
+            logger.info(f"分片 {shard.name} 加载后标记{stale.size}个过期向量")
+    
+    async def _evict_shards(self, keep: Optional[str] = None) -> None:
+        """
+        淘汰最久未使用的分片，直到常驻数量不超过上限
+        
+        正在写入、压缩或重建的分片不会被淘汰；有未保存写入的分片先落盘。
+        
+        Args:
+            keep: 本次不淘汰的分片名称
+        """
+        while len(self.shards) > self.max_resident_shards:
+            victim = next(
+                (
+                    shard for name, shard in self.shards.items()
+                    if name != keep and not shard.lock.locked() and not shard.rebuilding
+                ),
+                None
+            )
+            if victim is None:
+                break
+            
+            if victim.dirty or victim.tombstones:
+                if not await self._persist_shard(victim):
+                    break
+            
+            self.shards.pop(victim.name, None)
+            if victim.raw_vectors is not None:
+                victim.raw_vectors.close()
+            logger.debug(f"分片已换出内存: {victim.name}")
+    
+    async def _persist_shard(self, shard: VectorShard) -> bool:
+        """
+        压缩并保存单个分片
+        
+        Args:
+            shard: 向量分片
+            
+        Returns:
+            bool: 是否保存成功
+        """
+        # 先压缩掉墓碑，避免重新加载后已删除向量复活
+        if shard.tombstones:
+            await self._compact_shard(shard)
+        
+        if shard.ntotal > 0:
+            # 原始向量先落盘：重放日志时只会覆盖写，不会缺失
+            if shard.raw_vectors is not None:
+                shard.raw_vectors.save()
+            if not await self.persister.save_index(
+                shard.name, shard.index, metadata={"wal_lsn": shard.applied_lsn}
+            ):
+                return False
+            self._persisted_shards.add(shard.name)
+        elif shard.name in self._persisted_shards:
+            await self.persister.delete_index(shard.name)
+            self._persisted_shards.discard(shard.name)
+        
+        shard.dirty = False
+        return True
+    
     def _load_indices(self) -> None:
         """
-        加载已存在的索引
+        发现已存在的索引（分片在首次访问时再从磁盘加载）
         """
         try:
-            # 加载短期记忆索引
-            short_term_index = asyncio.run(self.persister.load_index("short_term"))
-            if short_term_index is not None:
-                self.short_term_index = short_term_index
-                logger.info("短期记忆索引已加载")
-            
-            # 加载长期记忆索引
-            long_term_index = asyncio.run(self.persister.load_index("long_term"))
-            if long_term_index is not None:
-                self.long_term_index = long_term_index
-                logger.info("长期记忆索引已加载")
+            self._persisted_shards = set(self.persister.scan_index_names())
+            
+            # 已持久化的分片改为按需加载
+            for name in self._persisted_shards:
+                shard = self.shards.get(name)
+                if shard is not None and shard.ntotal == 0:
+                    self.shards.pop(name)
+                    if shard.raw_vectors is not None:
+                        shard.raw_vectors.close()
             
             # 更新向量计数
-            self.vector_count = self.metadata_manager.get_stats().get("total_vectors", 0)
+            self.vector_count = len(self.metadata_manager)
+            
+            logger.info(f"发现已持久化分片: {len(self._persisted_shards)}个")
             
         except Exception as e:
             logger.error(f"加载索引失败: {e}")
@@ -138,7 +557,8 @@ class MemoryVectorStore(BaseVectorStore):
         self,
         vector_id: int,
         vector: np.ndarray,
-        metadata: Dict[str, Any]
+        metadata: Dict[str, Any],
+        created_at: Optional[str] = None
     ) -> bool:
         """
         添加向量到存储
@@ -147,6 +567,7 @@ class MemoryVectorStore(BaseVectorStore):
             vector_id: 向量ID
             vector: 向量数据
             metadata: 元数据
+            created_at: 创建时间（ISO格式，None表示当前时间；迁移时保留原时间）
             
         Returns:
             bool: 是否添加成功
@@ -160,37 +581,33 @@ class MemoryVectorStore(BaseVectorStore):
             # 确保向量是float32类型
             vector = vector.astype(np.float32).reshape(1, -1)
             
-            # 获取记忆类型
-            memory_type = metadata.get("memory_type", "short_term")
+            await self._ensure_recovered()
             
-            # 选择索引
-            if memory_type == "short_term":
-                index = self.short_term_index
-            else:
-                index = self.long_term_index
-            
-            # 训练索引（如果需要）
-            if not index.is_trained and self.index_type == "IVFFlat":
-                # 对于IVFFlat索引，需要先训练
-                if index.ntotal == 0:
-                    # 使用当前向量进行训练
-                    index.train(vector)
-                else:
-                    # 如果已有数据，使用现有数据训练
-                    existing_vectors = np.random.randn(1000, self.dimension).astype(np.float32)
-                    index.train(existing_vectors)
+            # 获取记忆类型和分区
+            memory_type = metadata.get("memory_type", "short_term")
+            partition_value = metadata.get(self.partition_key) if self.partition_key else None
             
-            # 添加向量到索引
-            index.add(vector)
+            # 重复添加视为更新：先删除旧向量
+            if self.metadata_manager.exists(vector_id):
+                await self.remove_vector(vector_id)
             
-            # 保存元数据
-            self.metadata_manager.add(vector_id, memory_type, metadata)
+            # 先写预写日志，再修改内存状态
+            payload = {
+                "memory_type": memory_type,
+                "index_name": self._shard_name(memory_type, partition_value),
+                "created_at": created_at or datetime.utcnow().isoformat(),
+                "metadata": metadata
+            }
+            # 按LSN顺序应用，再等待日志成组落盘（fsync不阻塞事件循环）
+            lsn = self.wal.append(OP_ADD, vector_id, payload, vector)
+            await self._apply_add(lsn, vector_id, vector, payload)
+            await self.wal.wait_durable(lsn)
             
             # 更新计数
             self.vector_count += 1
             
-            # 定期保存
-            if self.vector_count % self.save_interval == 0:
+            # 日志累计到一定数量后做快照
+            if self.wal.record_count >= self.snapshot_interval:
                 await self.save()
             
             logger.debug(f"向量已添加: ID={vector_id}, 类型={memory_type}")
@@ -200,6 +617,114 @@ class MemoryVectorStore(BaseVectorStore):
             logger.error(f"添加向量失败: {e}")
             return False
     
+    async def _apply_add(
+        self,
+        lsn: int,
+        vector_id: int,
+        vector: np.ndarray,
+        payload: Dict[str, Any]
+    ) -> None:
+        """
+        应用添加操作（正常写入与日志重放共用）
+        
+        分片和元数据各自记录已应用的LSN，只应用尚未包含的操作。
+        
+        Args:
+            lsn: 日志序号
+            vector_id: 向量ID
+            vector: float32向量，形状为 (1, dimension)
+            payload: 日志附加数据（记忆类型、分片名称、创建时间、元数据）
+        """
+        shard_name = payload["index_name"]
+        
+        # 获取分片并加锁；若在等待锁期间分片被换出，则重新获取
+        while True:
+            shard = await self._acquire_shard(shard_name)
+            await shard.lock.acquire()
+            if self.shards.get(shard_name) is shard:
+                break
+            shard.lock.release()
+        
+        try:
+            if lsn > shard.applied_lsn:
+                # 以向量ID为标签添加到索引
+                shard.add(np.array([vector_id], dtype=np.int64), vector)
+                shard.applied_lsn = lsn
+        finally:
+            shard.lock.release()
+        
+        # 数据量达到阈值后在后台升级索引类型
+        if self._needs_promotion(shard):
+            self._schedule_promotion(shard)
+        
+        # 保存元数据
+        if lsn > self.metadata_manager.wal_lsn:
+            self.metadata_manager.add(
+                vector_id,
+                payload["memory_type"],
+                payload["metadata"],
+                index_name=shard_name,
+                created_at=payload.get("created_at")
+            )
+    
+    async def _apply_remove(self, lsn: int, vector_id: int, index_name: str) -> None:
+        """
+        应用删除操作（正常写入与日志重放共用）
+        
+        Args:
+            lsn: 日志序号
+            vector_id: 向量ID
+            index_name: 向量所在分片名称
+        """
+        shard = await self._acquire_shard(index_name, create=False)
+        
+        # 记录墓碑，物理删除由后台压缩批量完成
+        if shard is not None and lsn > shard.applied_lsn:
+            shard.remove(vector_id)
+            shard.applied_lsn = lsn
+        if lsn > self.metadata_manager.wal_lsn:
+            self.metadata_manager.remove(vector_id)
+        
+        # 墓碑比例超过阈值时触发后台压缩
+        if shard is not None and shard.tombstone_ratio >= self.compaction_threshold:
+            self._schedule_compaction(shard)
+    
+    async def _ensure_recovered(self) -> None:
+        """
+        首次访问时重放预写日志中快照之后的记录
+        """
+        if self._recovered:
+            return
+        
+        async with self._recovery_lock:
+            if self._recovered:
+                return
+            
+            replayed = 0
+            self._recovering = True
+            try:
+                for record in self.wal.records():
+                    if record.op == OP_ADD:
+                        vector = record.vector.reshape(1, -1)
+                        await self._apply_add(record.lsn, record.vector_id, vector, record.payload)
+                    elif record.op == OP_REMOVE:
+                        await self._apply_remove(
+                            record.lsn, record.vector_id, record.payload["index_name"]
+                        )
+                    replayed += 1
+            finally:
+                self._recovering = False
+            
+            # 元数据已是最新，对齐重放期间加载的分片
+            for shard in self.shards.values():
+                self._reconcile_shard(shard)
+            
+            self.vector_count = len(self.metadata_manager)
+            self._recovered = True
+            
+            if replayed:
+                logger.info(f"预写日志重放完成: {replayed}条记录")
+    
     async def search(
         self,
         query_vector: np.ndarray,
@@ -217,130 +742,204 @@ class MemoryVectorStore(BaseVectorStore):
         Returns:
             List[Tuple[int, float, Dict[str, Any]]]: [(vector_id, similarity_score, metadata), ...]
         """
-        try:
-            # 验证查询向量
-            if query_vector.shape[0] != self.dimension:
-                logger.error(f"查询向量维度不匹配: 期望={self.dimension}, 实际={query_vector.shape[0]}")
-                return []
-            
-            # 确保向量是float32类型
-            query_vector = query_vector.astype(np.float32).reshape(1, -1)
-            
-            # 搜索两个索引
-            all_results = []
-            
-            # 搜索短期记忆
-            if self.short_term_index.ntotal > 0:
-                short_results = await self._search_index(
-                    self.short_term_index, 
-                    query_vector, 
-                    top_k, 
-                    "short_term"
-                )
-                all_results.extend(short_results)
-            
-            # 搜索长期记忆
-            if self.long_term_index.ntotal > 0:
-                long_results = await self._search_index(
-                    self.long_term_index, 
-                    query_vector, 
-                    top_k, 
-                    "long_term"
-                )
-                all_results.extend(long_results)
-            
-            # 按相似度排序
-            all_results.sort(key=lambda x: x[1], reverse=True)
-            
-            # 应用元数据过滤
-            if filter_metadata:
-                filtered_results = []
-                for vector_id, score, metadata in all_results:
-                    if self._matches_filter(metadata, filter_metadata):
-                        filtered_results.append((vector_id, score, metadata))
-                all_results = filtered_results
-            
-            # 返回top_k结果
-            return all_results[:top_k]
-            
-        except Exception as e:
-            logger.error(f"搜索向量失败: {e}")
+        # 验证查询向量
+        if query_vector.shape[0] != self.dimension:
+            logger.error(f"查询向量维度不匹配: 期望={self.dimension}, 实际={query_vector.shape[0]}")
             return []
+        
+        results = await self.search_batch(query_vector.reshape(1, -1), top_k, filter_metadata)
+        return results[0] if results else []
     
-    async def _search_index(
+    async def search_batch(
         self,
-        index: 'faiss.Index',
-        query_vector: np.ndarray,
-        top_k: int,
-        memory_type: str
-    ) -> List[Tuple[int, float, Dict[str, Any]]]:
+        query_vectors: np.ndarray,
+        top_k: int = 5,
+        filter_metadata: Optional[Dict[str, Any]] = None
+    ) -> List[List[Tuple[int, float, Dict[str, Any]]]]:
         """
-        在指定索引中搜索
+        批量搜索相似向量
+        
+        每个分片对整个查询矩阵只做一次FAISS搜索，所有命中的元数据一次批量读取。
         
         Args:
-            index: FAISS索引
-            query_vector: 查询向量
-            top_k: 返回前k个结果
-            memory_type: 记忆类型
+            query_vectors: 查询向量矩阵，形状为 (n, dimension)
+            top_k: 每个查询返回前k个结果
+            filter_metadata: 元数据过滤条件（对所有查询生效）
             
         Returns:
-            List[Tuple[int, float, Dict[str, Any]]]: 搜索结果
+            List[List[Tuple[int, float, Dict[str, Any]]]]: 每个查询的 [(vector_id, similarity_score, metadata), ...]
         """
         try:
-            # 执行搜索
-            distances, indices = index.search(query_vector, min(top_k, index.ntotal))
+            # 确保查询矩阵是连续的float32
+            query_vectors = np.ascontiguousarray(query_vectors, dtype=np.float32)
+            if query_vectors.ndim != 2 or query_vectors.shape[1] != self.dimension:
+                logger.error(f"查询向量维度不匹配: 期望=(n, {self.dimension}), 实际={query_vectors.shape}")
+                return []
+            if len(query_vectors) == 0:
+                return []
             
-            results = []
-            for i, (distance, idx) in enumerate(zip(distances[0], indices[0])):
-                if idx == -1:  # FAISS返回-1表示无效结果
-                    continue
+            await self._ensure_recovered()
+            
+            # 分区和记忆类型先用来挑选分片，其余条件下推到索引内部
+            shard_names = self._candidate_shards(filter_metadata)
+            residual_filter = self._residual_filter(filter_metadata)
+            
+            # 过滤条件下推：先求出范围内的向量ID，再在索引内部按ID选择
+            allowed_ids = None
+            if residual_filter:
+                matched = self.metadata_manager.match_ids(residual_filter)
+                if not matched:
+                    return [[] for _ in range(len(query_vectors))]
+                allowed_ids = np.fromiter(matched, dtype=np.int64, count=len(matched))
+            
+            all_hits: List[List[Tuple[int, float]]] = [[] for _ in range(len(query_vectors))]
+            
+            # 只搜索范围内且有有效向量的分片
+            for name in shard_names:
+                shard_allowed = None
+                if allowed_ids is not None:
+                    shard_allowed = np.intersect1d(
+                        allowed_ids,
+                        self.metadata_manager.id_table(name).ids,
+                        assume_unique=True
+                    )
+                    if shard_allowed.size == 0:
+                        continue
                 
-                # 获取向量ID
-                vector_id = self.metadata_manager._index_to_id.get(idx)
-                if vector_id is None:
+                shard = await self._acquire_shard(name, create=False)
+                if shard is None or shard.live_count == 0:
                     continue
                 
-                # 获取元数据
-                metadata_record = self.metadata_manager.get(vector_id)
-                if metadata_record is None:
-                    continue
-                
-                # 计算相似度分数（FAISS返回的是距离，需要转换为相似度）
-                similarity_score = float(distance)
-                
-                results.append((vector_id, similarity_score, metadata_record["metadata"]))
+                shard_hits = await self._search_index(
+                    shard,
+                    query_vectors,
+                    top_k,
+                    allowed_ids=shard_allowed
+                )
+                for hits, found in zip(all_hits, shard_hits):
+                    hits.extend(found)
             
-            return results
+            # 按相似度排序，每个查询保留top_k结果
+            for hits in all_hits:
+                hits.sort(key=lambda x: x[1], reverse=True)
+                del hits[top_k:]
+            
+            # 所有查询命中的元数据一次读取
+            records = self.metadata_manager.get_many(
+                {vector_id for hits in all_hits for vector_id, _ in hits}
+            )
+            return [
+                [
+                    (vector_id, score, records[vector_id].metadata)
+                    for vector_id, score in hits
+                    if vector_id in records
+                ]
+                for hits in all_hits
+            ]
             
         except Exception as e:
-            logger.error(f"索引搜索失败: {e}")
+            logger.error(f"批量搜索向量失败: {e}")
             return []
     
-    def _matches_filter(
+    def _candidate_shards(self, filter_metadata: Optional[Dict[str, Any]]) -> List[str]:
+        """
+        根据过滤条件中的分区字段和记忆类型挑选需要搜索的分片
+        
+        Args:
+            filter_metadata: 元数据过滤条件
+            
+        Returns:
+            List[str]: 分片名称列表
+        """
+        names = self.metadata_manager.index_names()
+        if not filter_metadata:
+            return names
+        
+        if "memory_type" in filter_metadata:
+            buckets = {
+                self._shard_name(memory_type).rsplit("/", 1)[-1]
+                for memory_type in self._as_values(filter_metadata["memory_type"])
+            }
+            names = [name for name in names if name.rsplit("/", 1)[-1] in buckets]
+        
+        if self.partition_key and self.partition_key in filter_metadata:
+            prefixes = {
+                self._partition_prefix(value)
+                for value in self._as_values(filter_metadata[self.partition_key])
+            }
+            names = [name for name in names if name.rsplit("/", 1)[0] in prefixes]
+        
+        return names
+    
+    def _residual_filter(self, filter_metadata: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+        """
+        去掉已由分片选择满足的过滤条件
+        
+        Args:
+            filter_metadata: 元数据过滤条件
+            
+        Returns:
+            Dict[str, Any]: 仍需按向量ID过滤的条件
+        """
+        if not filter_metadata:
+            return {}
+        
+        residual = dict(filter_metadata)
+        if self.partition_key:
+            residual.pop(self.partition_key, None)
+        
+        # 短期分片只包含短期记忆，无需再按类型过滤
+        if set(self._as_values(residual.get("memory_type", []))) == {"short_term"}:
+            residual.pop("memory_type")
+        
+        return residual
+    
+    @staticmethod
+    def _as_values(value: Any) -> List[Any]:
+        """
+        将过滤值统一为列表
+        
+        Args:
+            value: 单个值或值列表
+            
+        Returns:
+            List[Any]: 值列表
+        """
+        return list(value) if isinstance(value, (list, tuple, set)) else [value]
+    
+    async def _search_index(
         self,
-        metadata: Dict[str, Any],
-        filter_metadata: Dict[str, Any]
-    ) -> bool:
+        shard: VectorShard,
+        query_vectors: np.ndarray,
+        top_k: int,
+        allowed_ids: Optional[np.ndarray] = None
+    ) -> List[List[Tuple[int, float]]]:
         """
-        检查元数据是否匹配过滤条件
+        在指定分片中搜索
         
         Args:
-            metadata: 元数据
-            filter_metadata: 过滤条件
+            shard: 向量分片
+            query_vectors: 查询向量矩阵
+            top_k: 每个查询返回前k个结果
+            allowed_ids: 允许返回的向量ID（None表示不限制）
             
         Returns:
-            bool: 是否匹配
+            List[List[Tuple[int, float]]]: 每个查询的 [(vector_id, similarity_score), ...]
         """
         try:
-            for key, value in filter_metadata.items():
-                if key not in metadata:
-                    return False
-                if metadata[key] != value:
-                    return False
-            return True
+            # 执行搜索（FAISS标签即向量ID，过滤条件与墓碑在索引内部处理）
+            results = shard.search(query_vectors, top_k, allowed_ids=allowed_ids)
+            id_table = self.metadata_manager.id_table(shard.name)
+            
+            # 只接受仍登记在该索引映射表中的向量（内积即相似度）
+            return [
+                [(vector_id, score) for vector_id, score in hits if vector_id in id_table]
+                for hits in results
+            ]
+            
         except Exception as e:
-            logger.error(f"元数据过滤失败: {e}")
-            return False
+            logger.error(f"索引搜索失败: {e}")
+            return [[] for _ in range(len(query_vectors))]
     
     async def remove_vector(self, vector_id: int) -> bool:
         """
@@ -353,25 +952,19 @@ class MemoryVectorStore(BaseVectorStore):
             bool: 是否删除成功
         """
         try:
-            # 获取元数据
-            metadata_record = self.metadata_manager.get(vector_id)
+            await self._ensure_recovered()
+            
+            # 获取常驻记录（删除不需要读取元数据正文）
+            metadata_record = self.metadata_manager.get_record(vector_id)
             if metadata_record is None:
                 logger.warning(f"向量ID不存在: {vector_id}")
                 return False
             
-            # 获取索引位置
-            index_position = metadata_record["index_position"]
-            memory_type = metadata_record["memory_type"]
-            
-            # 选择索引
-            if memory_type == "short_term":
-                index = self.short_term_index
-            else:
-                index = self.long_term_index
-            
-            # 注意：FAISS不支持直接删除向量，这里只是从元数据中移除
-            # 实际的向量仍然在索引中，但不会被搜索到
-            self.metadata_manager.remove(vector_id)
+            # 先写预写日志，再修改内存状态
+            index_name = metadata_record.index_name
+            lsn = self.wal.append(OP_REMOVE, vector_id, {"index_name": index_name})
+            await self._apply_remove(lsn, vector_id, index_name)
+            await self.wal.wait_durable(lsn)
             
             # 更新计数
             self.vector_count -= 1
@@ -422,14 +1015,17 @@ class MemoryVectorStore(BaseVectorStore):
             Optional[Tuple[np.ndarray, Dict[str, Any]]]: (向量, 元数据) 或 None
         """
         try:
+            await self._ensure_recovered()
+            
             # 获取元数据
             metadata_record = self.metadata_manager.get(vector_id)
             if metadata_record is None:
                 return None
             
-            # 注意：FAISS不支持直接通过ID获取向量
-            # 这里返回None，实际应用中可能需要额外的存储机制
-            return None, metadata_record["metadata"]
+            # ID映射索引支持按ID取回向量
+            shard = await self._acquire_shard(metadata_record.index_name, create=False)
+            vector = shard.reconstruct(vector_id) if shard is not None else None
+            return vector, metadata_record.metadata
             
         except Exception as e:
             logger.error(f"获取向量失败: {e}")
@@ -443,14 +1039,39 @@ class MemoryVectorStore(BaseVectorStore):
             Dict[str, Any]: 统计信息
         """
         try:
+            await self._ensure_recovered()
+            
             # 获取元数据统计
             metadata_stats = self.metadata_manager.get_stats()
             
-            # 获取索引统计
+            # 获取索引统计（有效向量数来自映射表，无需加载分片）
+            bucket_counts = {bucket: 0 for bucket in SHARD_BUCKETS}
+            partitions = set()
+            for name in self.metadata_manager.index_names():
+                partition, _, bucket = name.rpartition("/")
+                bucket_counts[bucket] += len(self.metadata_manager.id_table(name))
+                partitions.add(partition)
+            
+            tombstones = {bucket: 0 for bucket in SHARD_BUCKETS}
+            for name, shard in self.shards.items():
+                tombstones[name.rsplit("/", 1)[-1]] += len(shard.tombstones)
+            
             index_stats = {
-                "short_term_vectors": self.short_term_index.ntotal if self.short_term_index else 0,
-                "long_term_vectors": self.long_term_index.ntotal if self.long_term_index else 0,
+                "index_kinds": {name: shard.index_kind for name, shard in self.shards.items()},
+                "quantization": self.quantization,
+                "promotion_threshold": self.promotion_threshold,
+                "short_term_vectors": bucket_counts["short_term"],
+                "long_term_vectors": bucket_counts["long_term"],
+                "short_term_tombstones": tombstones["short_term"],
+                "long_term_tombstones": tombstones["long_term"],
                 "total_vectors": self.vector_count,
+                "partition_key": self.partition_key,
+                "partitions": len(partitions),
+                "resident_shards": len(self.shards),
+                "persisted_shards": len(self._persisted_shards),
+                "mapped_shards": sum(1 for shard in self.shards.values() if shard.mapped),
+                "wal_records": self.wal.record_count,
+                "wal_bytes": self.wal.size_bytes,
                 "index_type": self.index_type,
                 "dimension": self.dimension
             }
@@ -466,23 +1087,34 @@ class MemoryVectorStore(BaseVectorStore):
     
     async def save(self) -> bool:
         """
-        保存存储到磁盘
+        保存快照到磁盘并截断预写日志
+        
+        只重写有改动的分片；每个文件先写临时文件再原子替换。
         
         Returns:
             bool: 是否保存成功
         """
         try:
-            # 保存索引
-            if self.short_term_index and self.short_term_index.ntotal > 0:
-                await self.persister.save_index("short_term", self.short_term_index)
+            await self._ensure_recovered()
             
-            if self.long_term_index and self.long_term_index.ntotal > 0:
-                await self.persister.save_index("long_term", self.long_term_index)
+            # 快照覆盖到此LSN为止的全部操作，之后的操作留在日志中
+            snapshot_lsn = self.wal.last_lsn
+            
+            # 保存常驻分片（未加载的分片磁盘上已是最新）
+            for shard in list(self.shards.values()):
+                if shard.dirty or shard.tombstones or shard.name not in self._persisted_shards:
+                    if not await self._persist_shard(shard):
+                        logger.error(f"保存分片失败，保留预写日志: {shard.name}")
+                        return False
             
             # 保存元数据
-            self.metadata_manager.save()
+            if not self.metadata_manager.save(wal_lsn=snapshot_lsn):
+                return False
+            
+            await self.wal.flush()
+            self.wal.truncate_through(snapshot_lsn)
             
-            logger.info("向量存储已保存到磁盘")
+            logger.info(f"向量存储快照已保存: LSN={snapshot_lsn}")
             return True
             
         except Exception as e:
@@ -513,11 +1145,22 @@ class MemoryVectorStore(BaseVectorStore):
             bool: 是否清空成功
         """
         try:
-            # 重新初始化索引
+            await self._ensure_recovered()
+            
+            # 重新初始化索引并删除已持久化的分片
+            for shard in self.shards.values():
+                if shard.raw_vectors is not None:
+                    shard.raw_vectors.close()
+            for name in list(self._persisted_shards):
+                await self.persister.delete_index(name)
+            self._persisted_shards.clear()
             self._initialize_indices()
             
-            # 清空元数据
+            # 清空元数据，并以空快照截断预写日志（等待进行中的fsync后不再让出事件循环）
+            await self.wal.flush()
             self.metadata_manager.clear()
+            self.metadata_manager.save(wal_lsn=self.wal.last_lsn)
+            self.wal.truncate_through(self.wal.last_lsn)
             
             # 重置计数
             self.vector_count = 0
@@ -534,7 +1177,8 @@ class MemoryVectorStore(BaseVectorStore):
         memory_id: int,
         content: str,
         memory_type: str,
-        metadata: Dict[str, Any]
+        metadata: Dict[str, Any],
+        vector: Optional[np.ndarray] = None
     ) -> bool:
         """
         添加记忆到向量存储
@@ -544,13 +1188,15 @@ class MemoryVectorStore(BaseVectorStore):
             content: 记忆内容
             memory_type: 记忆类型
             metadata: 元数据
+            vector: 已计算好的向量（为None时向量化内容）
             
         Returns:
             bool: 是否添加成功
         """
         try:
             # 向量化内容
-            vector = await self.embedding_service.embed_text(content)
+            if vector is None:
+                vector = await self.embedding_service.embed_text(content)
             
             # 添加元数据
             memory_metadata = {
@@ -566,21 +1212,97 @@ class MemoryVectorStore(BaseVectorStore):
             logger.error(f"添加记忆到向量存储失败: {e}")
             return False
     
+    async def rebuild_from_rows(self, chunks: Iterable[List[Any]]) -> int:
+        """
+        从数据库中保存的向量嵌入重建索引（不做模型推理）
+        
+        清空现有向量后逐块批量写入分片，不写预写日志，结束时保存快照；
+        中途失败可以重新执行。
+        
+        Args:
+            chunks: 行块序列（如 MemoryDAO.iter_embedding_chunks），每行含 id、conversation_id、
+                memory_type、content、memory_metadata、created_at、embedding
+            
+        Returns:
+            int: 重建的向量数，失败时返回-1
+        """
+        # 行来自数据库，此时才导入ORM模型（避免导入向量存储时创建数据库引擎）
+        from app.models.memory import MemoryStore
+        
+        try:
+            if not await self.clear():
+                return -1
+            
+            rebuilt = 0
+            skipped = 0
+            for rows in chunks:
+                by_shard: Dict[str, List[Tuple[int, np.ndarray]]] = {}
+                for row in rows:
+                    vector = MemoryStore.decode_embedding(row.embedding, self.dimension)
+                    if vector is None:
+                        skipped += 1
+                        continue
+                    
+                    metadata = {
+                        **(row.memory_metadata or {}),
+                        "memory_type": row.memory_type,
+                        "content": row.content,
+                        "conversation_id": row.conversation_id
+                    }
+                    partition_value = metadata.get(self.partition_key) if self.partition_key else None
+                    shard_name = self._shard_name(row.memory_type, partition_value)
+                    by_shard.setdefault(shard_name, []).append((row.id, vector))
+                    self.metadata_manager.add(
+                        row.id,
+                        row.memory_type,
+                        metadata,
+                        index_name=shard_name,
+                        created_at=row.created_at.isoformat() if row.created_at else None
+                    )
+                
+                for shard_name, items in by_shard.items():
+                    shard = await self._acquire_shard(shard_name)
+                    async with shard.lock:
+                        shard.add(
+                            np.array([vector_id for vector_id, _ in items], dtype=np.int64),
+                            np.stack([vector for _, vector in items])
+                        )
+                    if self._needs_promotion(shard):
+                        self._schedule_promotion(shard)
+                    rebuilt += len(items)
+                
+                # 让出事件循环
+                await asyncio.sleep(0)
+            
+            self.vector_count = len(self.metadata_manager)
+            await asyncio.gather(*self._promotion_tasks.values(), return_exceptions=True)
+            if not await self.save():
+                return -1
+            
+            logger.info(f"已从数据库重建向量索引: {rebuilt}条, 跳过维度不符的{skipped}条")
+            return rebuilt
+            
+        except Exception as e:
+            logger.error(f"从数据库重建向量索引失败: {e}")
+            return -1
+    
     async def search_memories(
         self,
         query: str,
-        memory_type: Optional[str] = None,
+        memory_type: Optional[Union[str, List[str]]] = None,
         top_k: int = 5,
-        time_decay: bool = True
+        time_decay: bool = True,
+        conversation_id: Optional[int] = None
     ) -> List[Tuple[int, float]]:
         """
         搜索记忆
         
         Args:
             query: 查询文本
-            memory_type: 记忆类型过滤
+            memory_type: 记忆类型过滤（单个类型或类型列表）
             top_k: 返回前k个结果
             time_decay: 是否应用时间衰减
+            conversation_id: 会话ID过滤
             
         Returns:
             List[Tuple[int, float]]: [(memory_id, similarity_score), ...]
@@ -589,28 +1311,95 @@ class MemoryVectorStore(BaseVectorStore):
             # 向量化查询
             query_vector = await self.embedding_service.embed_text(query)
             
-            # 构建过滤条件
-            filter_metadata = {}
-            if memory_type:
-                filter_metadata["memory_type"] = memory_type
+            results = await self._search_memory_vectors(
+                query_vector.reshape(1, -1), memory_type, top_k, time_decay, conversation_id
+            )
+            return results[0] if results else []
             
-            # 搜索向量
-            results = await self.search(
-                query_vector=query_vector,
-                top_k=top_k,
-                filter_metadata=filter_metadata if filter_metadata else None
+        except Exception as e:
+            logger.error(f"搜索记忆失败: {e}")
+            return []
+    
+    async def search_memories_batch(
+        self,
+        queries: List[str],
+        memory_type: Optional[Union[str, List[str]]] = None,
+        top_k: int = 5,
+        time_decay: bool = True,
+        conversation_id: Optional[int] = None
+    ) -> List[List[Tuple[int, float]]]:
+        """
+        批量搜索记忆（一次批量向量化，一次批量检索）
+        
+        Args:
+            queries: 查询文本列表
+            memory_type: 记忆类型过滤（单个类型或类型列表）
+            top_k: 每个查询返回前k个结果
+            time_decay: 是否应用时间衰减
+            conversation_id: 会话ID过滤
+            
+        Returns:
+            List[List[Tuple[int, float]]]: 每个查询的 [(memory_id, similarity_score), ...]
+        """
+        try:
+            if not queries:
+                return []
+            
+            # 批量向量化查询
+            query_vectors = await self.embedding_service.embed_batch(queries)
+            
+            return await self._search_memory_vectors(
+                query_vectors, memory_type, top_k, time_decay, conversation_id
             )
             
+        except Exception as e:
+            logger.error(f"批量搜索记忆失败: {e}")
+            return []
+    
+    async def _search_memory_vectors(
+        self,
+        query_vectors: np.ndarray,
+        memory_type: Optional[Union[str, List[str]]],
+        top_k: int,
+        time_decay: bool,
+        conversation_id: Optional[int]
+    ) -> List[List[Tuple[int, float]]]:
+        """
+        用已向量化的查询搜索记忆
+        
+        Args:
+            query_vectors: 查询向量矩阵
+            memory_type: 记忆类型过滤
+            top_k: 每个查询返回前k个结果
+            time_decay: 是否应用时间衰减
+            conversation_id: 会话ID过滤
+            
+        Returns:
+            List[List[Tuple[int, float]]]: 每个查询的 [(memory_id, similarity_score), ...]
+        """
+        # 构建过滤条件
+        filter_metadata = {}
+        if memory_type:
+            filter_metadata["memory_type"] = memory_type
+        if conversation_id is not None:
+            filter_metadata["conversation_id"] = conversation_id
+        
+        # 搜索向量
+        batch_results = await self.search_batch(
+            query_vectors,
+            top_k=top_k,
+            filter_metadata=filter_metadata if filter_metadata else None
+        )
+        
+        formatted = []
+        for results in batch_results:
             # 应用时间衰减（如果需要）
             if time_decay:
                 results = await self._apply_time_decay(results)
             
             # 返回格式化的结果
-            return [(vector_id, score) for vector_id, score, _ in results]
-            
-        except Exception as e:
-            logger.error(f"搜索记忆失败: {e}")
-            return []
+            formatted.append([(vector_id, score) for vector_id, score, _ in results])
+        return formatted
     
     async def _apply_time_decay(
         self,
@@ -667,9 +1456,242 @@ class MemoryVectorStore(BaseVectorStore):
             int: 向量数量
         """
         try:
-            short_term_count = self.short_term_index.ntotal if self.short_term_index else 0
-            long_term_count = self.long_term_index.ntotal if self.long_term_index else 0
-            return short_term_count + long_term_count
+            await self._ensure_recovered()
+            return sum(
+                len(self.metadata_manager.id_table(name))
+                for name in self.metadata_manager.index_names()
+            )
         except Exception as e:
             logger.error(f"获取向量数量失败: {e}")
             return 0
+
+    def _schedule_compaction(self, shard: VectorShard) -> None:
+        """
+        调度分片的后台压缩（同一分片同时只运行一个压缩任务）
+        
+        Args:
+            shard: 向量分片
+        """
+        task = self._compaction_tasks.get(shard.name)
+        if task is not None and not task.done():
+            return
+        
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return
+        
+        self._compaction_tasks[shard.name] = loop.create_task(self._compact_shard(shard))
+    
+    async def evaluate_recall(
+        self,
+        sample_size: int = 100,
+        top_k: int = 10
+    ) -> Dict[str, Dict[str, Any]]:
+        """
+        评估量化分片相对Flat精确搜索的召回损失
+        
+        以分片中的向量作为查询，与原始向量上的暴力搜索结果比较，
+        分别报告不重排序和重排序后的 recall@k 以及每个向量占用的内存。
+        
+        Args:
+            sample_size: 每个分片抽取的查询数量
+            top_k: 评估的结果数
+            
+        Returns:
+            Dict[str, Dict[str, Any]]: 分片名称 -> 评估报告
+        """
+        reports = {}
+        try:
+            await self._ensure_recovered()
+            for name in self.metadata_manager.index_names():
+                shard = await self._acquire_shard(name, create=False)
+                if shard is None or shard.raw_vectors is None or shard.quantization is None:
+                    continue
+                
+                loop = asyncio.get_running_loop()
+                report = await loop.run_in_executor(
+                    None, self._evaluate_shard_recall, shard, sample_size, top_k
+                )
+                if report:
+                    reports[name] = report
+            
+            return reports
+            
+        except Exception as e:
+            logger.error(f"评估召回损失失败: {e}")
+            return reports
+    
+    def _evaluate_shard_recall(
+        self,
+        shard: VectorShard,
+        sample_size: int,
+        top_k: int
+    ) -> Optional[Dict[str, Any]]:
+        """
+        评估单个分片的召回损失（同步方法，在线程池中执行）
+        
+        Args:
+            shard: 量化分片
+            sample_size: 查询数量
+            top_k: 评估的结果数
+            
+        Returns:
+            Optional[Dict[str, Any]]: 评估报告，分片为空时返回None
+        """
+        live_ids = shard.live_ids()
+        ids, vectors = shard.raw_vectors.get_all()
+        mask = np.isin(ids, live_ids)
+        ids, vectors = ids[mask], vectors[mask]
+        if len(ids) == 0:
+            return None
+        
+        k = min(top_k, len(ids))
+        rng = np.random.default_rng(0)
+        queries = vectors[rng.choice(len(ids), min(sample_size, len(ids)), replace=False)]
+        
+        # Flat精确搜索作为基准
+        exact_top = np.argsort(-(queries @ vectors.T), axis=1)[:, :k]
+        exact = [set(ids[row].tolist()) for row in exact_top]
+        
+        def recall(results: List[List[Tuple[int, float]]]) -> float:
+            hits = sum(
+                len(expected & {vector_id for vector_id, _ in found[:k]})
+                for expected, found in zip(exact, results)
+            )
+            return hits / (len(exact) * k)
+        
+        index_bytes = len(faiss.serialize_index(shard.index))
+        return {
+            "index_kind": shard.index_kind,
+            "quantization": shard.quantization,
+            "queries": len(queries),
+            "top_k": k,
+            "recall": recall(shard.search(queries, k, rerank=False)),
+            "recall_reranked": recall(shard.search(queries, k)),
+            "bytes_per_vector": index_bytes / max(shard.ntotal, 1),
+            "flat_bytes_per_vector": self.dimension * 4
+        }
+    
+    def _needs_promotion(self, shard: VectorShard) -> bool:
+        """
+        判断分片是否需要从Flat升级为目标索引
+        
+        Args:
+            shard: 向量分片
+            
+        Returns:
+            bool: 是否需要升级
+        """
+        required = max(
+            self.promotion_threshold,
+            self._min_training_points(),
+            self._promotion_retry_at.get(shard.name, 0)
+        )
+        return (
+            (self.index_type != "Flat" or self.quantization is not None)
+            and shard.index_kind == "Flat"
+            and shard.quantization is None
+            and shard.live_count >= required
+        )
+    
+    def _min_training_points(self) -> int:
+        """
+        训练目标索引所需的最少向量数
+        
+        PQ每个子量化器训练 PQ_CENTROIDS 个中心；IVF的聚类中心数随数据量自适应，
+        至少要能充分训练一个中心。
+        
+        Returns:
+            int: 最少向量数
+        """
+        if self.quantization == "PQ":
+            return PQ_CENTROIDS
+        if self.index_type == "IVFFlat":
+            return IVF_MIN_POINTS_PER_CENTROID
+        return 1
+    
+    def _schedule_promotion(self, shard: VectorShard) -> None:
+        """
+        调度分片的后台索引升级（同一分片同时只运行一个升级任务）
+        
+        Args:
+            shard: 向量分片
+        """
+        task = self._promotion_tasks.get(shard.name)
+        if task is not None and not task.done():
+            return
+        
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return
+        
+        self._promotion_tasks[shard.name] = loop.create_task(self._promote_shard(shard))
+    
+    async def _promote_shard(self, shard: VectorShard) -> bool:
+        """
+        升级分片：用当前有效向量在线程池中训练/构建目标索引，然后原子替换
+        
+        构建期间写入和搜索继续使用旧索引，替换时补齐构建期间的增删。
+        
+        Args:
+            shard: 向量分片
+            
+        Returns:
+            bool: 是否升级成功
+        """
+        try:
+            vector_ids, vectors = shard.begin_rebuild()
+            loop = asyncio.get_running_loop()
+            new_index = await loop.run_in_executor(None, self._build_index, vector_ids, vectors)
+            
+            async with shard.lock:
+                shard.finish_rebuild(new_index, vector_ids)
+            self._promotion_retry_at.pop(shard.name, None)
+            
+            logger.info(
+                f"分片索引已升级: {shard.name}, 类型={shard.index_kind}, 向量数={shard.live_count}"
+            )
+            return True
+            
+        except Exception as e:
+            shard.abort_rebuild()
+            # 退避：有效向量数翻倍后再重试，避免每次添加都重新训练失败
+            self._promotion_retry_at[shard.name] = max(shard.live_count, 1) * 2
+            logger.error(
+                f"升级分片索引失败: {shard.name}, {e}，"
+                f"有效向量数达到{self._promotion_retry_at[shard.name]}后重试"
+            )
+            return False
+    
+    async def _compact_shard(self, shard: VectorShard) -> bool:
+        """
+        压缩分片：在线程池中构建去除墓碑的新索引，然后原子替换
+        
+        压缩期间写入等待分片锁，搜索继续使用旧索引。
+        
+        Args:
+            shard: 向量分片
+            
+        Returns:
+            bool: 是否压缩成功
+        """
+        try:
+            async with shard.lock:
+                if not shard.tombstones:
+                    return True
+                
+                # 在事件循环线程中取墓碑快照，压缩期间新增的墓碑留待下次处理
+                removed = set(shard.tombstones)
+                loop = asyncio.get_running_loop()
+                new_index = await loop.run_in_executor(None, shard.compact, removed)
+                shard.swap(new_index, removed)
+                self.metadata_manager.compact_index(shard.name)
+            
+            logger.info(f"分片已压缩: {shard.name}, 移除{len(removed)}个已删除向量, 剩余{shard.ntotal}")
+            return True
+            
+        except Exception as e:
+            logger.error(f"压缩分片失败: {shard.name}, {e}")
+            return False
@@ -4,12 +4,23 @@
 该模块实现了向量存储的持久化功能，包括：
 - FAISS索引持久化
 - 元数据管理
+- 向量ID映射表
+- 原始向量文件（量化索引重排序）
+- 预写日志（崩溃恢复）
 """
 
 from .faiss_persister import FAISSPersister
 from .metadata_manager import MetadataManager
+from .metadata_record import MetadataRecord
+from .id_table import IdTable
+from .raw_vector_file import RawVectorFile
+from .write_ahead_log import WriteAheadLog
 
 __all__ = [
     "FAISSPersister",
-    "MetadataManager"
+    "MetadataManager",
+    "MetadataRecord",
+    "IdTable",
+    "RawVectorFile",
+    "WriteAheadLog"
 ]
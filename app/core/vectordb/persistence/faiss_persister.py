@@ -5,6 +5,7 @@ FAISS索引持久化管理
 """
 
 import logging
+import os
 from pathlib import Path
 from typing import Optional, Dict, Any, List
 import json
@@ -16,6 +17,12 @@ except ImportError:
 
 logger = logging.getLogger(__name__)
 
+# 只读内存映射加载标志（旧版本FAISS没有 IO_FLAG_MMAP_IFC 时退回 IO_FLAG_MMAP）
+MMAP_IO_FLAGS = (
+    getattr(faiss, "IO_FLAG_MMAP_IFC", getattr(faiss, "IO_FLAG_MMAP", 0))
+    | getattr(faiss, "IO_FLAG_READ_ONLY", 0)
+) if faiss is not None else 0
+
 
 class FAISSPersister:
     """
@@ -64,13 +71,21 @@ class FAISSPersister:
         try:
             # 保存索引文件
             index_path = self.persist_dir / f"{index_name}.faiss"
-            faiss.write_index(index, str(index_path))
+            # 分区索引名称包含子目录
+            index_path.parent.mkdir(parents=True, exist_ok=True)
+            
+            # 先写临时文件再原子替换，崩溃时保留上一份完整索引
+            tmp_path = index_path.with_name(index_path.name + ".tmp")
+            faiss.write_index(index, str(tmp_path))
+            os.replace(tmp_path, index_path)
             
             # 保存元数据
             if metadata is not None:
                 metadata_path = self.persist_dir / f"{index_name}_metadata.json"
-                with open(metadata_path, 'w', encoding='utf-8') as f:
+                tmp_metadata_path = metadata_path.with_name(metadata_path.name + ".tmp")
+                with open(tmp_metadata_path, 'w', encoding='utf-8') as f:
                     json.dump(metadata, f, ensure_ascii=False, indent=2)
+                os.replace(tmp_metadata_path, metadata_path)
             
             # 更新配置文件
             await self._update_config(index_name, metadata)
@@ -84,13 +99,18 @@ class FAISSPersister:
     
     async def load_index(
         self,
-        index_name: str
+        index_name: str,
+        mmap: bool = False
     ) -> Optional['faiss.Index']:
         """
         加载FAISS索引
         
+        内存映射加载时向量数据不复制到进程内存，多个工作进程共享同一份页缓存，
+        加载耗时与索引大小无关；得到的索引是只读的，写入前需复制。
+        
         Args:
             index_name: 索引名称
+            mmap: 是否以只读内存映射方式加载
             
         Returns:
             Optional[faiss.Index]: 加载的索引对象，如果不存在则返回None
@@ -101,8 +121,11 @@ class FAISSPersister:
                 logger.warning(f"FAISS索引文件不存在: {index_path}")
                 return None
             
-            index = faiss.read_index(str(index_path))
-            logger.info(f"FAISS索引已加载: {index_path}")
+            if mmap:
+                index = faiss.read_index(str(index_path), MMAP_IO_FLAGS)
+            else:
+                index = faiss.read_index(str(index_path))
+            logger.info(f"FAISS索引已加载: {index_path}, 内存映射={mmap}")
             return index
             
         except Exception as e:
@@ -178,11 +201,20 @@ class FAISSPersister:
         Returns:
             List[str]: 索引名称列表
         """
+        return self.scan_index_names()
+    
+    def scan_index_names(self) -> List[str]:
+        """
+        同步扫描持久化目录中的索引（含分区子目录）
+        
+        Returns:
+            List[str]: 索引名称列表（相对持久化目录，不含扩展名）
+        """
         try:
             indices = []
-            for faiss_file in self.persist_dir.glob("*.faiss"):
-                index_name = faiss_file.stem
-                indices.append(index_name)
+            for faiss_file in self.persist_dir.rglob("*.faiss"):
+                relative = faiss_file.relative_to(self.persist_dir).with_suffix("")
+                indices.append(relative.as_posix())
             
             return indices
             
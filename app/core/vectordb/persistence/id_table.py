@@ -0,0 +1,305 @@
+"""
+向量ID表
+
+单个索引的行号与向量ID之间的紧凑映射：
+- 行号 -> 向量ID：int64 NumPy数组
+- 向量ID -> 行号：开放寻址哈希表，槽位只存int32行号，
+  比较键时回查行号数组，装载因子不超过0.5时每个向量约16字节
+"""
+
+import logging
+from typing import Iterable, Optional
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# 槽位状态
+_EMPTY = -1
+_DELETED = -2
+
+# 行号数组中的墓碑标记
+_TOMBSTONE = -1
+
+# Fibonacci 哈希乘数
+_HASH_MULTIPLIER = 0x9E3779B97F4A7C15
+_UINT64_MASK = 0xFFFFFFFFFFFFFFFF
+
+_MIN_SLOTS = 16
+_MAX_LOAD_FACTOR = 0.5
+
+
+class IdTable:
+    """
+    向量ID表
+
+    行号在压缩前保持稳定；删除只把行标记为墓碑，
+    compact() 丢弃墓碑行并重建哈希。
+    """
+
+    def __init__(self, capacity: int = 64):
+        """
+        初始化向量ID表
+
+        Args:
+            capacity: 初始行容量
+        """
+        self._row_ids = np.full(max(capacity, 1), _TOMBSTONE, dtype=np.int64)
+        self._size = 0
+        self._live = 0
+        self._slots = np.full(_MIN_SLOTS, _EMPTY, dtype=np.int32)
+        self._used_slots = 0
+
+    @classmethod
+    def from_ids(cls, vector_ids: Iterable[int]) -> "IdTable":
+        """
+        从向量ID序列构建ID表
+
+        Args:
+            vector_ids: 按行号排列的向量ID
+
+        Returns:
+            IdTable: 新的ID表
+        """
+        if isinstance(vector_ids, np.ndarray):
+            ids = vector_ids.astype(np.int64)
+        else:
+            ids = np.fromiter(vector_ids, dtype=np.int64)
+        table = cls(capacity=len(ids))
+        table._rebuild(ids)
+        return table
+
+    def __len__(self) -> int:
+        return self._live
+
+    def __contains__(self, vector_id: int) -> bool:
+        return self._find_slot(int(vector_id)) >= 0
+
+    @property
+    def tombstone_count(self) -> int:
+        """
+        墓碑行数量
+
+        Returns:
+            int: 已删除但尚未压缩的行数
+        """
+        return self._size - self._live
+
+    @property
+    def nbytes(self) -> int:
+        """
+        映射占用的字节数
+
+        Returns:
+            int: 行号数组与哈希槽位的总字节数
+        """
+        return self._row_ids.nbytes + self._slots.nbytes
+
+    @property
+    def ids(self) -> np.ndarray:
+        """
+        所有有效向量ID（按行号顺序）
+
+        Returns:
+            np.ndarray: int64向量ID数组（副本）
+        """
+        rows = self._row_ids[:self._size]
+        return rows[rows != _TOMBSTONE]
+
+    def add(self, vector_id: int) -> int:
+        """
+        添加向量ID
+
+        Args:
+            vector_id: 向量ID
+
+        Returns:
+            int: 分配的行号（已存在时返回原行号）
+        """
+        vector_id = int(vector_id)
+        existing = self.row_of(vector_id)
+        if existing is not None:
+            return existing
+
+        if self._size >= len(self._row_ids):
+            grown = np.full(len(self._row_ids) * 2, _TOMBSTONE, dtype=np.int64)
+            grown[:self._size] = self._row_ids[:self._size]
+            self._row_ids = grown
+
+        if (self._used_slots + 1) > len(self._slots) * _MAX_LOAD_FACTOR:
+            self._rehash(self._slot_count_for(self._live + 1))
+
+        row = self._size
+        self._row_ids[row] = vector_id
+        self._size += 1
+        self._live += 1
+
+        mask = len(self._slots) - 1
+        slot = self._home_slot(vector_id)
+        while self._slots[slot] >= 0:
+            slot = (slot + 1) & mask
+        if self._slots[slot] == _EMPTY:
+            self._used_slots += 1
+        self._slots[slot] = row
+        return row
+
+    def remove(self, vector_id: int) -> Optional[int]:
+        """
+        删除向量ID（行标记为墓碑）
+
+        Args:
+            vector_id: 向量ID
+
+        Returns:
+            Optional[int]: 被删除的行号，不存在时返回None
+        """
+        slot = self._find_slot(int(vector_id))
+        if slot < 0:
+            return None
+        row = int(self._slots[slot])
+        self._slots[slot] = _DELETED
+        self._row_ids[row] = _TOMBSTONE
+        self._live -= 1
+        return row
+
+    def row_of(self, vector_id: int) -> Optional[int]:
+        """
+        查询向量ID所在行号
+
+        Args:
+            vector_id: 向量ID
+
+        Returns:
+            Optional[int]: 行号，不存在时返回None
+        """
+        slot = self._find_slot(int(vector_id))
+        return int(self._slots[slot]) if slot >= 0 else None
+
+    def id_at(self, row: int) -> Optional[int]:
+        """
+        查询行号对应的向量ID
+
+        Args:
+            row: 行号
+
+        Returns:
+            Optional[int]: 向量ID，墓碑行或越界时返回None
+        """
+        if row < 0 or row >= self._size:
+            return None
+        vector_id = int(self._row_ids[row])
+        return vector_id if vector_id != _TOMBSTONE else None
+
+    def compact(self) -> int:
+        """
+        丢弃墓碑行，重新分配连续行号
+
+        Returns:
+            int: 丢弃的墓碑行数量
+        """
+        removed = self.tombstone_count
+        if removed:
+            self._rebuild(self.ids)
+        return removed
+
+    def clear(self) -> None:
+        """
+        清空ID表
+        """
+        self._rebuild(np.empty(0, dtype=np.int64))
+
+    def _find_slot(self, vector_id: int) -> int:
+        """
+        线性探测查找向量ID所在槽位
+
+        Args:
+            vector_id: 向量ID
+
+        Returns:
+            int: 槽位下标，不存在时返回-1
+        """
+        mask = len(self._slots) - 1
+        slot = self._home_slot(vector_id)
+        while True:
+            row = self._slots[slot]
+            if row == _EMPTY:
+                return -1
+            if row >= 0 and self._row_ids[row] == vector_id:
+                return slot
+            slot = (slot + 1) & mask
+
+    def _home_slot(self, vector_id: int) -> int:
+        bits = len(self._slots).bit_length() - 1
+        return ((vector_id * _HASH_MULTIPLIER) & _UINT64_MASK) >> (64 - bits)
+
+    @staticmethod
+    def _slot_count_for(live: int) -> int:
+        slots = _MIN_SLOTS
+        while live > slots * _MAX_LOAD_FACTOR:
+            slots *= 2
+        return slots
+
+    def _rehash(self, slot_count: int) -> None:
+        """
+        以指定槽位数重建哈希（保持行号不变）
+
+        Args:
+            slot_count: 新的槽位数（2的幂）
+        """
+        rows = np.flatnonzero(self._row_ids[:self._size] != _TOMBSTONE)
+        self._slots = self._build_slots(self._row_ids[rows], rows, slot_count)
+        self._used_slots = len(rows)
+
+    def _rebuild(self, ids: np.ndarray) -> None:
+        """
+        以给定ID序列作为行号 0..n-1 重建整个表
+
+        Args:
+            ids: 向量ID数组
+        """
+        n = len(ids)
+        self._row_ids = np.full(max(n, 64), _TOMBSTONE, dtype=np.int64)
+        self._row_ids[:n] = ids
+        self._size = n
+        self._live = n
+        self._slots = self._build_slots(ids, np.arange(n), self._slot_count_for(n))
+        self._used_slots = n
+
+    @staticmethod
+    def _build_slots(ids: np.ndarray, rows: np.ndarray, slot_count: int) -> np.ndarray:
+        """
+        向量化构建线性探测哈希槽位
+
+        每轮把仍未放置的键放入各自当前槽位（同一槽位只放一个），
+        其余键前移一个槽位，直到全部放置。
+
+        Args:
+            ids: 向量ID数组
+            rows: 对应行号数组
+            slot_count: 槽位数（2的幂）
+
+        Returns:
+            np.ndarray: int32槽位数组
+        """
+        slots = np.full(slot_count, _EMPTY, dtype=np.int32)
+        if len(ids) == 0:
+            return slots
+
+        bits = slot_count.bit_length() - 1
+        mask = np.uint64(slot_count - 1)
+        positions = (ids.astype(np.uint64) * np.uint64(_HASH_MULTIPLIER)) >> np.uint64(64 - bits)
+        pending = np.arange(len(ids))
+
+        while pending.size:
+            current = positions[pending]
+            free = slots[current.astype(np.int64)] == _EMPTY
+            candidates = pending[free]
+            unique_slots, first = np.unique(current[free], return_index=True)
+            placed = candidates[first]
+            slots[unique_slots.astype(np.int64)] = rows[placed]
+
+            is_placed = np.zeros(len(ids), dtype=bool)
+            is_placed[placed] = True
+            pending = pending[~is_placed[pending]]
+            positions[pending] = (positions[pending] + np.uint64(1)) & mask
+
+        return slots
@@ -2,16 +2,54 @@
 元数据管理器
 
 管理向量存储的元数据，包括向量ID映射、时间戳、访问统计等
+
+存储结构：
+- 内存：每个向量一条 __slots__ 紧凑记录（不含元数据正文）、ID映射表、倒排表
+- SQLite（vector_metadata.db）：完整元数据（含content），按向量ID主键读取
+
+写入先在内存中缓冲，save() 时在一个事务中只写入变化的行，
+事务提交即快照；访问统计同样在内存中累计，随快照批量写回。
 """
 
 import json
 import logging
+import sqlite3
 from pathlib import Path
-from typing import Dict, Any, Optional, List, Set
-from datetime import datetime
+from typing import Dict, Any, Iterable, Iterator, Optional, List, Set, Tuple
+from datetime import datetime, timedelta, timezone
+import numpy as np
+
+from .id_table import IdTable
+from .metadata_record import MetadataRecord, to_isoformat, to_timestamp
 
 logger = logging.getLogger(__name__)
 
+# 建立倒排表的元数据字段（过滤条件下推到向量检索时使用）
+INDEXED_FIELDS = ("memory_type", "conversation_id", "user_id")
+
+# SQLite单条语句的参数数量上限（按最保守的旧版本取值）
+_SQL_BATCH_SIZE = 900
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS vectors (
+    vector_id INTEGER PRIMARY KEY,
+    memory_type TEXT NOT NULL,
+    index_name TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    last_accessed REAL NOT NULL,
+    access_count INTEGER NOT NULL DEFAULT 0,
+    metadata TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS id_tables (
+    name TEXT PRIMARY KEY,
+    ids BLOB NOT NULL
+);
+CREATE TABLE IF NOT EXISTS store_state (
+    key TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+"""
+
 
 class MetadataManager:
     """
@@ -30,28 +68,64 @@ class MetadataManager:
         self.persist_dir = Path(persist_dir)
         self.persist_dir.mkdir(parents=True, exist_ok=True)
         
-        # 元数据文件
-        self.metadata_file = self.persist_dir / "vector_metadata.json"
+        # 元数据数据库；旧版本的JSON文件在首次打开时迁移后删除
+        self.db_file = self.persist_dir / "vector_metadata.db"
+        self.legacy_metadata_file = self.persist_dir / "vector_metadata.json"
+        
+        # 同一连接只在事件循环线程中使用
+        self._conn = sqlite3.connect(str(self.db_file), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(_SCHEMA)
+        
+        # 内存中的紧凑记录（metadata 仅在尚未落盘时持有）
+        self._records: Dict[int, MetadataRecord] = {}
         
-        # 内存中的元数据
-        self._metadata: Dict[int, Dict[str, Any]] = {}
+        # 自上次快照以来需要写入/删除的行，以及访问统计有变化的行
+        self._dirty: Set[int] = set()
+        self._deleted: Set[int] = set()
+        self._accessed: Set[int] = set()
+        self._truncate = False
         
-        # 向量ID到索引位置的映射
-        self._id_to_index: Dict[int, int] = {}
+        # 每个索引一张行号<->向量ID映射表
+        self._id_tables: Dict[str, IdTable] = {}
         
-        # 索引位置到向量ID的映射
-        self._index_to_id: Dict[int, int] = {}
+        # 常用过滤字段的倒排表: 字段 -> 值 -> 向量ID集合
+        self._postings: Dict[str, Dict[Any, Set[int]]] = {field: {} for field in INDEXED_FIELDS}
+        
+        # 已包含在元数据快照中的最大预写日志序号
+        self.wal_lsn = 0
+        
+        # 进程内的写入序号：记录每次添加或更新时取下一个值，用于判断记录是否被改写
+        self._write_seq = 0
         
         # 加载现有元数据
         self._load_metadata()
         
         logger.info(f"元数据管理器初始化完成: 目录={persist_dir}")
     
+    def id_table(self, index_name: str) -> IdTable:
+        """
+        获取索引的ID映射表（不存在时创建）
+        
+        Args:
+            index_name: 索引名称
+        
+        Returns:
+            IdTable: ID映射表
+        """
+        table = self._id_tables.get(index_name)
+        if table is None:
+            table = IdTable()
+            self._id_tables[index_name] = table
+        return table
+    
     def add(
         self,
         vector_id: int,
         memory_type: str,
-        metadata: Dict[str, Any]
+        metadata: Dict[str, Any],
+        index_name: Optional[str] = None,
+        created_at: Optional[str] = None
     ) -> bool:
         """
         添加向量元数据
@@ -60,76 +134,146 @@ class MetadataManager:
             vector_id: 向量ID
             memory_type: 记忆类型
             metadata: 元数据
-            
+            index_name: 所在索引名称（默认与记忆类型相同）
+            created_at: 创建时间（ISO格式，重放日志时沿用原时间）
+        
         Returns:
             bool: 是否添加成功
         """
         try:
-            # 获取下一个索引位置
-            index_position = len(self._metadata)
-            
-            # 创建元数据记录
-            record = {
-                "vector_id": vector_id,
-                "memory_type": memory_type,
-                "index_position": index_position,
-                "created_at": datetime.utcnow().isoformat(),
-                "last_accessed": datetime.utcnow().isoformat(),
-                "access_count": 0,
-                "metadata": metadata
-            }
+            vector_id = int(vector_id)
+            index_name = index_name or memory_type
+            
+            # 在所属索引的映射表中分配行号
+            index_position = self.id_table(index_name).add(vector_id)
+            
+            # 创建元数据记录（元数据正文在快照落盘前保留在内存中）
+            now = to_timestamp(None)
+            record = MetadataRecord(
+                vector_id,
+                memory_type,
+                index_name,
+                to_timestamp(created_at) if created_at else now,
+                now,
+                0,
+                metadata,
+                self._next_version()
+            )
             
             # 添加到内存
-            self._metadata[vector_id] = record
-            self._id_to_index[vector_id] = index_position
-            self._index_to_id[index_position] = vector_id
+            self._records[vector_id] = record
+            self._dirty.add(vector_id)
+            self._deleted.discard(vector_id)
+            self._index_postings(vector_id, metadata)
             
             logger.debug(f"向量元数据已添加: ID={vector_id}, 位置={index_position}")
             return True
-            
+        
         except Exception as e:
             logger.error(f"添加向量元数据失败: {e}")
             return False
     
-    def get(self, vector_id: int) -> Optional[Dict[str, Any]]:
+    def get(self, vector_id: int) -> Optional[MetadataRecord]:
         """
-        获取向量元数据
+        获取向量元数据（累计访问统计）
         
         Args:
             vector_id: 向量ID
-            
+        
         Returns:
-            Optional[Dict[str, Any]]: 元数据记录，如果不存在则返回None
+            Optional[MetadataRecord]: 带完整元数据的记录，如果不存在则返回None
         """
         try:
-            record = self._metadata.get(vector_id)
-            if record:
-                # 更新访问信息
-                record["last_accessed"] = datetime.utcnow().isoformat()
-                record["access_count"] = record.get("access_count", 0) + 1
-            
-            return record
-            
+            return self.get_many([vector_id]).get(vector_id)
+        
         except Exception as e:
             logger.error(f"获取向量元数据失败: {e}")
             return None
     
-    def get_by_index(self, index_position: int) -> Optional[Dict[str, Any]]:
+    def get_many(self, vector_ids: Iterable[int], touch: bool = True) -> Dict[int, MetadataRecord]:
+        """
+        批量获取向量元数据（一次查询读取所有未缓存的元数据，累计访问统计）
+        
+        Args:
+            vector_ids: 向量ID序列
+            touch: 是否累计访问统计（后台任务读取时传False）
+        
+        Returns:
+            Dict[int, MetadataRecord]: 向量ID -> 带完整元数据的记录（不存在的ID不包含在内）
+        """
+        try:
+            records = {}
+            for vector_id in vector_ids:
+                record = self._records.get(vector_id)
+                if record is not None:
+                    records[vector_id] = record
+            if not records:
+                return {}
+            
+            # 访问统计只更新内存中的数值，快照时批量写回
+            if touch:
+                now = to_timestamp(None)
+                for vector_id, record in records.items():
+                    record.last_accessed = now
+                    record.access_count += 1
+                self._accessed.update(records)
+            
+            stored = self._fetch_metadata(
+                vector_id for vector_id, record in records.items() if record.metadata is None
+            )
+            return {
+                vector_id: record.with_metadata(
+                    record.metadata if record.metadata is not None else stored.get(vector_id, {})
+                )
+                for vector_id, record in records.items()
+            }
+        
+        except Exception as e:
+            logger.error(f"批量获取向量元数据失败: {e}")
+            return {}
+    
+    def get_record(self, vector_id: int) -> Optional[MetadataRecord]:
+        """
+        获取常驻内存的记录（不读取元数据正文，不更新访问统计）
+        
+        Args:
+            vector_id: 向量ID
+        
+        Returns:
+            Optional[MetadataRecord]: 记录，如果不存在则返回None
+        """
+        return self._records.get(vector_id)
+    
+    def exists(self, vector_id: int) -> bool:
+        """
+        检查向量元数据是否存在（不更新访问统计）
+        
+        Args:
+            vector_id: 向量ID
+        
+        Returns:
+            bool: 是否存在
+        """
+        return vector_id in self._records
+    
+    def get_by_index(self, index_name: str, index_position: int) -> Optional[MetadataRecord]:
         """
         根据索引位置获取元数据
         
         Args:
-            index_position: 索引位置
-            
+            index_name: 索引名称
+            index_position: 索引内的行号
+        
         Returns:
-            Optional[Dict[str, Any]]: 元数据记录，如果不存在则返回None
+            Optional[MetadataRecord]: 元数据记录，如果不存在则返回None
         """
         try:
-            vector_id = self._index_to_id.get(index_position)
-            if vector_id:
+            table = self._id_tables.get(index_name)
+            vector_id = table.id_at(index_position) if table is not None else None
+            if vector_id is not None:
                 return self.get(vector_id)
             return None
-            
+        
         except Exception as e:
             logger.error(f"根据索引位置获取元数据失败: {e}")
             return None
@@ -145,22 +289,32 @@ class MetadataManager:
         Args:
             vector_id: 向量ID
             metadata: 新的元数据
-            
+        
         Returns:
             bool: 是否更新成功
         """
         try:
-            if vector_id not in self._metadata:
+            record = self._records.get(vector_id)
+            if record is None:
                 logger.warning(f"向量ID不存在: {vector_id}")
                 return False
             
             # 更新元数据
-            self._metadata[vector_id]["metadata"].update(metadata)
-            self._metadata[vector_id]["last_accessed"] = datetime.utcnow().isoformat()
+            current = record.metadata
+            if current is None:
+                current = self._fetch_metadata([vector_id]).get(vector_id, {})
+            self._unindex_postings(vector_id, current)
+            current.update(metadata)
+            self._index_postings(vector_id, current)
+            
+            record.metadata = current
+            record.last_accessed = to_timestamp(None)
+            record.version = self._next_version()
+            self._dirty.add(vector_id)
             
             logger.debug(f"向量元数据已更新: ID={vector_id}")
             return True
-            
+        
         except Exception as e:
             logger.error(f"更新向量元数据失败: {e}")
             return False
@@ -171,30 +325,56 @@ class MetadataManager:
         
         Args:
             vector_id: 向量ID
-            
+        
         Returns:
             bool: 是否删除成功
         """
         try:
-            if vector_id not in self._metadata:
+            if vector_id not in self._records:
                 logger.warning(f"向量ID不存在: {vector_id}")
                 return False
             
-            # 获取索引位置
-            index_position = self._metadata[vector_id]["index_position"]
+            # 从所属索引的映射表中删除（行标记为墓碑）
+            record = self._records.pop(vector_id)
+            metadata = record.metadata
+            if metadata is None:
+                metadata = self._fetch_metadata([vector_id]).get(vector_id, {})
+            self._unindex_postings(vector_id, metadata)
+            index_position = self.id_table(record.index_name).remove(vector_id)
             
-            # 从内存中删除
-            del self._metadata[vector_id]
-            del self._id_to_index[vector_id]
-            del self._index_to_id[index_position]
+            self._dirty.discard(vector_id)
+            self._accessed.discard(vector_id)
+            self._deleted.add(vector_id)
             
             logger.debug(f"向量元数据已删除: ID={vector_id}, 位置={index_position}")
             return True
-            
+        
         except Exception as e:
             logger.error(f"删除向量元数据失败: {e}")
             return False
     
+    def compact_index(self, index_name: str) -> int:
+        """
+        压缩索引的映射表（与FAISS分片压缩同步调用）
+        
+        Args:
+            index_name: 索引名称
+        
+        Returns:
+            int: 丢弃的墓碑行数量
+        """
+        table = self._id_tables.get(index_name)
+        return table.compact() if table is not None else 0
+    
+    def index_names(self) -> List[str]:
+        """
+        获取仍有有效向量的索引名称
+        
+        Returns:
+            List[str]: 索引名称列表
+        """
+        return [name for name, table in self._id_tables.items() if len(table) > 0]
+    
     def get_all_ids(self) -> List[int]:
         """
         获取所有向量ID
@@ -202,7 +382,151 @@ class MetadataManager:
         Returns:
             List[int]: 向量ID列表
         """
-        return list(self._metadata.keys())
+        return list(self._records.keys())
+    
+    def __len__(self) -> int:
+        return len(self._records)
+    
+    def match_ids(self, filter_metadata: Dict[str, Any]) -> Set[int]:
+        """
+        获取满足过滤条件的向量ID集合
+        
+        过滤值为 list/tuple/set 时表示"属于其中之一"。
+        INDEXED_FIELDS 中的字段走倒排表，其余字段逐条扫描。
+        
+        Args:
+            filter_metadata: 过滤条件
+        
+        Returns:
+            Set[int]: 匹配的向量ID集合
+        """
+        try:
+            matched: Optional[Set[int]] = None
+            scan_conditions = {}
+            
+            for key, value in filter_metadata.items():
+                values = value if isinstance(value, (list, tuple, set)) else [value]
+                
+                if key in self._postings:
+                    ids = set()
+                    for item in values:
+                        ids |= self._postings[key].get(item, set())
+                    matched = ids if matched is None else matched & ids
+                    if not matched:
+                        return set()
+                else:
+                    scan_conditions[key] = set(values)
+            
+            if scan_conditions:
+                matched = {
+                    vector_id for vector_id, metadata in self._iter_metadata(matched)
+                    if all(
+                        metadata.get(key) in accepted
+                        for key, accepted in scan_conditions.items()
+                    )
+                }
+            
+            return matched if matched is not None else set(self._records.keys())
+        
+        except Exception as e:
+            logger.error(f"根据过滤条件匹配向量ID失败: {e}")
+            return set()
+    
+    def _next_version(self) -> int:
+        """
+        取下一个写入序号
+        
+        Returns:
+            int: 写入序号
+        """
+        self._write_seq += 1
+        return self._write_seq
+    
+    def _index_postings(self, vector_id: int, metadata: Dict[str, Any]) -> None:
+        """
+        将向量加入倒排表
+        
+        Args:
+            vector_id: 向量ID
+            metadata: 元数据
+        """
+        for field in INDEXED_FIELDS:
+            value = metadata.get(field)
+            if value is not None:
+                self._postings[field].setdefault(value, set()).add(vector_id)
+    
+    def _unindex_postings(self, vector_id: int, metadata: Dict[str, Any]) -> None:
+        """
+        将向量移出倒排表
+        
+        Args:
+            vector_id: 向量ID
+            metadata: 元数据
+        """
+        for field in INDEXED_FIELDS:
+            value = metadata.get(field)
+            ids = self._postings[field].get(value)
+            if ids is not None:
+                ids.discard(vector_id)
+                if not ids:
+                    del self._postings[field][value]
+    
+    def _fetch_metadata(self, vector_ids: Iterable[int]) -> Dict[int, Dict[str, Any]]:
+        """
+        从数据库批量读取元数据正文
+        
+        Args:
+            vector_ids: 向量ID序列
+        
+        Returns:
+            Dict[int, Dict[str, Any]]: 向量ID -> 元数据
+        """
+        ids = list(vector_ids)
+        result = {}
+        for start in range(0, len(ids), _SQL_BATCH_SIZE):
+            batch = ids[start:start + _SQL_BATCH_SIZE]
+            placeholders = ",".join("?" * len(batch))
+            rows = self._conn.execute(
+                f"SELECT vector_id, metadata FROM vectors WHERE vector_id IN ({placeholders})",
+                batch
+            )
+            for vector_id, metadata in rows:
+                result[vector_id] = json.loads(metadata)
+        return result
+    
+    def _iter_metadata(
+        self,
+        vector_ids: Optional[Set[int]] = None
+    ) -> Iterator[Tuple[int, Dict[str, Any]]]:
+        """
+        遍历元数据正文（内存中未落盘的优先）
+        
+        Args:
+            vector_ids: 只遍历这些向量ID（None表示全部）
+        
+        Yields:
+            Tuple[int, Dict[str, Any]]: (向量ID, 元数据)
+        """
+        candidates = self._records.keys() if vector_ids is None else vector_ids
+        stored_ids = []
+        for vector_id in candidates:
+            record = self._records.get(vector_id)
+            if record is None:
+                continue
+            if record.metadata is not None:
+                yield vector_id, record.metadata
+            else:
+                stored_ids.append(vector_id)
+        
+        if vector_ids is None and not self._truncate:
+            # 全量扫描时顺序读表，比按ID批量查询更快
+            stored = set(stored_ids)
+            rows = self._conn.execute("SELECT vector_id, metadata FROM vectors")
+            for vector_id, metadata in rows:
+                if vector_id in stored:
+                    yield vector_id, json.loads(metadata)
+        else:
+            yield from self._fetch_metadata(stored_ids).items()
     
     def get_ids_by_type(self, memory_type: str) -> List[int]:
         """
@@ -210,17 +534,17 @@ class MetadataManager:
         
         Args:
             memory_type: 记忆类型
-            
+        
         Returns:
             List[int]: 向量ID列表
         """
         try:
             ids = []
-            for vector_id, record in self._metadata.items():
-                if record.get("memory_type") == memory_type:
+            for vector_id, record in self._records.items():
+                if record.memory_type == memory_type:
                     ids.append(vector_id)
             return ids
-            
+        
         except Exception as e:
             logger.error(f"根据类型获取向量ID失败: {e}")
             return []
@@ -234,17 +558,17 @@ class MetadataManager:
         
         Args:
             filter_func: 过滤函数，接受元数据记录作为参数
-            
+        
         Returns:
             List[int]: 向量ID列表
         """
         try:
             ids = []
-            for vector_id, record in self._metadata.items():
-                if filter_func(record):
+            for vector_id, metadata in self._iter_metadata():
+                if filter_func(self._records[vector_id].with_metadata(metadata)):
                     ids.append(vector_id)
             return ids
-            
+        
         except Exception as e:
             logger.error(f"根据过滤函数获取向量ID失败: {e}")
             return []
@@ -257,138 +581,275 @@ class MetadataManager:
             Dict[str, Any]: 统计信息
         """
         try:
-            total_vectors = len(self._metadata)
+            total_vectors = len(self._records)
             
             # 按类型统计
             type_stats = {}
-            for record in self._metadata.values():
-                memory_type = record.get("memory_type", "unknown")
-                type_stats[memory_type] = type_stats.get(memory_type, 0) + 1
+            for record in self._records.values():
+                type_stats[record.memory_type] = type_stats.get(record.memory_type, 0) + 1
             
             # 访问统计
-            total_access = sum(
-                record.get("access_count", 0) 
-                for record in self._metadata.values()
-            )
+            total_access = sum(record.access_count for record in self._records.values())
             
             # 时间统计
-            if self._metadata:
-                created_times = [
-                    datetime.fromisoformat(record["created_at"])
-                    for record in self._metadata.values()
-                ]
-                oldest = min(created_times)
-                newest = max(created_times)
+            if self._records:
+                created_times = [record.created_at for record in self._records.values()]
+                oldest = to_isoformat(min(created_times))
+                newest = to_isoformat(max(created_times))
             else:
                 oldest = newest = None
             
             return {
                 "total_vectors": total_vectors,
+                "id_table_bytes": sum(table.nbytes for table in self._id_tables.values()),
+                "pending_writes": len(self._dirty) + len(self._deleted),
                 "type_distribution": type_stats,
                 "total_access_count": total_access,
                 "average_access_per_vector": total_access / total_vectors if total_vectors > 0 else 0,
-                "oldest_vector": oldest.isoformat() if oldest else None,
-                "newest_vector": newest.isoformat() if newest else None
+                "oldest_vector": oldest,
+                "newest_vector": newest
             }
-            
+        
         except Exception as e:
             logger.error(f"获取元数据统计失败: {e}")
             return {}
     
-    def save(self) -> bool:
+    def save(self, wal_lsn: Optional[int] = None) -> bool:
         """
         保存元数据到磁盘
         
+        在一个事务中写入自上次保存以来变化的行、访问统计和ID表，
+        提交即快照；崩溃时保留上一次提交的完整状态。
+        
+        Args:
+            wal_lsn: 快照包含的最大预写日志序号
+        
         Returns:
             bool: 是否保存成功
         """
         try:
-            # 准备保存数据
-            save_data = {
-                "metadata": self._metadata,
-                "id_to_index": self._id_to_index,
-                "index_to_id": self._index_to_id,
-                "saved_at": datetime.utcnow().isoformat()
-            }
-            
-            # 保存到文件
-            with open(self.metadata_file, 'w', encoding='utf-8') as f:
-                json.dump(save_data, f, ensure_ascii=False, indent=2)
-            
-            logger.debug(f"元数据已保存: {len(self._metadata)} 条记录")
+            lsn = self.wal_lsn if wal_lsn is None else wal_lsn
+            dirty = [self._records[vector_id] for vector_id in self._dirty]
+            accessed = []
+            for vector_id in self._accessed - self._dirty:
+                record = self._records[vector_id]
+                accessed.append((record.last_accessed, record.access_count, vector_id))
+            
+            with self._conn:
+                if self._truncate:
+                    self._conn.execute("DELETE FROM vectors")
+                    self._conn.execute("DELETE FROM id_tables")
+                self._conn.executemany(
+                    "DELETE FROM vectors WHERE vector_id = ?",
+                    [(vector_id,) for vector_id in self._deleted]
+                )
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO vectors VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    [
+                        (
+                            record.vector_id,
+                            record.memory_type,
+                            record.index_name,
+                            record.created_at,
+                            record.last_accessed,
+                            record.access_count,
+                            json.dumps(record.metadata, ensure_ascii=False, separators=(",", ":"))
+                        )
+                        for record in dirty
+                    ]
+                )
+                self._conn.executemany(
+                    "UPDATE vectors SET last_accessed = ?, access_count = ? WHERE vector_id = ?",
+                    accessed
+                )
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO id_tables VALUES (?, ?)",
+                    [
+                        (name, table.ids.astype("<i8").tobytes())
+                        for name, table in self._id_tables.items()
+                    ]
+                )
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO store_state VALUES ('wal_lsn', ?)", (lsn,)
+                )
+            
+            # 已落盘的元数据正文不再常驻内存
+            for record in dirty:
+                record.metadata = None
+            self.wal_lsn = lsn
+            self._dirty.clear()
+            self._deleted.clear()
+            self._accessed.clear()
+            self._truncate = False
+            
+            if self.legacy_metadata_file.exists():
+                self.legacy_metadata_file.unlink()
+            
+            logger.debug(f"元数据已保存: 写入{len(dirty)}条, 访问统计{len(accessed)}条")
             return True
-            
+        
         except Exception as e:
             logger.error(f"保存元数据失败: {e}")
             return False
     
     def _load_metadata(self) -> None:
         """
-        从磁盘加载元数据
+        从磁盘加载元数据（只加载紧凑记录、ID表和倒排表，元数据正文按需读取）
         """
         try:
-            if not self.metadata_file.exists():
-                logger.info("元数据文件不存在，使用空元数据")
+            if self.legacy_metadata_file.exists():
+                self._migrate_legacy(self.legacy_metadata_file)
                 return
             
-            with open(self.metadata_file, 'r', encoding='utf-8') as f:
-                save_data = json.load(f)
-            
-            # 恢复数据
-            self._metadata = save_data.get("metadata", {})
-            self._id_to_index = save_data.get("id_to_index", {})
-            self._index_to_id = save_data.get("index_to_id", {})
+            indexed_columns = ", ".join(
+                f"json_extract(metadata, '$.{field}')" for field in INDEXED_FIELDS
+            )
+            rows = self._conn.execute(
+                "SELECT vector_id, memory_type, index_name, created_at, last_accessed, "
+                f"access_count, {indexed_columns} FROM vectors"
+            )
+            for row in rows:
+                vector_id = row[0]
+                self._records[vector_id] = MetadataRecord(*row[:6])
+                for field, value in zip(INDEXED_FIELDS, row[6:]):
+                    if value is not None:
+                        self._postings[field].setdefault(value, set()).add(vector_id)
+            
+            self._id_tables = {
+                name: IdTable.from_ids(np.frombuffer(ids, dtype="<i8"))
+                for name, ids in self._conn.execute("SELECT name, ids FROM id_tables")
+            }
             
-            logger.info(f"元数据已加载: {len(self._metadata)} 条记录")
+            row = self._conn.execute("SELECT value FROM store_state WHERE key = 'wal_lsn'").fetchone()
+            self.wal_lsn = row[0] if row else 0
             
+            if self._records:
+                logger.info(f"元数据已加载: {len(self._records)} 条记录")
+            else:
+                logger.info("元数据为空")
+        
         except Exception as e:
             logger.error(f"加载元数据失败: {e}")
             # 使用空数据
-            self._metadata = {}
-            self._id_to_index = {}
-            self._index_to_id = {}
+            self._records = {}
+            self._id_tables = {}
+            self._postings = {field: {} for field in INDEXED_FIELDS}
+    
+    def _migrate_legacy(self, legacy_file: Path) -> None:
+        """
+        把旧版本的JSON元数据文件导入数据库
+        
+        Args:
+            legacy_file: 旧版本元数据文件
+        """
+        records, id_tables, wal_lsn = self._read_legacy_json(legacy_file)
+        
+        self._truncate = True
+        for vector_id, record in records.items():
+            self._records[vector_id] = MetadataRecord(
+                vector_id,
+                record["memory_type"],
+                record["index_name"],
+                to_timestamp(record["created_at"]),
+                to_timestamp(record.get("last_accessed", record["created_at"])),
+                record.get("access_count", 0),
+                record["metadata"]
+            )
+            self._dirty.add(vector_id)
+            self._index_postings(vector_id, record["metadata"])
+        self._id_tables = id_tables
+        
+        if not self.save(wal_lsn=wal_lsn):
+            raise RuntimeError(f"迁移元数据文件失败: {legacy_file}")
+        logger.info(f"已迁移旧版本元数据文件: {legacy_file}, {len(records)} 条记录")
+    
+    @staticmethod
+    def _read_legacy_json(path: Path) -> Tuple[Dict[int, Dict[str, Any]], Dict[str, IdTable], int]:
+        """
+        读取旧版本的JSON元数据文件
+        
+        Args:
+            path: 文件路径
+        
+        Returns:
+            Tuple: (记录, ID表, 预写日志序号)
+        """
+        with open(path, 'r', encoding='utf-8') as f:
+            save_data = json.load(f)
+        
+        # 恢复数据（JSON对象的键是字符串）
+        records = {
+            int(vector_id): record
+            for vector_id, record in save_data.get("metadata", {}).items()
+        }
+        
+        if "id_tables" in save_data:
+            id_tables = {
+                name: IdTable.from_ids(ids)
+                for name, ids in save_data["id_tables"].items()
+            }
+        else:
+            # 更早的格式：按记录的记忆类型重建映射表
+            id_tables = {}
+            for vector_id, record in records.items():
+                index_name = "short_term" if record.get("memory_type") == "short_term" else "long_term"
+                record["index_name"] = index_name
+                record.pop("index_position", None)
+                id_tables.setdefault(index_name, IdTable()).add(vector_id)
+        
+        for record in records.values():
+            record.setdefault("index_name", record["memory_type"])
+        
+        return records, id_tables, save_data.get("wal_lsn", 0)
     
     def clear(self) -> bool:
         """
-        清空所有元数据
+        清空所有元数据（数据库中的行在下次保存时删除）
         
         Returns:
             bool: 是否清空成功
         """
         try:
-            self._metadata.clear()
-            self._id_to_index.clear()
-            self._index_to_id.clear()
+            self._records.clear()
+            self._id_tables.clear()
+            self._postings = {field: {} for field in INDEXED_FIELDS}
+            self._dirty.clear()
+            self._deleted.clear()
+            self._accessed.clear()
+            self._truncate = True
             
             logger.info("元数据已清空")
             return True
-            
+        
         except Exception as e:
             logger.error(f"清空元数据失败: {e}")
             return False
     
+    def close(self) -> None:
+        """
+        关闭数据库连接（未保存的修改由预写日志恢复）
+        """
+        self._conn.close()
+    
     def cleanup_old_metadata(self, max_age_days: int = 30) -> int:
         """
         清理旧元数据
         
         Args:
             max_age_days: 最大保留天数
-            
+        
         Returns:
             int: 清理的记录数量
         """
         try:
-            from datetime import timedelta
-            
-            cutoff_date = datetime.utcnow() - timedelta(days=max_age_days)
+            cutoff = (datetime.now(timezone.utc) - timedelta(days=max_age_days)).timestamp()
             cleaned_count = 0
             
             # 找到需要清理的向量ID
-            ids_to_remove = []
-            for vector_id, record in self._metadata.items():
-                created_at = datetime.fromisoformat(record["created_at"])
-                if created_at < cutoff_date:
-                    ids_to_remove.append(vector_id)
+            ids_to_remove = [
+                vector_id for vector_id, record in self._records.items()
+                if record.created_at < cutoff
+            ]
             
             # 删除旧记录
             for vector_id in ids_to_remove:
@@ -397,7 +858,7 @@ class MetadataManager:
             
             logger.info(f"清理了 {cleaned_count} 条旧元数据")
             return cleaned_count
-            
+        
         except Exception as e:
             logger.error(f"清理旧元数据失败: {e}")
             return 0
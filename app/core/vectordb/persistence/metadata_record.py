@@ -0,0 +1,150 @@
+"""
+向量元数据记录
+
+每个向量常驻内存的紧凑记录：固定字段使用 __slots__，时间戳为浮点秒数，
+记录名称字段驻留（intern）共享；完整的记忆元数据（含content）存放在SQLite中，
+只有尚未落盘或本次读取的记录才携带。
+"""
+
+import sys
+import time
+from datetime import datetime, timezone
+from typing import Any, Dict, Optional
+
+
+def to_timestamp(value: Optional[str]) -> float:
+    """
+    ISO格式的UTC时间转为时间戳
+
+    Args:
+        value: ISO格式时间（不带时区时按UTC处理），None表示当前时间
+
+    Returns:
+        float: 时间戳（秒）
+    """
+    if value is None:
+        return time.time()
+    moment = datetime.fromisoformat(value)
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    return moment.timestamp()
+
+
+def to_isoformat(timestamp: float) -> str:
+    """
+    时间戳转为ISO格式的UTC时间（不带时区，与历史数据格式一致）
+
+    Args:
+        timestamp: 时间戳（秒）
+
+    Returns:
+        str: ISO格式时间
+    """
+    return datetime.fromtimestamp(timestamp, timezone.utc).replace(tzinfo=None).isoformat()
+
+
+class MetadataRecord:
+    """
+    向量元数据记录
+
+    兼容原先的字典记录：record["metadata"]、record["created_at"] 等下标访问仍然可用，
+    时间字段按ISO字符串返回。
+    """
+
+    __slots__ = (
+        "vector_id",
+        "memory_type",
+        "index_name",
+        "created_at",
+        "last_accessed",
+        "access_count",
+        "metadata",
+        "version"
+    )
+
+    def __init__(
+        self,
+        vector_id: int,
+        memory_type: str,
+        index_name: str,
+        created_at: float,
+        last_accessed: float,
+        access_count: int = 0,
+        metadata: Optional[Dict[str, Any]] = None,
+        version: int = 0
+    ):
+        """
+        初始化元数据记录
+
+        Args:
+            vector_id: 向量ID
+            memory_type: 记忆类型
+            index_name: 所在索引名称
+            created_at: 创建时间戳
+            last_accessed: 最近访问时间戳
+            access_count: 访问次数
+            metadata: 完整元数据（未加载时为None）
+            version: 写入序号（进程内每次添加或更新递增，从磁盘加载的记录为0）
+        """
+        self.vector_id = vector_id
+        self.memory_type = sys.intern(memory_type)
+        self.index_name = sys.intern(index_name)
+        self.created_at = created_at
+        self.last_accessed = last_accessed
+        self.access_count = access_count
+        self.metadata = metadata
+        self.version = version
+
+    def with_metadata(self, metadata: Dict[str, Any]) -> "MetadataRecord":
+        """
+        复制记录并附带完整元数据（常驻记录本身不持有元数据）
+
+        Args:
+            metadata: 完整元数据
+
+        Returns:
+            MetadataRecord: 新记录
+        """
+        return MetadataRecord(
+            self.vector_id,
+            self.memory_type,
+            self.index_name,
+            self.created_at,
+            self.last_accessed,
+            self.access_count,
+            metadata,
+            self.version
+        )
+
+    def to_dict(self) -> Dict[str, Any]:
+        """
+        转为字典（时间字段为ISO字符串）
+
+        Returns:
+            Dict[str, Any]: 记录字典
+        """
+        return {
+            "vector_id": self.vector_id,
+            "memory_type": self.memory_type,
+            "index_name": self.index_name,
+            "created_at": to_isoformat(self.created_at),
+            "last_accessed": to_isoformat(self.last_accessed),
+            "access_count": self.access_count,
+            "metadata": self.metadata
+        }
+
+    def __getitem__(self, key: str) -> Any:
+        if key in ("created_at", "last_accessed"):
+            return to_isoformat(getattr(self, key))
+        if key not in self.__slots__:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def get(self, key: str, default: Any = None) -> Any:
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def __repr__(self) -> str:
+        return f"MetadataRecord(vector_id={self.vector_id}, index_name={self.index_name!r})"
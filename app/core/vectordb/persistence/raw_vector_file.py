@@ -0,0 +1,168 @@
+"""
+原始向量文件
+
+量化索引只在内存中保留压缩编码，原始float32向量存放在磁盘文件中，
+用于对候选结果做精确重排序和评估召回损失：
+- <name>.vec：按行存放的float32向量
+- <name>.vec.ids：行号对应的向量ID（int64，保存时写入）
+"""
+
+import logging
+import os
+from pathlib import Path
+from typing import Iterable, Optional, Tuple
+import numpy as np
+
+from .id_table import IdTable
+
+logger = logging.getLogger(__name__)
+
+
+class RawVectorFile:
+    """
+    原始向量文件
+
+    同一向量ID重复写入时原地覆盖，行号只增不删；删除由所属分片的墓碑负责，
+    压缩时按保留的ID重写文件。
+    """
+
+    def __init__(self, path: str, dimension: int):
+        """
+        初始化原始向量文件（文件存在时加载行号映射）
+
+        Args:
+            path: 向量文件路径
+            dimension: 向量维度
+        """
+        self.path = Path(path)
+        self.ids_path = self.path.with_name(self.path.name + ".ids")
+        self.dimension = dimension
+        self.row_bytes = dimension * np.dtype(np.float32).itemsize
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+
+        ids = np.empty(0, dtype=np.int64)
+        if self.path.exists() and self.ids_path.exists():
+            ids = np.fromfile(self.ids_path, dtype=np.int64)
+        self._table = IdTable.from_ids(ids)
+
+        # 截掉上次保存后写入、但没有登记行号的数据
+        with open(self.path, "ab") as f:
+            f.truncate(len(ids) * self.row_bytes)
+        self._fd = os.open(self.path, os.O_RDWR)
+
+    def __len__(self) -> int:
+        return len(self._table)
+
+    def __contains__(self, vector_id: int) -> bool:
+        return vector_id in self._table
+
+    @property
+    def nbytes(self) -> int:
+        """
+        文件占用的字节数
+
+        Returns:
+            int: 向量数据字节数
+        """
+        return len(self._table) * self.row_bytes
+
+    def put(self, vector_ids: np.ndarray, vectors: np.ndarray) -> None:
+        """
+        写入向量（已存在的ID原地覆盖）
+
+        Args:
+            vector_ids: int64向量ID数组
+            vectors: float32向量矩阵
+        """
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        for vector_id, vector in zip(vector_ids, vectors):
+            row = self._table.row_of(int(vector_id))
+            if row is None:
+                row = self._table.add(int(vector_id))
+            os.pwrite(self._fd, vector.tobytes(), row * self.row_bytes)
+
+    def get(self, vector_ids: np.ndarray) -> np.ndarray:
+        """
+        读取向量
+
+        Args:
+            vector_ids: int64向量ID数组
+
+        Returns:
+            np.ndarray: float32向量矩阵，不存在的ID对应行为0
+        """
+        result = np.zeros((len(vector_ids), self.dimension), dtype=np.float32)
+        for i, vector_id in enumerate(vector_ids):
+            row = self._table.row_of(int(vector_id))
+            if row is not None:
+                data = os.pread(self._fd, self.row_bytes, row * self.row_bytes)
+                result[i] = np.frombuffer(data, dtype=np.float32)
+        return result
+
+    def get_all(self) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        顺序读取全部向量
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray]: (向量ID数组, 向量矩阵)
+        """
+        ids = self._table.ids
+        data = np.fromfile(self.path, dtype=np.float32, count=len(ids) * self.dimension)
+        return ids, data.reshape(-1, self.dimension)
+
+    def prepare_compaction(self, keep_ids: Iterable[int]) -> Optional[Path]:
+        """
+        把需要保留的向量写入临时文件（同步方法，在线程池中执行）
+
+        Args:
+            keep_ids: 保留的向量ID
+
+        Returns:
+            Optional[Path]: 临时文件路径，无需压缩时返回None
+        """
+        keep = np.fromiter(keep_ids, dtype=np.int64)
+        keep = keep[np.isin(keep, self._table.ids)]
+        if len(keep) == len(self._table):
+            return None
+
+        tmp_path = self.path.with_name(self.path.name + ".tmp")
+        with open(tmp_path, "wb") as f:
+            f.write(self.get(keep).tobytes())
+        keep.tofile(tmp_path.with_name(tmp_path.name + ".ids"))
+        return tmp_path
+
+    def commit_compaction(self, tmp_path: Optional[Path]) -> None:
+        """
+        用压缩后的临时文件原子替换当前文件
+
+        Args:
+            tmp_path: prepare_compaction() 返回的临时文件
+        """
+        if tmp_path is None:
+            return
+
+        tmp_ids_path = tmp_path.with_name(tmp_path.name + ".ids")
+        ids = np.fromfile(tmp_ids_path, dtype=np.int64)
+        os.close(self._fd)
+        os.replace(tmp_path, self.path)
+        os.replace(tmp_ids_path, self.ids_path)
+        self._table = IdTable.from_ids(ids)
+        self._fd = os.open(self.path, os.O_RDWR)
+
+    def save(self) -> None:
+        """
+        刷新数据并保存行号映射
+        """
+        os.fsync(self._fd)
+        tmp_path = self.ids_path.with_name(self.ids_path.name + ".tmp")
+        self._table.ids.tofile(tmp_path)
+        os.replace(tmp_path, self.ids_path)
+
+    def close(self) -> None:
+        """
+        关闭文件
+        """
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
@@ -0,0 +1,283 @@
+"""
+向量存储预写日志（WAL）
+
+每次增删先以追加方式写入日志，持久化开销与本次写入的数据量成正比；
+快照落盘后截断已包含在快照中的日志，启动时重放快照之后的记录。
+
+fsync 在线程池中执行并成组提交：同一时刻最多一个 fsync，覆盖它开始前写入的全部记录，
+等待中的写入方共享下一次 fsync，事件循环不会阻塞在磁盘同步上。
+
+记录格式（小端）：
+- 帧头：u32 记录体长度 | u32 记录体CRC32
+- 记录体：u64 LSN | u8 操作 | i64 向量ID | u32 JSON长度 | JSON | float32向量（仅添加）
+"""
+
+import asyncio
+import json
+import logging
+import os
+import struct
+import zlib
+from pathlib import Path
+from typing import Any, Dict, Iterator, NamedTuple, Optional, Tuple
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# 操作类型
+OP_ADD = 1
+OP_REMOVE = 2
+
+_FRAME_HEADER = struct.Struct("<II")
+_RECORD_HEADER = struct.Struct("<QBqI")
+
+
+class WalRecord(NamedTuple):
+    """预写日志记录"""
+
+    lsn: int
+    op: int
+    vector_id: int
+    payload: Dict[str, Any]
+    vector: Optional[np.ndarray]
+
+
+class WriteAheadLog:
+    """
+    预写日志
+
+    只追加写入；打开时扫描日志，丢弃崩溃时写了一半的尾部记录。
+    append 只写入记录，调用方再用 wait_durable 等待记录落盘。
+    """
+
+    def __init__(self, path: str, sync: bool = True):
+        """
+        初始化预写日志
+
+        Args:
+            path: 日志文件路径
+            sync: 写入后是否等待fsync（关闭时进程崩溃不丢记录，但掉电可能丢失最近的记录）
+        """
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.sync = sync
+
+        self.last_lsn = 0
+        self.record_count = 0
+        valid_bytes = 0
+        for record, end in self._scan():
+            self.last_lsn = record.lsn
+            self.record_count += 1
+            valid_bytes = end
+
+        # 截掉不完整的尾部记录
+        with open(self.path, "ab") as f:
+            if f.tell() > valid_bytes:
+                logger.warning(f"预写日志尾部不完整，已截断: {self.path}")
+                f.truncate(valid_bytes)
+
+        self._fd = os.open(self.path, os.O_WRONLY | os.O_APPEND)
+
+        # 已fsync的最大LSN，以及进行中的fsync任务
+        self.synced_lsn = self.last_lsn
+        self._sync_task: Optional[asyncio.Task] = None
+        self.sync_count = 0
+
+    @property
+    def size_bytes(self) -> int:
+        """
+        日志文件大小
+
+        Returns:
+            int: 字节数
+        """
+        return self.path.stat().st_size if self.path.exists() else 0
+
+    def append(
+        self,
+        op: int,
+        vector_id: int,
+        payload: Dict[str, Any],
+        vector: Optional[np.ndarray] = None
+    ) -> int:
+        """
+        追加一条记录（只写入，不等待落盘）
+
+        Args:
+            op: 操作类型（OP_ADD / OP_REMOVE）
+            vector_id: 向量ID
+            payload: 可JSON序列化的附加数据
+            vector: 添加操作的向量
+
+        Returns:
+            int: 记录的LSN
+        """
+        lsn = self.last_lsn + 1
+        os.write(self._fd, self._encode(lsn, op, vector_id, payload, vector))
+
+        self.last_lsn = lsn
+        self.record_count += 1
+        return lsn
+
+    async def wait_durable(self, lsn: int) -> None:
+        """
+        等待LSN不大于给定值的记录落盘（sync关闭时立即返回）
+
+        已有fsync进行中时等待它完成；它开始后才写入的记录由下一次fsync一并覆盖。
+
+        Args:
+            lsn: 需要落盘的LSN
+        """
+        if not self.sync:
+            return
+        while self.synced_lsn < lsn:
+            if self._sync_task is None:
+                self._sync_task = asyncio.ensure_future(self._fsync())
+            await asyncio.shield(self._sync_task)
+
+    async def flush(self) -> None:
+        """
+        等待已写入的记录全部落盘且没有进行中的fsync（截断或关闭日志前调用）
+        """
+        await self.wait_durable(self.last_lsn)
+        while self._sync_task is not None:
+            await asyncio.shield(self._sync_task)
+
+    async def _fsync(self) -> None:
+        """
+        在线程池中fsync日志文件，覆盖开始前写入的全部记录
+        """
+        try:
+            target = self.last_lsn
+            await asyncio.get_running_loop().run_in_executor(None, os.fsync, self._fd)
+            self.synced_lsn = max(self.synced_lsn, target)
+            self.sync_count += 1
+        finally:
+            self._sync_task = None
+
+    def advance_lsn(self, lsn: int) -> None:
+        """
+        保证后续记录的LSN大于给定值（日志截断为空后，LSN从快照继续递增）
+
+        Args:
+            lsn: 已持久化的最大LSN
+        """
+        self.last_lsn = max(self.last_lsn, lsn)
+        self.synced_lsn = max(self.synced_lsn, lsn)
+
+    def records(self, after_lsn: int = 0) -> Iterator[WalRecord]:
+        """
+        按顺序读取记录
+
+        Args:
+            after_lsn: 只返回LSN大于该值的记录
+
+        Yields:
+            WalRecord: 日志记录
+        """
+        for record, _ in self._scan():
+            if record.lsn > after_lsn:
+                yield record
+
+    def truncate_through(self, lsn: int) -> None:
+        """
+        丢弃LSN不大于给定值的记录（已包含在快照中）
+
+        保留的记录写入临时文件后原子替换日志（调用前先 await flush()，不能有进行中的fsync）。
+
+        Args:
+            lsn: 快照包含的最大LSN
+        """
+        tmp_path = self.path.with_name(self.path.name + ".tmp")
+        kept = 0
+        with open(tmp_path, "wb") as f:
+            for record in self.records(after_lsn=lsn):
+                f.write(self._encode(*record))
+                kept += 1
+            f.flush()
+            os.fsync(f.fileno())
+
+        os.close(self._fd)
+        os.replace(tmp_path, self.path)
+        self._fd = os.open(self.path, os.O_WRONLY | os.O_APPEND)
+        self.record_count = kept
+        self.synced_lsn = self.last_lsn
+
+    def close(self) -> None:
+        """
+        关闭日志
+        """
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+    def _scan(self) -> Iterator[Tuple[WalRecord, int]]:
+        """
+        扫描日志中的完整记录
+
+        Yields:
+            Tuple[WalRecord, int]: (记录, 记录结束位置)
+        """
+        if not self.path.exists():
+            return
+
+        with open(self.path, "rb") as f:
+            data = f.read()
+
+        offset = 0
+        while offset + _FRAME_HEADER.size <= len(data):
+            length, checksum = _FRAME_HEADER.unpack_from(data, offset)
+            start = offset + _FRAME_HEADER.size
+            body = data[start:start + length]
+            if len(body) < length or zlib.crc32(body) != checksum:
+                return
+            offset = start + length
+            yield self._decode(body), offset
+
+    @staticmethod
+    def _encode(
+        lsn: int,
+        op: int,
+        vector_id: int,
+        payload: Dict[str, Any],
+        vector: Optional[np.ndarray]
+    ) -> bytes:
+        """
+        编码一条记录（含帧头）
+
+        Args:
+            lsn: 日志序号
+            op: 操作类型
+            vector_id: 向量ID
+            payload: 附加数据
+            vector: 向量（可选）
+
+        Returns:
+            bytes: 编码后的记录
+        """
+        payload_bytes = json.dumps(payload, ensure_ascii=False, default=str).encode("utf-8")
+        vector_bytes = b"" if vector is None else np.asarray(vector, dtype=np.float32).tobytes()
+        body = (
+            _RECORD_HEADER.pack(lsn, op, int(vector_id), len(payload_bytes))
+            + payload_bytes
+            + vector_bytes
+        )
+        return _FRAME_HEADER.pack(len(body), zlib.crc32(body)) + body
+
+    @staticmethod
+    def _decode(body: bytes) -> WalRecord:
+        """
+        解码记录体
+
+        Args:
+            body: 记录体字节
+
+        Returns:
+            WalRecord: 日志记录
+        """
+        lsn, op, vector_id, payload_length = _RECORD_HEADER.unpack_from(body)
+        start = _RECORD_HEADER.size
+        payload = json.loads(body[start:start + payload_length].decode("utf-8"))
+        vector_bytes = body[start + payload_length:]
+        vector = np.frombuffer(vector_bytes, dtype=np.float32).copy() if vector_bytes else None
+        return WalRecord(lsn, op, vector_id, payload, vector)
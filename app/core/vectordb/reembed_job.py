@@ -0,0 +1,189 @@
+"""
+批量重新向量化任务
+
+更换向量化模型时，在后台把现有向量存储中的记忆用新模型重新向量化，写入新的向量存储。
+新模型的向量缓存（按模型命名空间区分）随之填充，切换模型后缓存与索引都是热的。
+"""
+
+import logging
+import asyncio
+from typing import Any, Dict, List, Optional, Set
+
+from .memory_vector_store import MemoryVectorStore
+
+logger = logging.getLogger(__name__)
+
+
+class ReembedJob:
+    """
+    批量重新向量化任务
+
+    源存储在迁移期间照常读写：全量迁移结束后做追平，补上新增的记忆、删除已删除的记忆，
+    并重新迁移写入序号与迁移时不同（迁移期间被改写）的记忆，直到两边一致。
+    迁移完成后由调用方把服务切换到目标存储。
+    记忆内容取自元数据的 content 字段，没有内容的向量无法重新向量化，会被跳过。
+    """
+
+    def __init__(
+        self,
+        source: MemoryVectorStore,
+        target: MemoryVectorStore,
+        batch_size: int = 256,
+        max_catch_up_rounds: int = 5
+    ):
+        """
+        初始化重新向量化任务
+
+        Args:
+            source: 旧模型的向量存储
+            target: 新模型的向量存储（使用新的向量化服务和独立的持久化目录）
+            batch_size: 每批重新向量化的记忆数
+            max_catch_up_rounds: 追平源存储变更的最大轮数
+        """
+        if source.persist_dir == target.persist_dir:
+            raise ValueError("目标存储必须使用独立的持久化目录")
+
+        self.source = source
+        self.target = target
+        self.batch_size = max(batch_size, 1)
+        self.max_catch_up_rounds = max_catch_up_rounds
+
+        # 进度
+        self.total = 0
+        self.migrated = 0
+        self.skipped = 0
+        self.removed = 0
+        self.completed = False
+
+        # 无法迁移的向量ID（记录未被改写时追平不再重试）
+        self._skipped: Set[int] = set()
+
+        # 向量ID -> 迁移（或跳过）时源记录的写入序号
+        self._versions: Dict[int, int] = {}
+
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self) -> asyncio.Task:
+        """
+        在后台启动任务（重复调用返回同一个任务）
+
+        Returns:
+            asyncio.Task: 任务，结果为是否迁移成功
+        """
+        if self._task is None:
+            self._task = asyncio.ensure_future(self.run())
+        return self._task
+
+    async def run(self) -> bool:
+        """
+        执行迁移：全量重新向量化，追平期间的变更，最后保存目标存储
+
+        Returns:
+            bool: 是否迁移成功
+        """
+        try:
+            for _ in range(self.max_catch_up_rounds + 1):
+                source_ids = set(self.source.metadata_manager.get_all_ids())
+                target_ids = set(self.target.metadata_manager.get_all_ids())
+
+                changed = self._changed_ids(source_ids)
+                self._skipped -= changed
+                missing = sorted((source_ids - target_ids - self._skipped) | changed)
+                stale = target_ids - source_ids
+                if not missing and not stale:
+                    break
+
+                self.total += len(missing)
+                for start in range(0, len(missing), self.batch_size):
+                    await self._migrate_batch(missing[start:start + self.batch_size])
+
+                for vector_id in stale:
+                    self._versions.pop(vector_id, None)
+                    if await self.target.remove_vector(vector_id):
+                        self.removed += 1
+            else:
+                logger.warning("重新向量化未能追平源存储的变更，请稍后再次运行")
+                return False
+
+            await self.target.save()
+            self.completed = True
+            logger.info(
+                f"重新向量化完成: 迁移={self.migrated}, 跳过={self.skipped}, 删除={self.removed}"
+            )
+            return True
+
+        except Exception as e:
+            logger.error(f"重新向量化失败: {e}")
+            return False
+
+    def get_progress(self) -> Dict[str, Any]:
+        """
+        获取任务进度
+
+        Returns:
+            Dict[str, Any]: 进度信息
+        """
+        done = self.migrated + self.skipped
+        return {
+            "total": self.total,
+            "migrated": self.migrated,
+            "skipped": self.skipped,
+            "removed": self.removed,
+            "progress": done / self.total if self.total else 1.0,
+            "completed": self.completed
+        }
+
+    def _changed_ids(self, source_ids: Set[int]) -> Set[int]:
+        """
+        找出迁移后在源存储中被改写的记忆（写入序号与迁移时不同）
+
+        Args:
+            source_ids: 源存储当前的向量ID
+
+        Returns:
+            Set[int]: 需要重新迁移的向量ID
+        """
+        changed = set()
+        for vector_id, version in self._versions.items():
+            record = self.source.metadata_manager.get_record(vector_id)
+            if record is not None and vector_id in source_ids and record.version != version:
+                changed.add(vector_id)
+        return changed
+
+    async def _migrate_batch(self, vector_ids: List[int]) -> None:
+        """
+        重新向量化一批记忆并写入目标存储
+
+        Args:
+            vector_ids: 向量ID列表
+        """
+        records = self.source.metadata_manager.get_many(vector_ids, touch=False)
+
+        items = []
+        for vector_id in vector_ids:
+            record = records.get(vector_id)
+            if record is not None:
+                self._versions[vector_id] = record.version
+            content = record.metadata.get("content") if record is not None else None
+            if not content:
+                self._skipped.add(vector_id)
+                self.skipped += 1
+                continue
+            items.append((vector_id, record, content))
+        if not items:
+            return
+
+        # 批量向量化同时写入新模型命名空间下的缓存
+        vectors = await self.target.embedding_service.embed_batch([content for _, _, content in items])
+
+        for (vector_id, record, _), vector in zip(items, vectors):
+            if await self.target.add_vector(
+                vector_id, vector, record.metadata, created_at=record["created_at"]
+            ):
+                self.migrated += 1
+            else:
+                self._skipped.add(vector_id)
+                self.skipped += 1
+
+        # 让出事件循环，避免长时间占用
+        await asyncio.sleep(0)
@@ -0,0 +1,609 @@
+"""
+向量分片
+
+封装单个FAISS索引（每个分区的短期/长期记忆各一个分片），负责：
+- 以外部向量ID作为FAISS标签（ID映射索引）
+- 删除时记录墓碑，避免每次删除都搬移整个索引
+- 墓碑比例超过阈值后在后台压缩重建并原子替换
+- 基于真实向量在后台重建为其他索引类型（Flat -> IVF/HNSW）并原子替换
+- 量化索引（SQ8/PQ）的候选结果用磁盘上的原始向量精确重排序
+- 内存映射加载的只读索引在首次写入前复制为私有索引（写时复制）
+"""
+
+import logging
+import asyncio
+from pathlib import Path
+from typing import Iterable, List, Optional, Set, Tuple
+import numpy as np
+
+try:
+    import faiss
+except ImportError:
+    faiss = None
+
+from .persistence.raw_vector_file import RawVectorFile
+
+logger = logging.getLogger(__name__)
+
+
+class VectorShard:
+    """
+    向量分片
+
+    持有一个FAISS索引及其墓碑集合。删除只写墓碑（O(1)），
+    物理删除由 compact() 批量完成。
+    """
+
+    def __init__(
+        self,
+        name: str,
+        index: 'faiss.Index',
+        raw_vectors: Optional[RawVectorFile] = None,
+        rerank_factor: int = 4,
+        mapped: bool = False
+    ):
+        """
+        初始化向量分片
+
+        Args:
+            name: 分片名称（如 "short_term"）
+            index: 支持 add_with_ids 的FAISS索引
+            raw_vectors: 原始向量文件（量化模式下用于精确重排序）
+            rerank_factor: 量化索引取回 top_k * rerank_factor 个候选再重排序
+            mapped: 索引是否以只读内存映射方式加载（数据与其他进程共享页缓存）
+        """
+        self.name = name
+        self.index = index
+        self.mapped = mapped
+        self.raw_vectors = raw_vectors
+        self.rerank_factor = max(rerank_factor, 1)
+
+        # 压缩时准备好的原始向量临时文件，swap() 时提交
+        self._raw_compaction: Optional[Path] = None
+
+        # 已删除但尚未物理移除的向量ID
+        self.tombstones: Set[int] = set()
+
+        # 不支持物理删除的索引（HNSW）中，重新写入后仍残留旧行的向量ID
+        self.shadowed: Set[int] = set()
+        self._stale_rows = 0
+
+        # 后台重建期间写入的向量ID（None表示没有进行中的重建）
+        self._rebuild_writes: Optional[Set[int]] = None
+
+        # 写锁：压缩期间阻塞写入，搜索继续使用旧索引
+        self.lock = asyncio.Lock()
+
+        # 自上次持久化以来是否有写入
+        self.dirty = False
+
+        # 已应用到该分片的最大预写日志序号（随索引一起持久化）
+        self.applied_lsn = 0
+
+    @property
+    def ntotal(self) -> int:
+        """
+        索引中的向量总数（含墓碑）
+
+        Returns:
+            int: 向量总数
+        """
+        return self.index.ntotal if self.index is not None else 0
+
+    @property
+    def live_count(self) -> int:
+        """
+        有效向量数量
+
+        Returns:
+            int: 不含墓碑的向量数量
+        """
+        return self.ntotal - len(self.tombstones) - self._stale_rows
+
+    @property
+    def tombstone_ratio(self) -> float:
+        """
+        墓碑比例
+
+        Returns:
+            float: （墓碑数量 + 残留旧行数量） / 索引向量总数
+        """
+        total = self.ntotal
+        return (len(self.tombstones) + self._stale_rows) / total if total > 0 else 0.0
+
+    @property
+    def index_kind(self) -> str:
+        """
+        索引类型
+
+        Returns:
+            str: "Flat"、"IVFFlat" 或 "HNSW"
+        """
+        inner = self._inner_index(self.index)
+        if isinstance(inner, faiss.IndexHNSW):
+            return "HNSW"
+        if isinstance(inner, faiss.IndexIVF):
+            return "IVFFlat"
+        return "Flat"
+
+    @property
+    def quantization(self) -> Optional[str]:
+        """
+        索引的量化方式
+
+        Returns:
+            Optional[str]: "SQ8"、"PQ"，未量化时返回None
+        """
+        inner = self._inner_index(self.index)
+        if isinstance(inner, faiss.IndexHNSW):
+            inner = faiss.downcast_index(inner.storage)
+        if isinstance(inner, (faiss.IndexScalarQuantizer, faiss.IndexIVFScalarQuantizer)):
+            return "SQ8"
+        if isinstance(inner, (faiss.IndexPQ, faiss.IndexIVFPQ)):
+            return "PQ"
+        return None
+
+    @property
+    def rebuilding(self) -> bool:
+        """
+        是否有进行中的后台重建
+
+        Returns:
+            bool: 是否正在重建
+        """
+        return self._rebuild_writes is not None
+
+    @property
+    def supports_removal(self) -> bool:
+        """
+        索引是否支持物理删除（HNSW图不支持）
+
+        Returns:
+            bool: 是否支持 remove_ids
+        """
+        return self.index_kind != "HNSW"
+
+    def add(self, vector_ids: np.ndarray, vectors: np.ndarray) -> None:
+        """
+        添加向量
+
+        若某个ID仍以墓碑形式留在索引中（删除后立即重新添加，例如更新），
+        先将其物理移除，避免同一标签出现两行；HNSW无法删除，
+        旧行保留到下次重建，搜索时按最新向量重新打分。
+
+        Args:
+            vector_ids: int64向量ID数组
+            vectors: float32向量矩阵，形状为 (n, dimension)
+        """
+        self.materialize()
+
+        stale = [int(vid) for vid in vector_ids if int(vid) in self.tombstones]
+        if stale:
+            if self.supports_removal:
+                self._remove_ids(self.index, stale)
+            else:
+                self.shadowed.update(stale)
+                self._stale_rows += len(stale)
+            self.tombstones.difference_update(stale)
+
+        if not self.index.is_trained:
+            raise RuntimeError(f"分片 {self.name} 的索引尚未训练")
+
+        self.index.add_with_ids(vectors, vector_ids)
+        if self.raw_vectors is not None:
+            self.raw_vectors.put(vector_ids, vectors)
+        if self._rebuild_writes is not None:
+            self._rebuild_writes.update(int(vid) for vid in vector_ids)
+        self.dirty = True
+
+    def remove(self, vector_id: int) -> None:
+        """
+        删除向量（记录墓碑）
+
+        Args:
+            vector_id: 向量ID
+        """
+        self.tombstones.add(vector_id)
+        self.dirty = True
+
+    def materialize(self) -> None:
+        """
+        把内存映射的只读索引复制为进程私有的索引
+
+        映射的数据不属于索引本身，直接写入会使FAISS中止进程（而非抛出异常），
+        因此所有修改索引的路径都先调用本方法。clone_index 会保留映射视图，
+        只能通过序列化再反序列化得到独立副本。
+        """
+        if not self.mapped:
+            return
+        self.index = faiss.deserialize_index(faiss.serialize_index(self.index))
+        self.mapped = False
+        logger.debug(f"分片 {self.name} 已从内存映射复制为私有索引")
+
+    def search(
+        self,
+        query_vectors: np.ndarray,
+        top_k: int,
+        allowed_ids: Optional[np.ndarray] = None,
+        rerank: bool = True
+    ) -> List[List[Tuple[int, float]]]:
+        """
+        搜索分片
+
+        过滤条件和墓碑都以FAISS ID选择器下推到索引内部，
+        一次搜索即可得到范围内的前k个结果。量化索引多取候选，
+        再用原始向量计算精确分数重排序。
+
+        Args:
+            query_vectors: 查询向量矩阵，形状为 (n, dimension)
+            top_k: 每个查询返回的结果数
+            allowed_ids: 允许返回的向量ID（None表示不限制）
+            rerank: 量化索引是否用原始向量重排序
+
+        Returns:
+            List[List[Tuple[int, float]]]: 每个查询的 [(vector_id, score), ...]
+        """
+        if allowed_ids is not None:
+            # 调用方传入的是有效ID，不含墓碑
+            candidate_count = len(allowed_ids)
+            selector = self._make_batch_selector(allowed_ids)
+        elif self.tombstones:
+            candidate_count = self.live_count
+            excluded = np.fromiter(self.tombstones, dtype=np.int64)
+            inner = self._make_batch_selector(excluded)
+            selector = faiss.IDSelectorNot(inner)
+        else:
+            candidate_count = self.ntotal
+            selector = None
+
+        k = min(top_k, candidate_count)
+        if k <= 0:
+            return [[] for _ in range(len(query_vectors))]
+
+        rerank = rerank and self.raw_vectors is not None and self.quantization is not None
+        if rerank:
+            k = min(top_k * self.rerank_factor, candidate_count)
+
+        # 残留旧行可能占用结果位置，多取一些再去重
+        if self.shadowed:
+            k = min(k + self._stale_rows, self.ntotal)
+
+        if selector is None:
+            distances, labels = self.index.search(query_vectors, k)
+        else:
+            distances, labels = self.index.search(
+                query_vectors, k, params=self._make_search_params(selector)
+            )
+
+        results = []
+        for query, row_distances, row_labels in zip(query_vectors, distances, labels):
+            hits = [
+                (int(label), float(distance))
+                for distance, label in zip(row_distances, row_labels)
+                if label != -1
+            ]
+            if rerank:
+                hits = self._rerank(query, hits)[:top_k]
+            elif self.shadowed:
+                hits = self._rescore_shadowed(query, hits)[:top_k]
+            results.append(hits)
+        return results
+
+    def _rerank(
+        self,
+        query_vector: np.ndarray,
+        hits: List[Tuple[int, float]]
+    ) -> List[Tuple[int, float]]:
+        """
+        用原始向量的精确内积为候选重新打分（同时去掉重复标签）
+
+        Args:
+            query_vector: 单个查询向量
+            hits: 量化索引返回的候选
+
+        Returns:
+            List[Tuple[int, float]]: 按精确分数排序的结果
+        """
+        vector_ids = np.array(list(dict.fromkeys(vector_id for vector_id, _ in hits)), dtype=np.int64)
+        if vector_ids.size == 0:
+            return []
+        scores = self.raw_vectors.get(vector_ids) @ query_vector
+        order = np.argsort(-scores)
+        return [(int(vector_ids[i]), float(scores[i])) for i in order]
+
+    def _rescore_shadowed(
+        self,
+        query_vector: np.ndarray,
+        hits: List[Tuple[int, float]]
+    ) -> List[Tuple[int, float]]:
+        """
+        对残留旧行的向量去重，并用最新向量的内积重新打分
+
+        Args:
+            query_vector: 单个查询向量
+            hits: 原始结果
+
+        Returns:
+            List[Tuple[int, float]]: 去重后按分数排序的结果
+        """
+        rescored = {}
+        for vector_id, score in hits:
+            if vector_id in rescored:
+                continue
+            if vector_id in self.shadowed:
+                score = float(np.dot(query_vector, self.index.reconstruct(vector_id)))
+            rescored[vector_id] = score
+        return sorted(rescored.items(), key=lambda item: item[1], reverse=True)
+
+    def reconstruct(self, vector_id: int) -> Optional[np.ndarray]:
+        """
+        根据ID取回向量
+
+        Args:
+            vector_id: 向量ID
+
+        Returns:
+            Optional[np.ndarray]: 向量，不存在时返回None
+        """
+        if vector_id in self.tombstones:
+            return None
+        try:
+            return self.index.reconstruct(vector_id)
+        except RuntimeError:
+            return None
+
+    def live_ids(self) -> np.ndarray:
+        """
+        索引中的有效向量ID（去除墓碑和重复的残留旧行）
+
+        Returns:
+            np.ndarray: 升序int64向量ID数组
+        """
+        ids = np.unique(self.stored_ids())
+        if self.tombstones:
+            excluded = np.fromiter(self.tombstones, dtype=np.int64)
+            ids = np.setdiff1d(ids, excluded, assume_unique=True)
+        return ids
+
+    def stored_ids(self) -> np.ndarray:
+        """
+        索引中实际存储的全部向量ID（含墓碑）
+
+        Returns:
+            np.ndarray: int64向量ID数组
+        """
+        return self._index_ids(self.index)
+
+    @staticmethod
+    def _index_ids(index: 'faiss.Index') -> np.ndarray:
+        """
+        读取FAISS索引中存储的全部向量ID
+
+        Args:
+            index: FAISS索引
+
+        Returns:
+            np.ndarray: int64向量ID数组
+        """
+        if index is None or index.ntotal == 0:
+            return np.empty(0, dtype=np.int64)
+
+        if hasattr(index, "id_map"):
+            return faiss.vector_to_array(index.id_map).astype(np.int64)
+
+        if isinstance(index, faiss.IndexIVF):
+            invlists = index.invlists
+            chunks = []
+            for list_no in range(index.nlist):
+                size = invlists.list_size(list_no)
+                if size:
+                    chunks.append(
+                        faiss.rev_swig_ptr(invlists.get_ids(list_no), size).copy()
+                    )
+            if chunks:
+                return np.concatenate(chunks).astype(np.int64)
+
+        return np.empty(0, dtype=np.int64)
+
+    def compact(self, removed: Set[int]) -> 'faiss.Index':
+        """
+        构建去除墓碑后的新索引（同步方法，在线程池中执行）
+
+        只读取当前索引，由调用方在事件循环中调用 swap() 原子替换。
+
+        HNSW不支持删除，改为用有效向量重建整个图。
+        原始向量文件同时重写到临时文件，在 swap() 时一并替换。
+
+        Args:
+            removed: 本次要物理移除的墓碑快照
+
+        Returns:
+            faiss.Index: 压缩后的索引
+        """
+        self.materialize()
+
+        if not self.supports_removal:
+            ids = np.unique(self.stored_ids())
+            if removed:
+                excluded = np.fromiter(removed, dtype=np.int64)
+                ids = np.setdiff1d(ids, excluded, assume_unique=True)
+            new_index = self.empty_like(self.index)
+            if ids.size:
+                new_index.add_with_ids(self.index.reconstruct_batch(ids), ids)
+        else:
+            new_index = faiss.clone_index(self.index)
+            if removed:
+                self._remove_ids(new_index, removed)
+
+        if self.raw_vectors is not None:
+            self._raw_compaction = self.raw_vectors.prepare_compaction(
+                np.unique(self._index_ids(new_index))
+            )
+        return new_index
+
+    def swap(self, new_index: 'faiss.Index', removed: Set[int]) -> None:
+        """
+        原子替换索引并清除已处理的墓碑
+
+        Args:
+            new_index: 压缩后的索引
+            removed: 已物理移除的墓碑ID
+        """
+        self.index = new_index
+        self.mapped = False
+        self.tombstones.difference_update(removed)
+        if self.raw_vectors is not None:
+            self.raw_vectors.commit_compaction(self._raw_compaction)
+            self._raw_compaction = None
+        # 压缩期间持有分片锁，不会有新的写入，残留旧行已随重建清除
+        self.shadowed.clear()
+        self._stale_rows = 0
+
+    def begin_rebuild(self) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        开始后台重建：取当前有效向量快照，并开始记录重建期间的写入
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray]: (向量ID数组, 向量矩阵)
+        """
+        self._rebuild_writes = set()
+        ids = self.live_ids()
+        if ids.size == 0:
+            return ids, np.empty((0, self.index.d), dtype=np.float32)
+        return ids, self.index.reconstruct_batch(ids)
+
+    def finish_rebuild(self, new_index: 'faiss.Index', snapshot_ids: np.ndarray) -> None:
+        """
+        完成后台重建：补齐快照之后的删除和写入，然后原子替换索引
+
+        必须在持有分片锁时调用。
+
+        Args:
+            new_index: 用快照向量构建的新索引
+            snapshot_ids: 快照中的向量ID
+        """
+        old_index = self.index
+        writes = self._rebuild_writes or set()
+        self._rebuild_writes = None
+
+        live = set(self.live_ids().tolist())
+        rewritten = np.array(sorted(vid for vid in writes if vid in live), dtype=np.int64)
+        rewritten_vectors = old_index.reconstruct_batch(rewritten) if rewritten.size else None
+
+        # 快照之后删除或重写的向量在新索引中已过期
+        snapshot = set(snapshot_ids.tolist())
+        outdated = (snapshot - live) | (snapshot & writes)
+
+        self.index = new_index
+        self.mapped = False
+        self.tombstones = set()
+        self.shadowed = set()
+        self._stale_rows = 0
+
+        if outdated:
+            if self.supports_removal:
+                self._remove_ids(self.index, outdated)
+            else:
+                self.tombstones = outdated
+
+        if rewritten.size:
+            self.add(rewritten, rewritten_vectors)
+
+        self.dirty = True
+
+    def abort_rebuild(self) -> None:
+        """
+        放弃后台重建
+        """
+        self._rebuild_writes = None
+
+    @staticmethod
+    def empty_like(index: 'faiss.Index') -> 'faiss.Index':
+        """
+        创建与给定HNSW索引参数相同的空索引
+
+        Args:
+            index: ID映射包装的HNSW索引
+
+        Returns:
+            faiss.Index: 新的空索引
+        """
+        inner = VectorShard._inner_index(index)
+        if not isinstance(inner, faiss.IndexHNSWFlat):
+            # 量化存储需要保留训练结果，复制后清空
+            hnsw_index = faiss.clone_index(inner)
+            hnsw_index.reset()
+            return faiss.IndexIDMap2(hnsw_index)
+
+        hnsw_index = faiss.IndexHNSWFlat(inner.d, inner.hnsw.nb_neighbors(1), inner.metric_type)
+        hnsw_index.hnsw.efConstruction = inner.hnsw.efConstruction
+        hnsw_index.hnsw.efSearch = inner.hnsw.efSearch
+        return faiss.IndexIDMap2(hnsw_index)
+
+    @staticmethod
+    def _inner_index(index: 'faiss.Index') -> 'faiss.Index':
+        """
+        去掉ID映射包装后的实际索引
+
+        Args:
+            index: FAISS索引
+
+        Returns:
+            faiss.Index: 实际索引
+        """
+        if hasattr(index, "id_map"):
+            return faiss.downcast_index(index.index)
+        return index
+
+    def _make_search_params(self, selector: 'faiss.IDSelector') -> 'faiss.SearchParameters':
+        """
+        构建带ID选择器的搜索参数，保留索引自身的检索配置
+
+        Args:
+            selector: ID选择器
+
+        Returns:
+            faiss.SearchParameters: 搜索参数
+        """
+        inner = self._inner_index(self.index)
+        if isinstance(inner, faiss.IndexIVF):
+            return faiss.SearchParametersIVF(sel=selector, nprobe=inner.nprobe)
+        if isinstance(inner, faiss.IndexHNSW):
+            return faiss.SearchParametersHNSW(sel=selector, efSearch=inner.hnsw.efSearch)
+        return faiss.SearchParameters(sel=selector)
+
+    @staticmethod
+    def _make_batch_selector(vector_ids: np.ndarray) -> 'faiss.IDSelectorBatch':
+        """
+        构建基于哈希集合的ID选择器
+
+        Args:
+            vector_ids: int64向量ID数组
+
+        Returns:
+            faiss.IDSelectorBatch: ID选择器
+        """
+        ids = np.ascontiguousarray(vector_ids, dtype=np.int64)
+        return faiss.IDSelectorBatch(ids.size, faiss.swig_ptr(ids))
+
+    @staticmethod
+    def _remove_ids(index: 'faiss.Index', vector_ids: Iterable[int]) -> int:
+        """
+        从FAISS索引中物理删除向量
+
+        Args:
+            index: FAISS索引
+            vector_ids: 要删除的向量ID
+
+        Returns:
+            int: 实际删除的数量
+        """
+        ids = np.fromiter(vector_ids, dtype=np.int64)
+        if ids.size == 0:
+            return 0
+
+        # IVF的哈希直接映射只接受IDSelectorArray
+        if isinstance(index, faiss.IndexIVF):
+            selector = faiss.IDSelectorArray(ids.size, faiss.swig_ptr(ids))
+            return index.remove_ids(selector)
+        return index.remove_ids(VectorShard._make_batch_selector(ids))
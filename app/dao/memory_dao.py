@@ -3,9 +3,10 @@
 功能: 记忆管理相关的数据访问对象
 """
 
-from typing import List, Optional, Dict, Any, Tuple
+from typing import List, Optional, Dict, Any, Iterator, Tuple
 from datetime import datetime, timedelta
 from sqlalchemy import select, update, delete, and_, or_, desc, asc, func
+from sqlalchemy.engine import Row
 from sqlalchemy.orm import Session
 from sqlalchemy.exc import SQLAlchemyError
 
@@ -80,6 +81,35 @@ class MemoryDAO(BaseDAO[MemoryStore]):
             logger.error(f"创建记忆失败: {str(e)}")
             raise
     
+    def create_memories(self, memories: List[MemoryStore]) -> List[MemoryStore]:
+        """
+        批量创建记忆（一次flush获取ID，一次提交）
+        
+        参数:
+            memories: 待创建的记忆对象列表
+        
+        返回:
+            List[MemoryStore]: 创建后的记忆对象（含ID）
+        
+        异常:
+            SQLAlchemyError: 数据库操作失败时抛出，整批回滚
+        """
+        if not memories:
+            return []
+        
+        try:
+            self.db.add_all(memories)
+            self.db.flush()
+            self.db.commit()
+            
+            logger.info(f"批量创建记忆成功: {len(memories)}条")
+            return memories
+            
+        except SQLAlchemyError as e:
+            self.db.rollback()
+            logger.error(f"批量创建记忆失败: {str(e)}")
+            raise
+    
     def get_memories_by_conversation(self, 
                                    conversation_id: int,
                                    memory_type: Optional[str] = None,
@@ -137,6 +167,28 @@ class MemoryDAO(BaseDAO[MemoryStore]):
             logger.error(f"获取记忆失败: {str(e)}")
             raise
     
+    def get_memories_by_ids(self, memory_ids: List[int]) -> List[MemoryStore]:
+        """
+        根据ID列表批量获取记忆（一次 WHERE id IN (...) 查询）
+        
+        参数:
+            memory_ids: 记忆ID列表
+        
+        返回:
+            List[MemoryStore]: 记忆列表，按输入ID的顺序（不存在的ID被跳过）
+        """
+        if not memory_ids:
+            return []
+        
+        try:
+            query = select(MemoryStore).where(MemoryStore.id.in_(set(memory_ids)))
+            memories = {memory.id: memory for memory in self.db.execute(query).scalars().all()}
+            return [memories[memory_id] for memory_id in memory_ids if memory_id in memories]
+            
+        except SQLAlchemyError as e:
+            logger.error(f"批量获取记忆失败: {str(e)}")
+            raise
+    
     def get_memories_by_type(self, 
                            memory_type: str,
                            conversation_id: Optional[int] = None,
@@ -470,3 +522,113 @@ class MemoryDAO(BaseDAO[MemoryStore]):
         except SQLAlchemyError as e:
             logger.error(f"搜索记忆失败: {str(e)}")
             raise
+    
+    def search_relevant_memories(self,
+                                 conversation_id: int,
+                                 keywords: List[str],
+                                 memory_types: Optional[List[str]] = None,
+                                 limit: int = 5,
+                                 include_expired: bool = False,
+                                 max_scan: int = 2000) -> List[MemoryStore]:
+        """
+        检索会话中与关键词相关的记忆（过滤、匹配、排序和数量限制都在SQL中完成）
+        
+        内容包含任一关键词（不区分大小写）即视为相关。按重要性排序配合
+        (conversation_id, importance_score, created_at) 索引，常见关键词找够 limit 条即停止扫描；
+        子串匹配无法使用索引，因此只在会话按重要性、创建时间降序的前 max_scan 条记忆中匹配
+        （先在索引上取第 max_scan 条的重要性作为下界），关键词罕见或不存在时最多检查约 max_scan 行，
+        延迟与会话记忆总数无关。下界之外（更早且不重要）的记忆不会被关键词检索到，
+        需要时由BM25索引或向量检索覆盖。
+        
+        参数:
+            conversation_id: 会话ID
+            keywords: 关键词列表
+            memory_types: 记忆类型过滤（可选）
+            limit: 返回数量限制
+            include_expired: 是否包含过期记忆
+            max_scan: 最多参与匹配的记忆数
+        
+        返回:
+            List[MemoryStore]: 相关记忆列表，按重要性、创建时间降序
+        """
+        keywords = [keyword for keyword in dict.fromkeys(k.lower() for k in keywords) if keyword]
+        if not keywords or limit <= 0 or max_scan <= 0:
+            return []
+        
+        try:
+            content = func.lower(MemoryStore.content)
+            query = select(MemoryStore).where(
+                MemoryStore.conversation_id == conversation_id,
+                or_(*(content.contains(keyword, autoescape=True) for keyword in keywords))
+            )
+            
+            # 扫描下界：第 max_scan 条记忆的重要性（只读索引），作为索引上的范围条件
+            boundary = self.db.execute(
+                select(MemoryStore.importance_score)
+                .where(MemoryStore.conversation_id == conversation_id)
+                .order_by(desc(MemoryStore.importance_score), desc(MemoryStore.created_at))
+                .offset(max_scan - 1)
+                .limit(1)
+            ).scalar()
+            if boundary is not None:
+                query = query.where(MemoryStore.importance_score >= boundary)
+            
+            if memory_types:
+                query = query.where(MemoryStore.memory_type.in_(memory_types))
+            
+            if not include_expired:
+                query = query.where(
+                    or_(
+                        MemoryStore.expires_at.is_(None),
+                        MemoryStore.expires_at > datetime.utcnow()
+                    )
+                )
+            
+            query = query.order_by(
+                desc(MemoryStore.importance_score), desc(MemoryStore.created_at)
+            ).limit(limit)
+            
+            result = self.db.execute(query)
+            return result.scalars().all()
+            
+        except SQLAlchemyError as e:
+            logger.error(f"检索相关记忆失败: {str(e)}")
+            raise
+    
+    def iter_embedding_chunks(self, chunk_size: int = 1000) -> Iterator[List[Row]]:
+        """
+        按ID顺序分块读取已保存向量嵌入的记忆（键集分页，只取重建索引需要的列）
+        
+        参数:
+            chunk_size: 每块的行数
+        
+        返回:
+            Iterator[List[Row]]: 行列表，每行含 id、conversation_id、memory_type、content、
+                memory_metadata、created_at、embedding
+        """
+        last_id = 0
+        while True:
+            try:
+                query = (
+                    select(
+                        MemoryStore.id,
+                        MemoryStore.conversation_id,
+                        MemoryStore.memory_type,
+                        MemoryStore.content,
+                        MemoryStore.memory_metadata,
+                        MemoryStore.created_at,
+                        MemoryStore.embedding
+                    )
+                    .where(MemoryStore.id > last_id, MemoryStore.embedding.is_not(None))
+                    .order_by(asc(MemoryStore.id))
+                    .limit(chunk_size)
+                )
+                rows = self.db.execute(query).all()
+            except SQLAlchemyError as e:
+                logger.error(f"读取记忆向量嵌入失败: {str(e)}")
+                raise
+            
+            if not rows:
+                return
+            yield rows
+            last_id = rows[-1].id
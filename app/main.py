@@ -15,6 +15,7 @@ from app.api.v1 import config as config_api
 from app.middleware.logging_middleware import LoggingMiddleware
 from app.middleware.error_handler import global_exception_handler
 from app.models.database import close_database
+from app.core.memory.runtime import memory_runtime
 from app.utils.config import config
 from app.utils.logger import get_logger
 from app.utils.exceptions import AgentException
@@ -40,11 +41,13 @@ async def lifespan(app: FastAPI):
         host=config.get("app.host", "0.0.0.0"),
         port=config.get("app.port", 8000)
     )
+    await memory_runtime.start()  # 创建共享的记忆组件
     
     yield  # 应用运行中
     
     # 应用关闭时
     logger.info("应用正在关闭...")
+    await memory_runtime.close()  # 释放记忆组件
     close_database()  # 关闭数据库连接
     logger.info("应用已关闭")
 
@@ -3,14 +3,24 @@
 功能: 记忆管理相关的数据库模型
 """
 
+import struct
 from datetime import datetime
 from typing import Optional, Dict, Any
-from sqlalchemy import Column, BigInteger, String, Text, Float, Integer, BLOB, JSON, DateTime, ForeignKey
+import numpy as np
+from sqlalchemy import Column, BigInteger, String, Text, Float, Integer, BLOB, JSON, DateTime, ForeignKey, Index
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 
 from app.models.database import Base
 
+# embedding 列的字节格式：4字节头（精度代码 | 格式版本 | u16 维度）+ 小端原始向量；
+# 头部让解码不必按字节长度猜测精度，维度或精度不符的旧向量直接跳过
+EMBEDDING_HEADER = struct.Struct("<ccH")
+EMBEDDING_FORMAT_VERSION = b"\x01"
+
+# embedding 列支持的向量存储精度（精度代码 -> 小端dtype）
+EMBEDDING_DTYPES = {b"f": np.dtype("<f4"), b"e": np.dtype("<f2")}
+
 
 class MemoryStore(Base):
     """
@@ -21,6 +31,13 @@ class MemoryStore(Base):
     """
     
     __tablename__ = "memory_store"
+    __table_args__ = (
+        # 按会话、类型和过期时间过滤（检索相关记忆时的谓词）
+        Index("idx_memory_conversation_type_expires", "conversation_id", "memory_type", "expires_at"),
+        # 会话内按 (重要性, 创建时间) 有序扫描，ORDER BY importance_score, created_at ... LIMIT 无需排序即可提前结束
+        Index("idx_memory_conversation_importance", "conversation_id", "importance_score", "created_at"),
+        {"comment": "记忆存储表"}
+    )
     
     # 主键
     id = Column(BigInteger, primary_key=True, autoincrement=True, comment="记忆ID")
@@ -115,6 +132,41 @@ class MemoryStore(Base):
         """获取向量嵌入"""
         return self.embedding
     
+    def set_embedding_vector(self, vector: np.ndarray, dtype=np.float32) -> None:
+        """以 float32（或 float16）保存向量嵌入，精度和维度记录在头部"""
+        self.embedding = self.encode_embedding(vector, dtype)
+    
+    def get_embedding_vector(self, dimension: int) -> Optional[np.ndarray]:
+        """读取向量嵌入（float32 为零拷贝的只读视图）"""
+        return self.decode_embedding(self.embedding, dimension)
+    
+    @staticmethod
+    def encode_embedding(vector: np.ndarray, dtype=np.float32) -> bytes:
+        """把向量编码为带头部的字节（精度仅支持 float32 / float16）"""
+        dtype = np.dtype(dtype).newbyteorder("<")
+        code = dtype.char.encode()
+        if code not in EMBEDDING_DTYPES:
+            raise ValueError(f"不支持的向量精度: {dtype}")
+        vector = np.asarray(vector, dtype=dtype).ravel()
+        return EMBEDDING_HEADER.pack(code, EMBEDDING_FORMAT_VERSION, vector.size) + vector.tobytes()
+    
+    @staticmethod
+    def decode_embedding(data: Optional[bytes], dimension: int) -> Optional[np.ndarray]:
+        """按头部记录的精度解码向量嵌入，格式、精度或维度不符时返回 None"""
+        if not data or len(data) < EMBEDDING_HEADER.size:
+            return None
+        code, version, stored_dimension = EMBEDDING_HEADER.unpack_from(data)
+        dtype = EMBEDDING_DTYPES.get(code)
+        if (
+            version != EMBEDDING_FORMAT_VERSION
+            or dtype is None
+            or stored_dimension != dimension
+            or len(data) != EMBEDDING_HEADER.size + dimension * dtype.itemsize
+        ):
+            return None
+        vector = np.frombuffer(data, dtype=dtype, offset=EMBEDDING_HEADER.size)
+        return vector if dtype == np.float32 else vector.astype(np.float32)
+    
     def set_importance(self, score: float) -> None:
         """设置重要性评分"""
         if 0.0 <= score <= 1.0:
@@ -14,7 +14,7 @@ from datetime import datetime
 from sqlalchemy.orm import Session
 
 from app.core.llm.base import BaseLLM
-from app.core.memory import MemoryManager
+from app.core.memory import MemoryManager, MemoryIngestionQueue
 from app.models.memory import MemoryStore
 
 logger = logging.getLogger(__name__)
@@ -31,7 +31,8 @@ class MemoryService:
         self,
         db: Session,
         llm: BaseLLM,
-        memory_manager: MemoryManager
+        memory_manager: MemoryManager,
+        ingestion_queue: Optional[MemoryIngestionQueue] = None
     ):
         """
         初始化记忆服务
@@ -40,10 +41,12 @@ class MemoryService:
             db: 数据库会话
             llm: 大语言模型实例
             memory_manager: 记忆管理器实例
+            ingestion_queue: 记忆后台写入队列（可选，提供时会话记忆在后台批量写入）
         """
         self.db = db
         self.llm = llm
         self.memory_manager = memory_manager
+        self.ingestion_queue = ingestion_queue
         
         logger.info("记忆服务初始化完成")
     
@@ -55,6 +58,9 @@ class MemoryService:
         """
         保存会话记忆
         
+        启用写入队列时记忆入队后立即返回（在后台批量写入），此时返回空列表；
+        否则在当前请求中一次批量写入。
+        
         Args:
             conversation_id: 会话ID
             messages: 消息列表
@@ -63,29 +69,34 @@ class MemoryService:
             List[MemoryStore]: 保存的记忆列表
         """
         try:
-            saved_memories = []
+            items = []
             
             for message in messages:
                 # 只保存用户消息和重要的助手回复
                 if message.get("role") == "user":
                     # 保存用户消息
-                    memory = await self.memory_manager.add_memory(
-                        conversation_id=conversation_id,
-                        content=message.get("content", ""),
-                        memory_type="short_term"
-                    )
-                    saved_memories.append(memory)
+                    items.append({
+                        "conversation_id": conversation_id,
+                        "content": message.get("content", ""),
+                        "memory_type": "short_term"
+                    })
                 
                 elif message.get("role") == "assistant":
                     # 只保存重要的助手回复
                     content = message.get("content", "")
                     if self._is_important_assistant_message(content):
-                        memory = await self.memory_manager.add_memory(
-                            conversation_id=conversation_id,
-                            content=content,
-                            memory_type="episodic"
-                        )
-                        saved_memories.append(memory)
+                        items.append({
+                            "conversation_id": conversation_id,
+                            "content": content,
+                            "memory_type": "episodic"
+                        })
+            
+            if self.ingestion_queue is not None:
+                await self.ingestion_queue.submit_many(items)
+                logger.info(f"会话记忆已入队: 会话ID={conversation_id}, {len(items)}条记忆")
+                return []
+            
+            saved_memories = await self.memory_manager.add_memories(items)
             
             logger.info(f"会话记忆保存完成: 会话ID={conversation_id}, 保存{len(saved_memories)}条记忆")
             return saved_memories
@@ -176,6 +187,52 @@ class MemoryService:
                 "error": str(e)
             }
     
+    async def store_memory(
+        self,
+        content: str,
+        conversation_id: int,
+        user_id: Optional[int] = None,
+        memory_type: Optional[str] = None,
+        importance: Optional[float] = None,
+        metadata: Optional[Dict] = None
+    ) -> Optional[MemoryStore]:
+        """
+        存储一条执行记忆（编排器在每次请求结束时调用）
+        
+        启用写入队列时入队后立即返回None，分类、评分、向量化和入库都在后台完成。
+        
+        Args:
+            content: 记忆内容
+            conversation_id: 会话ID
+            user_id: 用户ID
+            memory_type: 记忆类型（可选，会自动分类）
+            importance: 重要性分数（可选，会自动评分）
+            metadata: 元数据
+            
+        Returns:
+            Optional[MemoryStore]: 同步写入时返回创建的记忆对象
+        """
+        metadata = {**(metadata or {}), "user_id": user_id} if user_id is not None else metadata
+        
+        if self.ingestion_queue is not None:
+            await self.ingestion_queue.submit(
+                conversation_id=conversation_id,
+                content=content,
+                memory_type=memory_type,
+                metadata=metadata,
+                importance_score=importance
+            )
+            return None
+        
+        memories = await self.memory_manager.add_memories([{
+            "conversation_id": conversation_id,
+            "content": content,
+            "memory_type": memory_type,
+            "metadata": metadata,
+            "importance_score": importance
+        }])
+        return memories[0]
+    
     async def add_user_preference(
         self,
         conversation_id: int,
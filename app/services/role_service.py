@@ -11,6 +11,7 @@ from typing import List, Dict, Any, Optional, AsyncIterator
 from sqlalchemy.orm import Session
 
 from app.core.llm.base import BaseLLM
+from app.core.memory.runtime import memory_runtime
 from app.core.roles.role_manager import role_manager
 from app.core.roles.role_config import RoleConfig
 from app.core.orchestrator.orchestrator import Orchestrator
@@ -81,7 +82,9 @@ class RoleService:
         if strategy.short_term or strategy.long_term:
             self.memory_service = MemoryService(
                 db=self.db,
-                llm=self.llm
+                llm=self.llm,
+                memory_manager=memory_runtime.create_memory_manager(self.db, self.llm),
+                ingestion_queue=memory_runtime.ingestion_queue
             )
         else:
             self.memory_service = None
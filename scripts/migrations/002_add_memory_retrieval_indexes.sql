@@ -0,0 +1,22 @@
+-- =============================================
+-- 智能体系统数据库索引脚本
+-- 版本: 002
+-- 创建时间: 2026-10-16
+-- 功能: 为记忆检索添加复合索引（会话内按类型、过期时间过滤，按重要性取前N条）
+-- =============================================
+
+-- 1. 会话 + 类型 + 过期时间：检索相关记忆时的过滤谓词
+ALTER TABLE `memory_store`
+    ADD INDEX `idx_memory_conversation_type_expires` (`conversation_id`, `memory_type`, `expires_at`);
+
+-- 2. 会话 + 重要性 + 创建时间：ORDER BY importance_score DESC, created_at DESC LIMIT N
+--    按索引逆序扫描，无需filesort，找够N条即停止
+ALTER TABLE `memory_store`
+    ADD INDEX `idx_memory_conversation_importance` (`conversation_id`, `importance_score`, `created_at`);
+
+-- 3. 001 的 (conversation_id, memory_type) 是索引1的前缀，已冗余
+--    （外键 fk_memory_conversation 改由上面的索引支持，因此必须在添加之后删除）
+ALTER TABLE `memory_store`
+    DROP INDEX `idx_conversation_memory`;
+
+SELECT '已添加记忆检索索引: idx_memory_conversation_type_expires, idx_memory_conversation_importance；已删除: idx_conversation_memory' AS indexes_updated;
@@ -123,8 +123,10 @@ class TestMemoryManagerIntegration:
             )
         ]
         
-        with patch.object(memory_manager.memory_dao, 'update') as mock_update:
-            mock_update.side_effect = short_term_memories
+        with patch.object(memory_manager.memory_dao, 'update_by_id') as mock_update:
+            mock_update.side_effect = lambda memory_id, data: next(
+                m for m in short_term_memories if m.id == memory_id
+            )
             
             results = await memory_manager.upgrade_to_long_term(short_term_memories)
             
@@ -157,7 +159,7 @@ class TestMemoryManagerIntegration:
         mock_llm.achat.return_value = "压缩后的记忆摘要"
         
         with patch.object(memory_manager.memory_dao, 'create') as mock_create, \
-             patch.object(memory_manager.memory_dao, 'update') as mock_update:
+             patch.object(memory_manager.memory_dao, 'update_by_id') as mock_update:
             
             mock_compressed = MemoryStore(
                 id=3,
@@ -199,9 +201,9 @@ class TestMemoryManagerIntegration:
             )
         ]
         
-        with patch.object(memory_manager.memory_dao, 'get_by_conversation') as mock_get, \
-             patch.object(memory_manager.memory_dao, 'update') as mock_update, \
-             patch.object(memory_manager.memory_dao, 'delete') as mock_delete:
+        with patch.object(memory_manager.memory_dao, 'get_memories_by_conversation') as mock_get, \
+             patch.object(memory_manager.memory_dao, 'update_by_id') as mock_update, \
+             patch.object(memory_manager.memory_dao, 'delete_by_id') as mock_delete:
             
             mock_get.return_value = all_memories
             
@@ -487,8 +489,8 @@ class TestEndToEndMemoryFlow:
             )
             
             mock_dao.create.side_effect = [mock_memory1, mock_memory2]
-            mock_dao.get_by_conversation.return_value = [mock_memory1, mock_memory2]
-            mock_dao.update.return_value = mock_memory1
+            mock_dao.get_memories_by_conversation.return_value = [mock_memory1, mock_memory2]
+            mock_dao.update_by_id.return_value = mock_memory1
             
             # 1. 添加记忆
             result1 = await memory_manager.add_memory(
@@ -0,0 +1,129 @@
+"""
+记忆查询性能测试
+
+测试会话内相关记忆检索（MemoryDAO.search_relevant_memories）的延迟随记忆数量的变化，
+覆盖常见关键词（约30%的记忆命中）、罕见关键词（约0.1%命中）和不存在的关键词。
+子串匹配只在按重要性取出的前 max_scan 条记忆中进行，最坏情况的延迟受 max_scan 限制。
+"""
+
+import random
+import statistics
+import time
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import create_engine, insert
+from sqlalchemy.orm import sessionmaker
+
+from app.dao.memory_dao import MemoryDAO
+from app.models.conversation import Conversation
+from app.models.database import Base
+from app.models.memory import MemoryStore
+from app.models.user import User
+
+
+SIZES = (1_000, 10_000, 100_000)
+WORDS = ["python", "北京", "工作", "学习", "音乐", "旅行", "咖啡", "编程", "电影", "运动"]
+RARE_WORD = "量子"
+RARE_EVERY = 1000
+MEMORY_TYPES = ["short_term", "long_term", "episodic", "semantic"]
+
+
+@pytest.fixture(scope="module")
+def seeded_db():
+    """每种规模各建一个会话，另加同等规模的干扰会话"""
+    engine = create_engine("sqlite:///:memory:")
+    Base.metadata.create_all(bind=engine)
+    session = sessionmaker(bind=engine)()
+
+    user = User(username="benchmark", nickname="Benchmark", status=1)
+    session.add(user)
+    session.flush()
+    session.execute(insert(Conversation), [
+        {
+            "id": conversation_id,
+            "user_id": user.id,
+            "title": f"Benchmark {conversation_id}",
+            "model_provider": "deepseek",
+            "model_name": "deepseek-chat",
+            "status": 1,
+            "message_count": 0
+        }
+        for conversation_id in range(1, len(SIZES) * 2 + 1)
+    ])
+
+    rng = random.Random(42)
+    now = datetime.utcnow()
+    next_id = 1
+    for conversation_id, size in enumerate(SIZES * 2, start=1):
+        rows = []
+        for i in range(size):
+            rows.append({
+                "id": next_id,
+                "conversation_id": conversation_id,
+                "memory_type": rng.choice(MEMORY_TYPES),
+                "content": " ".join(rng.sample(WORDS, 3)) + f" 记忆{i}" + (
+                    f" {RARE_WORD}" if i % RARE_EVERY == 0 else ""
+                ),
+                "importance_score": rng.random(),
+                "expires_at": None if rng.random() < 0.8 else now - timedelta(hours=1),
+                "created_at": now
+            })
+            next_id += 1
+        session.execute(insert(MemoryStore), rows)
+    session.commit()
+
+    yield session
+    session.close()
+
+
+class TestMemoryQueryPerformance:
+    """记忆查询性能测试类"""
+
+    @staticmethod
+    def measure(dao, conversation_id, runs=30, **kwargs):
+        """返回多次查询的延迟中位数（毫秒）"""
+        timings = []
+        for _ in range(runs):
+            start = time.perf_counter()
+            dao.search_relevant_memories(conversation_id, **kwargs)
+            timings.append((time.perf_counter() - start) * 1000)
+        return statistics.median(timings)
+
+    @pytest.mark.parametrize("keyword", ["python", RARE_WORD, "不存在"], ids=["common", "rare", "no_match"])
+    def test_relevant_memories_latency_is_flat(self, seeded_db, keyword):
+        """测试常见、罕见和不存在的关键词的检索延迟都不随会话记忆数量增长"""
+        dao = MemoryDAO(seeded_db)
+
+        latencies = {}
+        for conversation_id, size in enumerate(SIZES, start=1):
+            results = dao.search_relevant_memories(
+                conversation_id, [keyword], memory_types=["long_term", "episodic"], limit=5
+            )
+            assert all(keyword in m.content and m.memory_type in ("long_term", "episodic") for m in results)
+            if keyword == "python":
+                assert len(results) == 5
+
+            latencies[size] = self.measure(
+                dao, conversation_id, keywords=[keyword], memory_types=["long_term", "episodic"], limit=5
+            )
+
+        print(f"相关记忆检索性能测试（关键词={keyword}，中位数）:")
+        for size, latency in latencies.items():
+            print(f"  {size:>7} 条记忆: {latency:.3f}毫秒")
+
+        # 验证延迟基本持平：10万条与1000条的差距在常数范围内
+        assert latencies[SIZES[-1]] < latencies[SIZES[0]] * 3 + 2.0
+
+    def test_matches_outside_scan_window_are_not_returned(self, seeded_db):
+        """测试罕见关键词只在前 max_scan 条记忆中匹配（检索范围的限制）"""
+        dao = MemoryDAO(seeded_db)
+        conversation_id = SIZES.index(100_000) + 1
+
+        windowed = dao.search_relevant_memories(conversation_id, [RARE_WORD], limit=200, include_expired=True)
+        full = dao.search_relevant_memories(
+            conversation_id, [RARE_WORD], limit=200, include_expired=True, max_scan=100_000
+        )
+
+        assert len(full) == 100_000 // RARE_EVERY
+        assert len(windowed) < len(full)
@@ -0,0 +1,519 @@
+"""
+向量化模块单元测试
+
+测试向量化微批处理、向量缓存、相似度计算、长度分桶、ONNX后端和进程池后端
+"""
+
+import asyncio
+import hashlib
+import pickle
+
+import numpy as np
+import pytest
+
+from app.core.embedding.cache_arena import CacheArena
+from app.core.embedding import sentence_transformer
+from app.core.embedding.cached_embedding import CachedEmbeddingService, bucket_by_length, plan_batches
+from app.core.embedding.embedding_cache import EmbeddingCache
+from app.core.embedding.micro_batcher import MicroBatcher
+from app.core.embedding.onnx_embedding import mean_pooling
+from app.core.embedding.process_pool_embedding import ProcessPoolEmbedding
+
+
+DIMENSION = 8
+
+
+class RecordingEncoder:
+    """记录每次批量调用的假编码函数"""
+
+    def __init__(self):
+        self.calls = []
+
+    def __call__(self, texts):
+        self.calls.append(list(texts))
+        return np.stack([np.full(DIMENSION, len(text), dtype=np.float32) for text in texts])
+
+
+class TestMicroBatcher:
+    """测试向量化微批处理器"""
+
+    @pytest.fixture
+    def encoder(self):
+        """假编码函数"""
+        return RecordingEncoder()
+
+    @pytest.mark.asyncio
+    async def test_concurrent_requests_share_one_batch(self, encoder):
+        """测试并发请求合并为一次编码，结果按调用方分发"""
+        batcher = MicroBatcher(encoder, max_batch_size=32, max_wait_ms=20)
+        texts = ["a", "bb", "ccc", "bb"]
+
+        vectors = await asyncio.gather(*(batcher.submit(text) for text in texts))
+
+        assert encoder.calls == [["a", "bb", "ccc"]]
+        assert [vector[0] for vector in vectors] == [1, 2, 3, 2]
+        assert batcher.average_batch_size == 4
+        await batcher.close()
+
+    @pytest.mark.asyncio
+    async def test_full_batch_runs_without_waiting(self, encoder):
+        """测试攒满批大小后立即执行"""
+        batcher = MicroBatcher(encoder, max_batch_size=2, max_wait_ms=10000)
+
+        vectors = await asyncio.wait_for(
+            asyncio.gather(*(batcher.submit(str(i)) for i in range(4))), timeout=5
+        )
+
+        assert encoder.calls == [["0", "1"], ["2", "3"]]
+        assert len(vectors) == 4
+        await batcher.close()
+
+    @pytest.mark.asyncio
+    async def test_errors_reach_every_caller(self):
+        """测试批量编码失败时所有调用方收到异常"""
+        def failing(texts):
+            raise RuntimeError("model unavailable")
+
+        batcher = MicroBatcher(failing, max_wait_ms=1)
+
+        results = await asyncio.gather(
+            batcher.submit("x"), batcher.submit("y"), return_exceptions=True
+        )
+
+        assert all(isinstance(result, RuntimeError) for result in results)
+        await batcher.close()
+
+
+def digest(text):
+    """文本摘要"""
+    return hashlib.md5(text.encode("utf-8")).digest()
+
+
+class TestCacheArena:
+    """测试向量缓存存储区"""
+
+    def test_put_and_read_survive_reopen(self, tmp_path):
+        """测试写入后重新打开文件仍可读取"""
+        path = str(tmp_path / "embeddings.arena")
+        arena = CacheArena(path, capacity=4, dimension=DIMENSION)
+        arena.put(digest("a"), np.arange(DIMENSION, dtype=np.float32))
+        arena.close()
+
+        arena = CacheArena(path, capacity=4, dimension=DIMENSION)
+        assert arena.count == 1
+        assert np.array_equal(arena.read(digest("a")), np.arange(DIMENSION))
+        assert arena.read(digest("b")) is None
+        assert arena.total_access == 1
+        arena.close()
+
+    def test_full_arena_evicts_least_recently_used(self, tmp_path):
+        """测试写满后淘汰最久未访问的条目并复用其行"""
+        arena = CacheArena(str(tmp_path / "embeddings.arena"), capacity=3, dimension=DIMENSION)
+        for i, text in enumerate(["a", "b", "c"]):
+            arena.put(digest(text), np.full(DIMENSION, i, dtype=np.float32))
+        arena._last_access[arena.lookup(digest("a"))] = 0.0
+
+        arena.put(digest("d"), np.full(DIMENSION, 3, dtype=np.float32))
+
+        assert arena.count == 3
+        assert arena.read(digest("a")) is None
+        assert arena.read(digest("b"))[0] == 1
+        assert arena.read(digest("d"))[0] == 3
+
+    def test_churn_keeps_lookups_consistent(self, tmp_path):
+        """测试反复淘汰产生的删除标记不影响查找"""
+        arena = CacheArena(str(tmp_path / "embeddings.arena"), capacity=8, dimension=DIMENSION)
+        for i in range(200):
+            arena.put(digest(str(i)), np.full(DIMENSION, i, dtype=np.float32))
+
+        assert arena.count == 8
+        assert arena.read(digest("199"))[0] == 199
+        assert arena.read(digest("0")) is None
+
+    def test_corrupt_row_is_a_miss(self, tmp_path):
+        """测试校验失败的行视为未命中"""
+        arena = CacheArena(str(tmp_path / "embeddings.arena"), capacity=4, dimension=DIMENSION)
+        arena.put(digest("a"), np.ones(DIMENSION, dtype=np.float32))
+        arena._vectors[arena.lookup(digest("a")), 0] = 5.0
+
+        assert arena.read(digest("a")) is None
+
+    def test_dimension_change_recreates_file(self, tmp_path):
+        """测试维度变化时重建文件"""
+        path = str(tmp_path / "embeddings.arena")
+        arena = CacheArena(path, capacity=4, dimension=DIMENSION)
+        arena.put(digest("a"), np.ones(DIMENSION, dtype=np.float32))
+        arena.close()
+
+        arena = CacheArena(path, capacity=4, dimension=DIMENSION * 2)
+        assert arena.count == 0
+        assert CacheArena.read_dimension(path) == DIMENSION * 2
+
+
+class TestEmbeddingCache:
+    """测试向量缓存"""
+
+    @pytest.mark.asyncio
+    async def test_set_get_and_stats(self, tmp_path):
+        """测试读写与统计信息"""
+        cache = EmbeddingCache(str(tmp_path), max_size=16, dimension=DIMENSION)
+        await cache.set("hello", np.ones(DIMENSION, dtype=np.float32))
+        cache.close()
+
+        cache = EmbeddingCache(str(tmp_path), max_size=16)
+        vector = await cache.get("hello")
+        stats = await cache.get_cache_stats()
+
+        assert np.array_equal(vector, np.ones(DIMENSION))
+        assert stats["disk_cache_count"] == 1
+        assert stats["total_access_count"] == 1
+        assert list(tmp_path.glob("*.pkl")) == []
+
+    @pytest.mark.asyncio
+    async def test_legacy_pickles_are_migrated(self, tmp_path):
+        """测试旧版逐条pickle缓存被导入并删除"""
+        text_hash = hashlib.md5("legacy".encode("utf-8")).hexdigest()
+        with open(tmp_path / f"{text_hash}.pkl", "wb") as f:
+            pickle.dump(np.full(DIMENSION, 7, dtype=np.float32), f)
+        (tmp_path / "cache_metadata.json").write_text("{}")
+
+        cache = EmbeddingCache(str(tmp_path), dimension=DIMENSION)
+
+        assert (await cache.get("legacy"))[0] == 7
+        assert list(tmp_path.glob("*.pkl")) == []
+        assert not (tmp_path / "cache_metadata.json").exists()
+
+    @pytest.mark.asyncio
+    async def test_memory_tier_is_a_bounded_lru(self, tmp_path):
+        """测试内存层按字节预算淘汰最久未使用的条目"""
+        vector_bytes = DIMENSION * 4
+        cache = EmbeddingCache(
+            str(tmp_path), dimension=DIMENSION, memory_budget_bytes=2 * vector_bytes
+        )
+        await cache.set("a", np.zeros(DIMENSION, dtype=np.float32))
+        await cache.set("b", np.ones(DIMENSION, dtype=np.float32))
+        await cache.get("a")
+        await cache.set("c", np.ones(DIMENSION, dtype=np.float32))
+
+        stats = await cache.get_cache_stats()
+        assert stats["memory_cache_count"] == 2
+        assert stats["memory_cache_bytes"] == 2 * vector_bytes
+        assert stats["evictions"] == 1
+
+        # b 被挤出内存层，但仍能从磁盘读取
+        assert await cache.get("b") is not None
+        assert await cache.get("missing") is None
+        stats = await cache.get_cache_stats()
+        assert (stats["memory_hits"], stats["disk_hits"], stats["misses"]) == (1, 1, 1)
+
+    @pytest.mark.asyncio
+    async def test_cached_vectors_are_read_only(self, tmp_path):
+        """测试返回的缓存向量不可被调用方修改"""
+        cache = EmbeddingCache(str(tmp_path), dimension=DIMENSION)
+        source = np.ones(DIMENSION, dtype=np.float32)
+        await cache.set("a", source)
+        source[0] = 9.0
+
+        vector = await cache.get("a")
+
+        assert vector[0] == 1.0
+        with pytest.raises(ValueError):
+            vector[0] = 5.0
+
+    @pytest.mark.asyncio
+    async def test_namespaces_are_isolated(self, tmp_path):
+        """测试不同模型命名空间的缓存互不可见"""
+        old = EmbeddingCache(str(tmp_path), dimension=DIMENSION, namespace="model-a|dim=8")
+        await old.set("hello", np.ones(DIMENSION, dtype=np.float32))
+        old.close()
+
+        new = EmbeddingCache(str(tmp_path), dimension=DIMENSION, namespace="model-b|dim=8")
+        wider = EmbeddingCache(str(tmp_path), dimension=DIMENSION * 2, namespace="model-c|dim=16")
+
+        assert await new.get("hello") is None
+        assert await wider.set("hello", np.ones(DIMENSION * 2, dtype=np.float32))
+        assert not await wider.set("other", np.ones(DIMENSION, dtype=np.float32))
+        reopened = EmbeddingCache(str(tmp_path), dimension=DIMENSION, namespace="model-a|dim=8")
+        assert await reopened.get("hello") is not None
+
+    @pytest.mark.asyncio
+    async def test_writes_are_batched_behind(self, tmp_path):
+        """测试写入先进入写回缓冲区，攒满一批或超时后批量写盘"""
+        cache = EmbeddingCache(
+            str(tmp_path), dimension=DIMENSION, write_batch_size=3, write_delay_ms=20
+        )
+        for i in range(2):
+            await cache.set(f"text-{i}", np.full(DIMENSION, i, dtype=np.float32))
+
+        stats = await cache.get_cache_stats()
+        assert (stats["pending_writes"], stats["disk_cache_count"]) == (2, 0)
+        assert (await cache.get("text-1"))[0] == 1
+
+        await cache.set("text-2", np.full(DIMENSION, 2, dtype=np.float32))
+        await asyncio.sleep(0.05)
+        stats = await cache.get_cache_stats()
+        assert (stats["pending_writes"], stats["disk_cache_count"]) == (0, 3)
+
+        await cache.set("late", np.ones(DIMENSION, dtype=np.float32))
+        await asyncio.sleep(0.2)
+        assert (await cache.get_cache_stats())["disk_cache_count"] == 4
+
+        await cache.set("unflushed", np.ones(DIMENSION, dtype=np.float32))
+        cache.close()
+        reopened = EmbeddingCache(str(tmp_path), dimension=DIMENSION)
+        assert await reopened.get("unflushed") is not None
+
+    @pytest.mark.asyncio
+    async def test_disk_reads_run_off_the_event_loop(self, tmp_path):
+        """测试磁盘读取在专用I/O线程中执行"""
+        import threading
+        cache = EmbeddingCache(str(tmp_path), dimension=DIMENSION, memory_budget_bytes=0)
+        await cache.set("a", np.ones(DIMENSION, dtype=np.float32))
+        await cache.flush_pending()
+
+        threads = []
+        read = cache._arena.read
+
+        def recording_read(*args, **kwargs):
+            threads.append(threading.current_thread().name)
+            return read(*args, **kwargs)
+
+        cache._arena.read = recording_read
+        vectors = await cache.get_many(["a", "b"])
+
+        assert vectors[0] is not None and vectors[1] is None
+        assert len(threads) == 2
+        assert all(name.startswith("embedding-cache-io") for name in threads)
+        cache.close()
+
+
+class TestOnnxEmbedding:
+    """测试ONNX Runtime向量化后端"""
+
+    def test_bucket_by_length(self):
+        """测试按词元长度分桶并截断到最大长度"""
+        buckets = bucket_by_length([3, 16, 17, 40, 500], bucket_size=16, max_length=128)
+
+        assert buckets == {16: [0, 1], 32: [2], 48: [3], 128: [4]}
+
+    def test_mean_pooling_ignores_padding(self):
+        """测试平均池化忽略填充位置"""
+        hidden_states = np.array([[[1.0, 1.0], [3.0, 3.0], [100.0, 100.0]]], dtype=np.float32)
+        attention_mask = np.array([[1, 1, 0]])
+
+        assert np.allclose(mean_pooling(hidden_states, attention_mask), [[2.0, 2.0]])
+
+    @pytest.mark.asyncio
+    async def test_parity_with_sentence_transformer(self, tmp_path):
+        """测试int8量化模型与原模型的余弦相似度一致"""
+        pytest.importorskip("onnxruntime")
+        pytest.importorskip("sentence_transformers")
+        from app.core.embedding import OnnxEmbedding, SentenceTransformerEmbedding
+
+        try:
+            reference = SentenceTransformerEmbedding(cache_dir=str(tmp_path / "st"))
+            onnx = OnnxEmbedding(cache_dir=str(tmp_path / "onnx"), model_dir=str(tmp_path / "models"))
+        except Exception as e:
+            pytest.skip(f"模型不可用: {e}")
+
+        texts = ["今天天气很好", "The weather is nice today", "我喜欢吃苹果", "向量检索的召回率"]
+        expected = await reference.embed_batch(texts)
+        actual = await onnx.embed_batch(texts)
+
+        for expected_vector, actual_vector in zip(expected, actual):
+            cosine = np.dot(expected_vector, actual_vector) / (
+                np.linalg.norm(expected_vector) * np.linalg.norm(actual_vector)
+            )
+            assert cosine > 0.98
+        assert await onnx.most_similar(texts[0], texts[1:], top_k=1) == [
+            (text, pytest.approx(score, abs=0.05))
+            for text, score in await reference.most_similar(texts[0], texts[1:], top_k=1)
+        ]
+        await reference.close()
+        await onnx.close()
+
+
+class CharTokenizer:
+    """按字符分词的假分词器"""
+
+    def __call__(self, texts, add_special_tokens=True):
+        return {"input_ids": [[ord(char) for char in text] for text in texts]}
+
+    def decode(self, ids):
+        return "".join(chr(token_id) for token_id in ids)
+
+
+class CharModel:
+    """假SentenceTransformer模型：向量为 [文本长度, 字符码之和, ...]，记录每次编码的批次"""
+
+    max_seq_length = 10
+
+    def __init__(self, model_name, device="cpu", **kwargs):
+        self.tokenizer = CharTokenizer()
+        self.batches = []
+
+    def get_sentence_embedding_dimension(self):
+        return DIMENSION
+
+    def encode(self, texts, batch_size=32, convert_to_numpy=True):
+        self.batches.append(list(texts))
+        vectors = np.zeros((len(texts), DIMENSION), dtype=np.float32)
+        vectors[:, 0] = [len(text) for text in texts]
+        vectors[:, 1] = [sum(map(ord, text)) for text in texts]
+        return vectors
+
+
+class TestLengthBucketing:
+    """测试按词元长度分桶的批量编码"""
+
+    @pytest.fixture
+    def make_service(self, tmp_path, monkeypatch):
+        monkeypatch.setattr(sentence_transformer, "SentenceTransformer", CharModel)
+
+        def make(**kwargs):
+            return sentence_transformer.SentenceTransformerEmbedding(
+                cache_dir=str(tmp_path / str(len(kwargs))), bucket_size=4, **kwargs
+            )
+        return make
+
+    def test_plan_batches_shrinks_batches_for_long_buckets(self):
+        """测试批大小随填充长度按词元预算缩小"""
+        batches = plan_batches([2, 3, 1, 30, 31, 2], bucket_size=4, max_length=32, token_budget=64)
+
+        assert batches == [(4, [0, 1, 2, 5]), (32, [3, 4])]
+        assert plan_batches([30, 31, 29], 4, 32, token_budget=32) == [(32, [0]), (32, [1]), (32, [2])]
+
+    @pytest.mark.asyncio
+    async def test_batches_are_grouped_by_length_and_order_is_restored(self, make_service):
+        """测试长短文本分开编码，结果按输入顺序返回"""
+        service = make_service(token_budget=12)
+        texts = ["a", "bbbbbbb", "cc", "ddddddd", "e"]
+
+        vectors = await service.embed_batch(texts)
+
+        assert vectors[:, 0].tolist() == [1, 7, 2, 7, 1]
+        assert service.model.batches == [["a", "cc", "e"], ["bbbbbbb"], ["ddddddd"]]
+        await service.close()
+
+    @pytest.mark.asyncio
+    async def test_long_texts_are_chunked_and_averaged(self, make_service):
+        """测试切块模式下超长文本不截断，各块按词元数加权平均"""
+        truncating = make_service()
+        chunking = make_service(chunk_long_texts=True)
+        text = "x" * 12 + "y" * 2
+
+        vector = await chunking.embed_text(text)
+
+        assert chunking.model.batches == [["xxxxyy"], ["xxxxxxxx"]]
+        chunk_sums = np.array([ord("x") * 8, ord("x") * 4 + ord("y") * 2])
+        weights = np.array([10, 8])
+        assert vector[1] == pytest.approx(float(chunk_sums @ weights / weights.sum()))
+        assert chunking.cache_namespace != truncating.cache_namespace
+        await truncating.close()
+        await chunking.close()
+
+
+class LengthModel:
+    """在工作进程中运行的假模型：向量为 [文本长度, 进程号, ...]"""
+
+    def get_sentence_embedding_dimension(self):
+        return DIMENSION
+
+    def encode(self, texts, convert_to_numpy=True):
+        import os
+        import time
+        time.sleep(0.2)
+        vectors = np.zeros((len(texts), DIMENSION), dtype=np.float32)
+        vectors[:, 0] = [len(text) for text in texts]
+        vectors[:, 1] = os.getpid()
+        return vectors
+
+
+def load_length_model(model_name, device, revision, threads):
+    """假模型加载函数（需可pickle）"""
+    return LengthModel()
+
+
+class TestProcessPoolEmbedding:
+    """测试进程池向量化后端"""
+
+    @pytest.mark.asyncio
+    async def test_batches_are_split_across_processes(self, tmp_path):
+        """测试一批文本拆分到多个工作进程，结果经共享内存按原顺序返回"""
+        import os
+        service = ProcessPoolEmbedding(
+            cache_dir=str(tmp_path), processes=2, model_loader=load_length_model
+        )
+        texts = ["x" * (i + 1) for i in range(20)]
+
+        vectors = await service.embed_batch(texts)
+        single = await service.embed_text("hello world")
+
+        assert vectors[:, 0].tolist() == [len(text) for text in texts]
+        assert os.getpid() not in set(vectors[:, 1].tolist())
+        assert len(set(vectors[:, 1].tolist())) == 2
+        assert single[0] == 11
+        await service.close()
+
+
+class SeededEmbedding(CachedEmbeddingService):
+    """按文本内容生成确定性随机向量的向量化服务"""
+
+    def __init__(self, cache_dir):
+        self.model_name = "seeded"
+        self.revision = None
+        self._dimension = DIMENSION
+        super().__init__(cache_dir, batch_max_wait_ms=1)
+
+    def _encode_batch(self, texts):
+        return np.stack([
+            np.random.default_rng(sum(map(ord, text))).standard_normal(DIMENSION).astype(np.float32)
+            for text in texts
+        ])
+
+
+class TestSimilarity:
+    """测试向量化的相似度计算"""
+
+    @pytest.fixture
+    def service(self, tmp_path):
+        """确定性的向量化服务"""
+        return SeededEmbedding(str(tmp_path))
+
+    @staticmethod
+    def cosine(a, b):
+        return float(np.dot(a, b) / (np.linalg.norm(a) * np.linalg.norm(b)))
+
+    @pytest.mark.asyncio
+    async def test_most_similar_matches_pairwise_ranking(self, service):
+        """测试矩阵计算的top-k与逐对计算的排序一致"""
+        candidates = [f"候选{i}" for i in range(50)]
+        query = await service.embed_text("查询")
+        vectors = await service.embed_batch(candidates)
+        expected = sorted(
+            ((text, self.cosine(query, vector)) for text, vector in zip(candidates, vectors)),
+            key=lambda item: item[1],
+            reverse=True
+        )[:5]
+
+        results = await service.most_similar("查询", candidates, top_k=5)
+
+        assert [text for text, _ in results] == [text for text, _ in expected]
+        assert [score for _, score in results] == pytest.approx([score for _, score in expected], abs=1e-5)
+        assert len(await service.most_similar("查询", candidates[:3], top_k=10)) == 3
+        assert await service.most_similar("查询", candidates, top_k=0) == []
+        await service.close()
+
+    @pytest.mark.asyncio
+    async def test_similarity_matrix(self, service):
+        """测试相似度矩阵与逐对计算一致"""
+        texts_a = ["甲", "乙", "丙"]
+        texts_b = ["乙", "丁"]
+
+        matrix = await service.similarity_matrix(texts_a, texts_b)
+
+        assert matrix.shape == (3, 2)
+        assert matrix[1, 0] == pytest.approx(1.0, abs=1e-5)
+        assert matrix[2, 1] == pytest.approx(await service.similarity("丙", "丁"), abs=1e-5)
+        assert (await service.similarity_matrix([], texts_b)).shape == (0, 2)
+        await service.close()
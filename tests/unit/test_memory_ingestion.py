@@ -0,0 +1,208 @@
+"""
+记忆写入单元测试
+
+测试批量添加记忆和后台写入队列
+"""
+
+import asyncio
+from unittest.mock import AsyncMock, Mock, patch
+
+import numpy as np
+import pytest
+
+from app.core.memory import MemoryIngestionQueue, MemoryManager
+from app.core.memory.runtime import MemoryRuntime
+from app.models.memory import MemoryStore
+from app.services.memory_service import MemoryService
+
+
+@pytest.fixture
+def memory_manager():
+    """添加记忆只记录每批的内容"""
+    manager = Mock()
+    manager.batches = []
+
+    async def add_memories(items):
+        manager.batches.append([item["content"] for item in items])
+        return []
+
+    manager.add_memories = AsyncMock(side_effect=add_memories)
+    return manager
+
+
+@pytest.fixture
+def session_factory():
+    """每次调用返回一个新的模拟数据库会话，打开过的会话记录在 sessions 中"""
+    factory = Mock()
+    factory.sessions = []
+
+    def open_session():
+        factory.sessions.append(Mock())
+        return factory.sessions[-1]
+
+    factory.side_effect = open_session
+    return factory
+
+
+def make_queue(session_factory, memory_manager, **kwargs):
+    return MemoryIngestionQueue(session_factory, lambda db: memory_manager, **kwargs)
+
+
+class TestAddMemories:
+    """测试批量添加记忆"""
+
+    @pytest.mark.asyncio
+    async def test_one_classification_embedding_and_commit_per_batch(self):
+        """测试整批只做一次分类、一次向量化和一次数据库提交，已指定的类型和重要性不再计算"""
+        vector_store = Mock()
+        vector_store.embedding_service.embed_batch = AsyncMock(return_value=np.eye(3, dtype=np.float32))
+        vector_store.add_memory = AsyncMock(return_value=True)
+        with patch('app.core.memory.memory_manager.MemoryDAO'):
+            manager = MemoryManager(Mock(), Mock(), vector_store=vector_store)
+        manager.classifier.batch_classify = AsyncMock(return_value=["semantic", "long_term"])
+        manager.scorer.score_memory = AsyncMock(return_value=0.4)
+        manager.memory_dao.create_memories.side_effect = lambda memories: memories
+
+        memories = await manager.add_memories([
+            {"conversation_id": 1, "content": "什么是闭包"},
+            {"conversation_id": 1, "content": "用户喜欢咖啡", "importance_score": 0.9},
+            {"conversation_id": 1, "content": "你好", "memory_type": "short_term"},
+        ])
+
+        assert [m.memory_type for m in memories] == ["semantic", "long_term", "short_term"]
+        assert [m.importance_score for m in memories] == [0.4, 0.9, 0.4]
+        manager.classifier.batch_classify.assert_awaited_once_with(["什么是闭包", "用户喜欢咖啡"])
+        vector_store.embedding_service.embed_batch.assert_awaited_once()
+        manager.memory_dao.create_memories.assert_called_once()
+        assert manager.scorer.score_memory.await_count == 2
+        assert "vector" in manager.scorer.score_memory.call_args.args[1]
+        assert vector_store.add_memory.await_count == 3
+
+
+class TestMemoryIngestionQueue:
+    """测试后台写入队列"""
+
+    @pytest.mark.asyncio
+    async def test_submit_returns_before_writing_and_batches(self, session_factory, memory_manager):
+        """测试提交后立即返回，后台按批写入"""
+        queue = make_queue(session_factory, memory_manager, batch_size=4, batch_wait_ms=20, workers=1)
+
+        for i in range(10):
+            await queue.submit(conversation_id=1, content=f"记忆{i}")
+        memory_manager.add_memories.assert_not_called()
+
+        await queue.flush()
+
+        assert [len(batch) for batch in memory_manager.batches] == [4, 4, 2]
+        assert [c for batch in memory_manager.batches for c in batch] == [f"记忆{i}" for i in range(10)]
+        assert queue.get_stats()["ingested"] == 10
+        await queue.close()
+
+    @pytest.mark.asyncio
+    async def test_full_queue_applies_backpressure(self, session_factory, memory_manager):
+        """测试队列满时提交方等待，写入恢复后继续"""
+        release = asyncio.Event()
+
+        async def slow_add(items):
+            await release.wait()
+            return []
+
+        memory_manager.add_memories.side_effect = slow_add
+        queue = make_queue(session_factory, memory_manager, max_pending=1, batch_size=1, workers=1)
+
+        await queue.submit(conversation_id=1, content="a")
+        await asyncio.sleep(0)
+        await queue.submit(conversation_id=1, content="b")
+        with pytest.raises(asyncio.TimeoutError):
+            await asyncio.wait_for(queue.submit(conversation_id=1, content="c"), 0.05)
+        assert queue.pending == 1
+
+        release.set()
+        await queue.submit(conversation_id=1, content="c")
+        await queue.close()
+        assert memory_manager.add_memories.await_count == 3
+
+    @pytest.mark.asyncio
+    async def test_failed_batch_does_not_stop_worker(self, session_factory, memory_manager):
+        """测试一批写入失败后工作协程继续处理后续记忆，失败批次的会话同样关闭"""
+        memory_manager.add_memories.side_effect = [RuntimeError("数据库不可用"), []]
+        queue = make_queue(session_factory, memory_manager, batch_size=1, workers=1)
+
+        await queue.submit(conversation_id=1, content="a")
+        await queue.submit(conversation_id=1, content="b")
+        await queue.close()
+
+        stats = queue.get_stats()
+        assert (stats["failed"], stats["ingested"]) == (1, 1)
+        assert len(session_factory.sessions) == 2
+        for session in session_factory.sessions:
+            session.close.assert_called_once()
+
+    @pytest.mark.asyncio
+    async def test_each_batch_uses_its_own_session(self, session_factory, memory_manager):
+        """测试每批打开新的数据库会话并用它构建记忆管理器，写完即关闭"""
+        manager_factory = Mock(return_value=memory_manager)
+        queue = MemoryIngestionQueue(session_factory, manager_factory, batch_size=2, batch_wait_ms=20, workers=1)
+
+        for i in range(5):
+            await queue.submit(conversation_id=1, content=f"记忆{i}")
+        await queue.close()
+
+        sessions = session_factory.sessions
+        assert len(sessions) == 3
+        assert [call.args[0] for call in manager_factory.call_args_list] == sessions
+        for session in sessions:
+            session.close.assert_called_once()
+            session.commit.assert_not_called()
+
+    @pytest.mark.asyncio
+    async def test_memory_service_enqueues_instead_of_writing(self, session_factory, memory_manager):
+        """测试记忆服务配置队列后只入队，请求的记忆管理器不写入"""
+        request_manager = Mock()
+        request_manager.add_memories = AsyncMock()
+        queue = make_queue(session_factory, memory_manager, workers=1)
+        service = MemoryService(Mock(), Mock(), request_manager, ingestion_queue=queue)
+
+        assert await service.store_memory("用户: 你好\n助手: 你好", conversation_id=1, user_id=7, importance=0.5) is None
+        assert await service.save_conversation_memory(1, [{"role": "user", "content": "喜欢咖啡"}]) == []
+        memory_manager.add_memories.assert_not_called()
+
+        await queue.close()
+        assert [c for batch in memory_manager.batches for c in batch] == ["用户: 你好\n助手: 你好", "喜欢咖啡"]
+        request_manager.add_memories.assert_not_called()
+
+
+class TestMemoryRuntime:
+    """测试记忆运行时创建和关闭写入队列"""
+
+    @pytest.mark.asyncio
+    async def test_start_creates_queue_and_close_drains_it(self):
+        """测试启动时按配置创建写入队列，关闭时先写完队列中的记忆"""
+        memory_config = {
+            "vector_search": False,
+            "ingestion": {"enabled": True, "max_pending": 8, "batch_size": 4, "workers": 1}
+        }
+        runtime = MemoryRuntime()
+        with patch('app.core.memory.runtime.config') as config:
+            config.get.return_value = memory_config
+            await runtime.start()
+
+        queue = runtime.ingestion_queue
+        assert (queue.max_pending, queue.batch_size, queue.workers) == (8, 4, 1)
+        queue.flush = AsyncMock()
+
+        await runtime.close()
+
+        queue.flush.assert_awaited_once()
+        assert runtime.ingestion_queue is None
+
+    @pytest.mark.asyncio
+    async def test_ingestion_can_be_disabled(self):
+        """测试关闭写入队列时记忆在请求中同步写入"""
+        runtime = MemoryRuntime()
+        with patch('app.core.memory.runtime.config') as config:
+            config.get.return_value = {"vector_search": False, "ingestion": {"enabled": False}}
+            await runtime.start()
+
+        assert runtime.ingestion_queue is None
+        await runtime.close()
@@ -0,0 +1,217 @@
+"""
+记忆检索单元测试
+
+测试BM25关键词索引和混合检索器
+"""
+
+from datetime import datetime, timedelta
+from unittest.mock import AsyncMock, Mock, patch
+
+import pytest
+
+from app.core.memory import MemoryManager
+from app.core.memory.hybrid_retriever import HybridRetriever, reciprocal_rank_fusion
+from app.core.memory.keyword_index import BM25Index, tokenize
+from app.models.memory import MemoryStore
+
+
+def make_memory(memory_id, content, conversation_id=1, memory_type="long_term", expires_at=None):
+    return MemoryStore(
+        id=memory_id,
+        conversation_id=conversation_id,
+        content=content,
+        memory_type=memory_type,
+        importance_score=0.5,
+        expires_at=expires_at
+    )
+
+
+MEMORIES = [
+    make_memory(1, "我喜欢用Python做机器学习"),
+    make_memory(2, "周末去北京旅行"),
+    make_memory(3, "机器学习模型部署在北京机房", memory_type="short_term"),
+    make_memory(4, "今天天气很好"),
+]
+
+
+class TestBM25Index:
+    """测试BM25关键词索引"""
+
+    @pytest.fixture
+    def index(self):
+        index = BM25Index()
+        index.load_conversation(1, MEMORIES)
+        return index
+
+    def test_tokenize_splits_cjk_into_bigrams(self):
+        """测试中文按两字切分，英文按单词切分并去掉停用词"""
+        assert tokenize("机器学习 and the Python") == ["机器", "器学", "学习", "python"]
+        assert tokenize("北") == ["北"]
+        assert tokenize("") == []
+
+    def test_search_ranks_by_bm25(self, index):
+        """测试命中更多查询词元的记忆排在前面"""
+        hits = index.search("北京的机器学习", conversation_id=1)
+
+        assert [memory_id for memory_id, _ in hits] == [3, 1, 2]
+        assert hits[0][1] > hits[1][1] > 0
+        assert index.search("天气", conversation_id=2) == []
+
+    def test_filters_and_incremental_updates(self, index):
+        """测试类型、过期过滤以及增量增删"""
+        assert [i for i, _ in index.search("机器学习", 1, memory_types=["short_term"])] == [3]
+
+        index.add(make_memory(5, "机器学习笔记", expires_at=datetime.utcnow() - timedelta(hours=1)))
+        index.add(make_memory(6, "北京机器学习", conversation_id=2))
+        assert 5 not in [i for i, _ in index.search("机器学习", 1)]
+        assert 5 in [i for i, _ in index.search("机器学习", 1, include_expired=True)]
+        assert not index.has_conversation(2)
+
+        assert index.remove(1, conversation_id=1)
+        assert index.remove(3)
+        assert not index.remove(3)
+        assert [i for i, _ in index.search("机器学习", 1)] == []
+        assert len(index) == 3
+
+    def test_deleted_memories_do_not_skew_scores(self):
+        """测试删除的记忆不计入文档频率，墓碑过多时重建分区"""
+        index = BM25Index()
+        index.load_conversation(1, [make_memory(i, "北京 咖啡") for i in range(200)])
+        for memory_id in range(150):
+            index.remove(memory_id, conversation_id=1)
+
+        hits = index.search("咖啡", 1, limit=3)
+
+        assert [memory_id for memory_id, _ in hits] == [150, 151, 152]
+        assert all(score > 0 for _, score in hits)
+        assert len(index) == 50
+        assert len(index._conversations[1].alive) < 200
+
+    def test_conversations_are_loaded_once_and_evicted(self):
+        """测试会话首次检索时加载，超过上限时淘汰最久未使用的会话"""
+        index = BM25Index(max_conversations=1)
+        loader = Mock(return_value=MEMORIES)
+
+        index.ensure_conversation(1, loader)
+        index.ensure_conversation(1, loader)
+        assert loader.call_count == 1
+
+        index.ensure_conversation(2, lambda: [make_memory(9, "北京", conversation_id=2)])
+        assert not index.has_conversation(1)
+        assert [i for i, _ in index.search("北京", 2)] == [9]
+
+
+class TestHybridRetriever:
+    """测试混合检索器"""
+
+    @pytest.mark.asyncio
+    async def test_keyword_retrieve_uses_bm25_index(self):
+        """测试提供索引时关键词检索按BM25返回，不扫描数据库"""
+        memory_dao = Mock()
+        memory_dao.get_memories_by_conversation.return_value = MEMORIES
+        memory_dao.get_memories_by_ids.side_effect = lambda ids: [m for i in ids for m in MEMORIES if m.id == i]
+        retriever = HybridRetriever(memory_dao=memory_dao, keyword_index=BM25Index())
+
+        results = await retriever.retrieve("北京的机器学习", conversation_id=1, strategy="keyword", limit=2)
+
+        assert [m.id for m in results] == [3, 1]
+        memory_dao.get_memories_by_conversation.assert_called_once_with(1, include_expired=True)
+        memory_dao.search_relevant_memories.assert_not_called()
+        memory_dao.get_memories_by_ids.assert_called_once_with([3, 1])
+
+    @pytest.fixture
+    def hybrid(self):
+        memory_dao = Mock()
+        memory_dao.get_memories_by_conversation.return_value = MEMORIES
+        memory_dao.get_memories_by_ids.side_effect = lambda ids: [m for i in ids for m in MEMORIES if m.id == i]
+        vector_store = Mock()
+        vector_store.search_memories = AsyncMock(return_value=[(4, 0.9), (2, 0.8), (1, 0.7)])
+        return HybridRetriever(vector_store=vector_store, memory_dao=memory_dao, keyword_index=BM25Index())
+
+    def test_reciprocal_rank_fusion(self):
+        """测试加权RRF：两路都靠前的ID得分最高"""
+        fused = reciprocal_rank_fusion([[1, 2, 3], [3, 1]], [1.0, 2.0], k=0)
+
+        assert fused == {1: pytest.approx(1 + 1.0), 2: pytest.approx(0.5), 3: pytest.approx(1 / 3 + 2.0)}
+
+    @pytest.mark.asyncio
+    async def test_hybrid_fuses_both_rankings_with_one_query(self, hybrid):
+        """测试混合检索融合向量与关键词排名，只用一次IN查询取回候选"""
+        results = await hybrid.retrieve("北京的机器学习", conversation_id=1, limit=3)
+
+        # 1 在两路中都出现，排第一；只出现在一路的按各自排名融合
+        assert [m.id for m in results][:1] == [1]
+        assert {m.id for m in results} <= {1, 2, 3, 4}
+        assert len(results) == 3
+        hybrid.memory_dao.get_memories_by_ids.assert_called_once()
+        hybrid.memory_dao.get_by_id.assert_not_called()
+
+    @pytest.mark.asyncio
+    async def test_hybrid_weights_shift_the_ranking(self, hybrid):
+        """测试权重决定各路排名的影响：权重为0的检索器不参与排序"""
+        hybrid.prior_weight = 0.0
+        hybrid.vector_weight = 0.0
+        keyword_only = await hybrid.retrieve("北京的机器学习", conversation_id=1, limit=3)
+        hybrid.vector_weight, hybrid.keyword_weight = 1.0, 0.0
+        vector_only = await hybrid.retrieve("北京的机器学习", conversation_id=1, limit=3)
+
+        assert [m.id for m in keyword_only] == [3, 1, 2]
+        assert [m.id for m in vector_only] == [4, 2, 1]
+
+
+class TestMemoryManagerKeywordSearch:
+    """测试记忆管理器的关键词检索"""
+
+    @pytest.fixture
+    def manager(self):
+        with patch('app.core.memory.memory_manager.MemoryDAO'):
+            return MemoryManager(Mock(), Mock(), keyword_index=BM25Index())
+
+    @pytest.mark.asyncio
+    async def test_chinese_query_is_tokenized(self, manager):
+        """测试中文查询按两字词元传给数据库，而不是整句作为一个关键词"""
+        manager.memory_dao.search_relevant_memories.return_value = []
+
+        await manager.get_relevant_memories(1, "北京的机器学习 Python python")
+
+        keywords = manager.memory_dao.search_relevant_memories.call_args.kwargs["keywords"]
+        assert keywords == ["北京", "京的", "的机", "机器", "器学", "学习", "python"]
+
+    @pytest.mark.asyncio
+    async def test_maintenance_keeps_keyword_index_in_sync(self, test_db, test_conversation):
+        """测试遗忘删除的记忆离开BM25结果，升级后的记忆按新类型检索"""
+        conversation_id = test_conversation.id
+        # SQLite 不会为 BIGINT 主键自增，显式指定ID
+        for memory_id, content, memory_type in [
+            (9201, "北京的机器学习会议", "long_term"),
+            (9202, "北京旅行计划", "long_term"),
+            (9203, "机器学习入门", "short_term"),
+        ]:
+            test_db.add(MemoryStore(
+                id=memory_id, conversation_id=conversation_id, content=content,
+                memory_type=memory_type, importance_score=0.5
+            ))
+        test_db.commit()
+
+        index = BM25Index()
+        manager = MemoryManager(test_db, Mock(), keyword_index=index)
+        index.ensure_conversation(
+            conversation_id, lambda: manager.memory_dao.get_memories_by_conversation(conversation_id)
+        )
+        assert {i for i, _ in index.search("北京", conversation_id)} == {9201, 9202}
+
+        forgotten = manager.memory_dao.get_memory_by_id(9201)
+        manager.forgetting.apply_forgetting = AsyncMock(return_value={"forgotten_memories": [forgotten]})
+        result = await manager.apply_forgetting(conversation_id)
+
+        assert result["deleted_count"] == 1
+        assert manager.memory_dao.get_memory_by_id(9201) is None
+        assert [i for i, _ in index.search("北京", conversation_id)] == [9202]
+
+        manager._should_upgrade_to_long_term = Mock(return_value=True)
+        manager.scorer.score_memory = AsyncMock(return_value=0.9)
+        upgraded = await manager.upgrade_to_long_term([manager.memory_dao.get_memory_by_id(9203)])
+
+        assert [m.memory_type for m in upgraded] == ["long_term"]
+        assert upgraded[0].memory_metadata["original_type"] == "short_term"
+        assert [i for i, _ in index.search("机器学习", conversation_id, memory_types=["long_term"])] == [9203]
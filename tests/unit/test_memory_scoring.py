@@ -0,0 +1,139 @@
+"""
+记忆评分单元测试
+
+测试重要性评分器的本地评分和合并LLM评分，以及分类器的规则模式
+"""
+
+from unittest.mock import AsyncMock, Mock
+
+import numpy as np
+import pytest
+
+from app.core.memory.importance_scorer import ImportanceScorer
+from app.core.memory.memory_classifier import MemoryClassifier
+from app.models.memory import MemoryStore
+
+
+def make_memory(content, memory_id=None):
+    return MemoryStore(id=memory_id, conversation_id=1, content=content, memory_type="short_term")
+
+
+@pytest.fixture
+def mock_llm():
+    llm = Mock()
+    llm.achat = AsyncMock()
+    return llm
+
+
+@pytest.fixture
+def vector_store():
+    """记忆向量 [1, 0]，当前任务向量 [0.6, 0.8]，最相近的已有记忆相似度0.8"""
+    store = Mock()
+    store.embedding_service.embed_text = AsyncMock(
+        side_effect=lambda text: np.array([0.6, 0.8] if text == "学习Python" else [1.0, 0.0])
+    )
+    store.search = AsyncMock(return_value=[(5, 0.99, {}), (7, 0.8, {})])
+    return store
+
+
+class TestLocalScoring:
+    """测试本地评分（不调用LLM）"""
+
+    @pytest.mark.asyncio
+    async def test_local_scoring_makes_no_llm_calls(self, mock_llm, vector_store):
+        """测试默认模式下评分只用向量和词典，不调用LLM"""
+        scorer = ImportanceScorer(mock_llm, vector_store=vector_store)
+
+        score = await scorer.score_memory(make_memory("我喜欢Python", memory_id=5), {"current_task": "学习Python"})
+
+        assert 0.0 < score <= 1.0
+        mock_llm.achat.assert_not_called()
+
+    @pytest.mark.asyncio
+    async def test_novelty_and_relevance_from_vectors(self, vector_store):
+        """测试新颖性取自最近邻距离（跳过自身），相关性取自与当前任务的余弦相似度"""
+        scorer = ImportanceScorer(vector_store=vector_store)
+
+        scores = await scorer._dimension_scores(make_memory("我喜欢Python", memory_id=5), {"current_task": "学习Python"})
+
+        assert scores["novelty"] == pytest.approx(0.2)
+        assert scores["relevance"] == pytest.approx(0.6)
+        vector_store.search.assert_awaited_once()
+        assert vector_store.search.call_args.kwargs["filter_metadata"] == {"conversation_id": 1}
+
+        vector_store.search.return_value = []
+        scores = await scorer._dimension_scores(make_memory("全新的内容"))
+        assert scores["novelty"] == 1.0
+        assert scores["relevance"] == 0.5
+
+    @pytest.mark.asyncio
+    async def test_precomputed_vector_is_reused(self, vector_store):
+        """测试上下文中已有记忆向量时不再向量化记忆内容"""
+        scorer = ImportanceScorer(vector_store=vector_store)
+
+        await scorer._dimension_scores(make_memory("我喜欢Python"), {"vector": np.array([1.0, 0.0])})
+
+        vector_store.embedding_service.embed_text.assert_not_called()
+
+    @pytest.mark.asyncio
+    async def test_relevance_falls_back_to_token_overlap(self):
+        """测试没有向量存储时相关性按词元重合计算"""
+        scorer = ImportanceScorer()
+
+        scores = await scorer._dimension_scores(make_memory("周末去北京旅行"), {"current_task": "北京旅行"})
+
+        assert scores["novelty"] == 0.5
+        assert scores["relevance"] == pytest.approx(1.0)
+
+    def test_lexicon_emotional_score(self):
+        """测试情感强度随情感词强度、程度副词和感叹号增加"""
+        scorer = ImportanceScorer()
+
+        neutral = scorer._lexicon_emotional_score("会议定在周三下午三点")
+        mild = scorer._lexicon_emotional_score("我喜欢这家餐厅")
+        strong = scorer._lexicon_emotional_score("我真的非常生气，太讨厌了！")
+
+        assert neutral == pytest.approx(0.1)
+        assert neutral < mild < strong <= 1.0
+        assert scorer._lexicon_emotional_score("I really hate this") > scorer._lexicon_emotional_score("I like this")
+        # 长词优先匹配："不喜欢" 不再计入 "喜欢"
+        assert scorer._lexicon_emotional_score("不喜欢") == scorer._lexicon_emotional_score("dislike")
+
+
+class TestLLMScoring:
+    """测试启用LLM时的合并评分"""
+
+    @pytest.mark.asyncio
+    async def test_one_combined_llm_call(self, mock_llm):
+        """测试三个维度合并为一次LLM调用"""
+        mock_llm.achat.return_value = '评分如下：{"novelty": 0.9, "emotional": 0.4, "relevance": 0.7}'
+        scorer = ImportanceScorer(mock_llm, use_llm=True)
+
+        scores = await scorer._dimension_scores(make_memory("新的知识"), {"current_task": "学习"})
+
+        assert scores == {"novelty": 0.9, "emotional": 0.4, "relevance": 0.7}
+        mock_llm.achat.assert_awaited_once()
+
+    @pytest.mark.asyncio
+    async def test_unparseable_response_uses_defaults(self, mock_llm):
+        """测试响应无法解析时使用默认分数，没有当前任务时不评估相关性"""
+        mock_llm.achat.return_value = "无法评估"
+        scorer = ImportanceScorer(mock_llm, use_llm=True)
+
+        scores = await scorer._dimension_scores(make_memory("内容"))
+
+        assert scores == {"novelty": 0.5, "emotional": 0.3, "relevance": 0.5}
+        assert "relevance" not in mock_llm.achat.call_args.args[0]
+
+
+class TestRuleClassification:
+    """测试分类器的规则模式"""
+
+    @pytest.mark.asyncio
+    async def test_rule_mode_makes_no_llm_calls(self, mock_llm):
+        """测试关闭LLM分类时单条和批量分类都只用规则"""
+        classifier = MemoryClassifier(mock_llm, use_llm=False)
+
+        assert await classifier.classify_memory("用户喜欢喝咖啡") == "long_term"
+        assert await classifier.batch_classify(["今天完成了报告", "什么是闭包的定义"]) == ["episodic", "semantic"]
+        mock_llm.achat.assert_not_called()
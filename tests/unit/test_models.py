@@ -3,9 +3,11 @@
 测试 ORM 模型的基本功能
 """
 
+import numpy as np
 import pytest
 from datetime import datetime, timedelta
 
+from app.dao.memory_dao import MemoryDAO
 from app.models.task import Task
 from app.models.memory import MemoryStore
 from app.models.knowledge import KnowledgeGraph, KnowledgeRelation
@@ -193,6 +195,90 @@ class TestMemoryModel:
         expected_expires = expires_at + timedelta(hours=1)
         assert memory.expires_at == expected_expires
     
+    def test_memory_embedding_vector(self):
+        """测试向量嵌入按 float32 / float16 字节保存与解码"""
+        vector = np.linspace(-1, 1, 8, dtype=np.float32)
+        memory = MemoryStore(memory_type="short_term", content="Test memory")
+        
+        memory.set_embedding_vector(vector)
+        assert len(memory.embedding) == 4 + 32
+        assert np.array_equal(memory.get_embedding_vector(8), vector)
+        
+        memory.set_embedding_vector(vector, np.float16)
+        assert len(memory.embedding) == 4 + 16
+        assert np.allclose(memory.get_embedding_vector(8), vector, atol=1e-3)
+        
+        assert memory.get_embedding_vector(5) is None
+        assert MemoryStore.decode_embedding(None, 8) is None
+        
+        # 字节数相同的 float16 16维向量不会被误解码为 float32 8维向量
+        memory.set_embedding_vector(np.ones(16), np.float16)
+        assert len(memory.embedding) == 4 + 32
+        assert memory.get_embedding_vector(8) is None
+        
+        # 没有头部的原始字节视为缺失
+        assert MemoryStore.decode_embedding(vector.tobytes(), 8) is None
+        with pytest.raises(ValueError):
+            memory.set_embedding_vector(vector, np.float64)
+    
+    def test_search_relevant_memories(self, test_db, test_conversation):
+        """测试相关记忆的过滤、匹配、排序和数量限制在SQL中完成"""
+        past = datetime.utcnow() - timedelta(hours=1)
+        rows = [
+            ("long_term", "Python 和 100% 覆盖率", 0.9, None),
+            ("long_term", "喜欢 python", 0.5, None),
+            ("short_term", "python 学习计划", 0.8, past),
+            ("episodic", "python 与北京", 0.3, None),
+            ("long_term", "无关内容", 1.0, None),
+        ]
+        # SQLite 不会为 BIGINT 主键自增，显式指定ID
+        for memory_id, (memory_type, content, importance, expires_at) in enumerate(rows, start=9001):
+            test_db.add(MemoryStore(
+                id=memory_id,
+                conversation_id=test_conversation.id,
+                memory_type=memory_type,
+                content=content,
+                importance_score=importance,
+                expires_at=expires_at
+            ))
+        test_db.commit()
+        dao = MemoryDAO(test_db)
+        
+        by_importance = dao.search_relevant_memories(test_conversation.id, ["PYTHON"], limit=2)
+        assert [m.content for m in by_importance] == ["Python 和 100% 覆盖率", "喜欢 python"]
+        
+        by_type = dao.search_relevant_memories(
+            test_conversation.id, ["北京", "喜欢"], memory_types=["episodic", "long_term"]
+        )
+        assert [m.content for m in by_type] == ["喜欢 python", "python 与北京"]
+        
+        # LIKE 通配符按字面匹配
+        assert len(dao.search_relevant_memories(test_conversation.id, ["0%"])) == 1
+        assert dao.search_relevant_memories(test_conversation.id, ["%"], limit=10)[0].content.endswith("覆盖率")
+        assert dao.search_relevant_memories(test_conversation.id, []) == []
+        
+        # 只在按重要性取出的前 max_scan 条中匹配
+        assert dao.search_relevant_memories(test_conversation.id, ["北京"], max_scan=4) == []
+        assert len(dao.search_relevant_memories(test_conversation.id, ["北京"], max_scan=5)) == 1
+        
+        # 按ID批量获取保持输入顺序，跳过不存在的ID
+        assert [m.id for m in dao.get_memories_by_ids([9004, 9001, 123456, 9002])] == [9004, 9001, 9002]
+        assert dao.get_memories_by_ids([]) == []
+    
+    def test_create_memories(self, test_db, test_conversation):
+        """测试批量创建记忆一次提交，返回带ID的对象"""
+        dao = MemoryDAO(test_db)
+        
+        # SQLite 不会为 BIGINT 主键自增，显式指定ID
+        memories = dao.create_memories([
+            MemoryStore(id=9101, conversation_id=test_conversation.id, memory_type="short_term", content="批量一"),
+            MemoryStore(id=9102, conversation_id=test_conversation.id, memory_type="episodic", content="批量二")
+        ])
+        
+        assert [m.id for m in memories] == [9101, 9102]
+        assert [m.content for m in dao.get_memories_by_ids([9102, 9101])] == ["批量二", "批量一"]
+        assert dao.create_memories([]) == []
+    
     def test_memory_to_dict(self, test_memory):
         """测试记忆转字典"""
         memory_dict = test_memory.to_dict()
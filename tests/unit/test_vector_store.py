@@ -0,0 +1,752 @@
+"""
+向量存储单元测试
+
+测试记忆向量存储的增删改查、墓碑与压缩
+"""
+
+import asyncio
+import json
+import os
+import threading
+import time
+from datetime import datetime
+from types import SimpleNamespace
+from unittest.mock import Mock, patch
+
+import numpy as np
+import pytest
+
+faiss = pytest.importorskip("faiss")
+
+from app.core.vectordb import MemoryVectorStore, ReembedJob
+from app.core.vectordb.persistence.id_table import IdTable
+from app.core.vectordb.persistence.metadata_manager import MetadataManager
+from app.models.memory import MemoryStore
+
+
+DIMENSION = 16
+
+
+class FakeEmbedding:
+    """确定性的假向量化服务"""
+
+    dimension = DIMENSION
+
+    async def embed_text(self, text: str) -> np.ndarray:
+        return make_vector(sum(ord(c) for c in text))
+
+    async def embed_batch(self, texts):
+        return np.stack([await self.embed_text(text) for text in texts])
+
+
+def make_vector(seed: int) -> np.ndarray:
+    """生成归一化的随机向量"""
+    rng = np.random.default_rng(seed)
+    vector = rng.standard_normal(DIMENSION).astype(np.float32)
+    return vector / np.linalg.norm(vector)
+
+
+class TestMemoryVectorStore:
+    """测试记忆向量存储"""
+
+    @pytest.fixture
+    def store(self, tmp_path):
+        """记忆向量存储实例"""
+        return MemoryVectorStore(FakeEmbedding(), str(tmp_path), compaction_threshold=0.3)
+
+    @pytest.fixture
+    def vectors(self):
+        """测试向量"""
+        return {i: make_vector(i) for i in range(1, 21)}
+
+    async def _fill(self, store, vectors):
+        for vector_id, vector in vectors.items():
+            memory_type = "short_term" if vector_id % 2 else "long_term"
+            await store.add_vector(vector_id, vector, {"memory_type": memory_type})
+
+    @pytest.mark.asyncio
+    async def test_search_returns_exact_match_first(self, store, vectors):
+        """测试搜索返回自身"""
+        await self._fill(store, vectors)
+
+        results = await store.search(vectors[7], top_k=3)
+
+        assert results[0][0] == 7
+        assert results[0][1] == pytest.approx(1.0, abs=1e-5)
+
+    @pytest.mark.asyncio
+    async def test_remove_excludes_vector_from_search(self, store, vectors):
+        """测试删除后向量不再被搜索到"""
+        await self._fill(store, vectors)
+
+        assert await store.remove_vector(7)
+        results = await store.search(vectors[7], top_k=5)
+
+        assert 7 not in [vector_id for vector_id, _, _ in results]
+        assert len(results) == 5
+        assert await store.count() == 19
+
+    @pytest.mark.asyncio
+    async def test_compaction_physically_removes_vectors(self, tmp_path, vectors):
+        """测试墓碑比例超过阈值后压缩物理删除向量"""
+        # 等待日志fsync会让出事件循环，使压缩在删除中途开始；关闭fsync以固定压缩时机
+        store = MemoryVectorStore(FakeEmbedding(), str(tmp_path), compaction_threshold=0.3, wal_sync=False)
+        await self._fill(store, vectors)
+
+        for vector_id in (1, 3, 5, 7):
+            await store.remove_vector(vector_id)
+        await asyncio.sleep(0.1)
+
+        shard = store.shards["short_term"]
+        assert shard.tombstones == set()
+        assert shard.ntotal == 6
+
+    @pytest.mark.asyncio
+    async def test_update_does_not_leave_orphans(self, store, vectors):
+        """测试更新不会在索引中留下孤立向量"""
+        await self._fill(store, vectors)
+
+        for _ in range(3):
+            await store.update_vector(2, vectors[9], {"memory_type": "long_term"})
+        await store.save()
+
+        assert store.shards["long_term"].ntotal == 10
+        vector, metadata = await store.get_vector(2)
+        np.testing.assert_allclose(vector, vectors[9], rtol=1e-6)
+        assert metadata["memory_type"] == "long_term"
+
+    @pytest.mark.asyncio
+    async def test_filtered_search_returns_top_k_in_scope(self, store, vectors):
+        """测试过滤条件下推后仍返回top_k个范围内结果"""
+        for vector_id, vector in vectors.items():
+            await store.add_vector(vector_id, vector, {
+                "memory_type": "long_term",
+                "conversation_id": vector_id % 4
+            })
+
+        results = await store.search(vectors[1], top_k=5, filter_metadata={"conversation_id": 3})
+
+        assert len(results) == 5
+        assert all(metadata["conversation_id"] == 3 for _, _, metadata in results)
+
+    @pytest.mark.asyncio
+    async def test_filter_accepts_value_lists(self, store, vectors):
+        """测试列表过滤值表示属于其中之一"""
+        await self._fill(store, vectors)
+
+        results = await store.search(
+            vectors[1], top_k=20, filter_metadata={"memory_type": ["long_term", "semantic"]}
+        )
+
+        assert sorted(vector_id for vector_id, _, _ in results) == list(range(2, 21, 2))
+
+    @pytest.mark.asyncio
+    async def test_search_batch_matches_single_searches(self, store, vectors):
+        """测试批量搜索与逐个搜索结果一致"""
+        await self._fill(store, vectors)
+        queries = np.stack([vectors[i] for i in (3, 8, 15)])
+
+        batch = await store.search_batch(queries, top_k=4, filter_metadata={"memory_type": "long_term"})
+
+        assert batch[1][0][0] == 8
+        assert [len(results) for results in batch] == [4, 4, 4]
+        for query, results in zip(queries, batch):
+            single = await store.search(query, top_k=4, filter_metadata={"memory_type": "long_term"})
+            assert [vector_id for vector_id, _, _ in results] == [vector_id for vector_id, _, _ in single]
+
+    @pytest.mark.asyncio
+    async def test_search_memories_batch(self, store):
+        """测试批量记忆搜索一次向量化所有查询"""
+        for memory_id, text in enumerate(["apple pie", "banana split", "cherry tart"], start=1):
+            await store.add_memory(memory_id, text, "long_term", {})
+
+        results = await store.search_memories_batch(["cherry tart", "apple pie"], top_k=1, time_decay=False)
+
+        assert [hits[0][0] for hits in results] == [3, 1]
+
+
+class TestPartitionedVectorStore:
+    """测试按用户分区的向量存储"""
+
+    @pytest.fixture
+    def store(self, tmp_path):
+        """按 user_id 分区、最多常驻2个分片的向量存储"""
+        return MemoryVectorStore(
+            FakeEmbedding(), str(tmp_path), partition_key="user_id", max_resident_shards=2
+        )
+
+    async def _fill(self, store):
+        for vector_id in range(1, 31):
+            await store.add_vector(vector_id, make_vector(vector_id), {
+                "memory_type": "long_term",
+                "user_id": vector_id % 3
+            })
+
+    @pytest.mark.asyncio
+    async def test_search_stays_within_partition(self, store):
+        """测试分区过滤只搜索对应分区"""
+        await self._fill(store)
+
+        results = await store.search(make_vector(4), top_k=5, filter_metadata={"user_id": 1})
+
+        assert results[0][0] == 4
+        assert len(results) == 5
+        assert all(metadata["user_id"] == 1 for _, _, metadata in results)
+
+    @pytest.mark.asyncio
+    async def test_evicted_shards_reload_lazily(self, store):
+        """测试超出常驻上限的分片被换出，访问时从磁盘重新加载"""
+        await self._fill(store)
+
+        assert len(store.shards) == 2
+        evicted = "user_id_1/long_term"
+        assert evicted not in store.shards
+
+        await store.remove_vector(7)
+        results = await store.search(make_vector(10), top_k=20, filter_metadata={"user_id": 1})
+
+        assert results[0][0] == 10
+        assert 7 not in [vector_id for vector_id, _, _ in results]
+        assert len(results) == 9
+        assert len(store.shards) == 2
+
+    @pytest.mark.asyncio
+    async def test_reopen_discovers_persisted_shards(self, store, tmp_path):
+        """测试重新打开后按需加载已持久化的分区"""
+        await self._fill(store)
+        await store.save()
+
+        reopened = MemoryVectorStore(
+            FakeEmbedding(), str(tmp_path), partition_key="user_id", max_resident_shards=2
+        )
+        results = await reopened.search(make_vector(5), top_k=3, filter_metadata={"user_id": 2})
+
+        assert len(reopened.shards) == 1
+        assert results[0][0] == 5
+        assert await reopened.count() == 30
+
+
+class TestIndexPromotion:
+    """测试分片从Flat升级为IVF/HNSW"""
+
+    def _store(self, tmp_path, index_type):
+        return MemoryVectorStore(
+            FakeEmbedding(), str(tmp_path), index_type=index_type,
+            nlist=4, promotion_threshold=200, nprobe=4, compaction_threshold=0.5
+        )
+
+    async def _fill(self, store, count=300):
+        for vector_id in range(1, count + 1):
+            await store.add_vector(vector_id, make_vector(vector_id), {"memory_type": "long_term"})
+        await asyncio.gather(*store._promotion_tasks.values())
+
+    @pytest.mark.asyncio
+    @pytest.mark.parametrize("index_type", ["IVFFlat", "HNSW"])
+    async def test_promotes_after_threshold(self, tmp_path, index_type):
+        """测试达到阈值后升级，且升级期间的写入不丢失"""
+        store = self._store(tmp_path, index_type)
+        await self._fill(store)
+
+        shard = store.shards["long_term"]
+        assert shard.index_kind == index_type
+        assert shard.live_count == 300
+        assert store.shards["short_term"].index_kind == "Flat"
+
+        results = await store.search(make_vector(250), top_k=1)
+        assert results[0][0] == 250
+
+    @pytest.mark.asyncio
+    async def test_hnsw_update_and_compaction(self, tmp_path):
+        """测试HNSW分片更新后按新向量打分，压缩后清除旧行"""
+        store = self._store(tmp_path, "HNSW")
+        await self._fill(store)
+
+        await store.update_vector(5, make_vector(9999), {"memory_type": "long_term"})
+        results = await store.search(make_vector(9999), top_k=3)
+
+        assert results[0][0] == 5
+        assert [vector_id for vector_id, _, _ in results].count(5) == 1
+        # 旧行仍在图中，但分数按新向量计算
+        stale = {vector_id: score for vector_id, score, _ in await store.search(make_vector(5), top_k=5)}
+        expected = float(np.dot(make_vector(5), make_vector(9999)))
+        assert stale.get(5, expected) == pytest.approx(expected, abs=1e-5)
+
+        shard = store.shards["long_term"]
+        await store._compact_shard(shard)
+        for vector_id in range(100, 120):
+            await store.remove_vector(vector_id)
+        await store._compact_shard(shard)
+
+        assert shard.ntotal == 280
+        assert shard.shadowed == set()
+        assert (await store.search(make_vector(9999), top_k=1))[0][0] == 5
+
+    @pytest.mark.asyncio
+    async def test_search_params_applied(self, tmp_path):
+        """测试nprobe可在运行时调整"""
+        store = self._store(tmp_path, "IVFFlat")
+        await self._fill(store)
+
+        store.set_search_params(nprobe=2)
+
+        assert faiss.downcast_index(store.shards["long_term"].index).nprobe == 2
+
+
+class TestQuantizedVectorStore:
+    """测试SQ8/PQ量化与精确重排序"""
+
+    def _store(self, tmp_path, quantization, index_type="Flat"):
+        return MemoryVectorStore(
+            FakeEmbedding(), str(tmp_path), index_type=index_type, quantization=quantization,
+            pq_m=4, nlist=4, promotion_threshold=300, compaction_threshold=0.5
+        )
+
+    async def _fill(self, store, count=400):
+        for vector_id in range(1, count + 1):
+            await store.add_vector(vector_id, make_vector(vector_id), {"memory_type": "long_term"})
+        await asyncio.gather(*store._promotion_tasks.values())
+
+    @pytest.mark.asyncio
+    @pytest.mark.parametrize("quantization,index_type", [
+        ("SQ8", "Flat"), ("PQ", "Flat"), ("PQ", "IVFFlat"), ("SQ8", "HNSW")
+    ])
+    async def test_rerank_returns_exact_scores(self, tmp_path, quantization, index_type):
+        """测试量化索引重排序后返回精确分数"""
+        store = self._store(tmp_path, quantization, index_type)
+        await self._fill(store)
+
+        shard = store.shards["long_term"]
+        assert shard.quantization == quantization
+        assert shard.index_kind == index_type
+
+        results = await store.search(make_vector(123), top_k=3)
+        assert results[0][0] == 123
+        assert results[0][1] == pytest.approx(1.0, abs=1e-5)
+
+    @pytest.mark.asyncio
+    async def test_pq_waits_for_enough_training_points(self, tmp_path):
+        """测试有效向量不足PQ训练所需的数量时不尝试升级，达到后再升级"""
+        store = MemoryVectorStore(
+            FakeEmbedding(), str(tmp_path), quantization="PQ", pq_m=4, promotion_threshold=100
+        )
+        store._build_index = Mock(wraps=store._build_index)
+
+        await self._fill(store, count=255)
+        assert store.shards["long_term"].quantization is None
+        store._build_index.assert_not_called()
+
+        await self._fill(store, count=256)
+        assert store.shards["long_term"].quantization == "PQ"
+        store._build_index.assert_called_once()
+
+    @pytest.mark.asyncio
+    async def test_failed_promotion_backs_off(self, tmp_path):
+        """测试升级失败后有效向量数翻倍前不再重试"""
+        store = self._store(tmp_path, "SQ8")
+        store._build_index = Mock(side_effect=RuntimeError("训练失败"))
+
+        # 第300条触发升级并失败，之后要到600条才重试
+        await self._fill(store, count=300)
+        await self._fill(store, count=599)
+        assert store._build_index.call_count == 1
+        assert store.shards["long_term"].quantization is None
+
+        await self._fill(store, count=600)
+        assert store._build_index.call_count == 2
+
+    @pytest.mark.asyncio
+    async def test_evaluate_recall_reports_loss(self, tmp_path):
+        """测试召回损失报告"""
+        store = self._store(tmp_path, "PQ")
+        await self._fill(store)
+
+        report = (await store.evaluate_recall(sample_size=50, top_k=5))["long_term"]
+
+        assert report["quantization"] == "PQ"
+        assert report["recall"] <= report["recall_reranked"] <= 1.0
+        assert report["recall_reranked"] > 0.8
+        assert report["bytes_per_vector"] < report["flat_bytes_per_vector"]
+
+    @pytest.mark.asyncio
+    async def test_raw_vectors_survive_compaction_and_reload(self, tmp_path):
+        """测试压缩和重新加载后原始向量与索引保持一致"""
+        store = self._store(tmp_path, "SQ8")
+        await self._fill(store)
+        for vector_id in range(1, 101):
+            await store.remove_vector(vector_id)
+        await store.save()
+
+        reopened = self._store(tmp_path, "SQ8")
+        results = await reopened.search(make_vector(250), top_k=2)
+
+        assert len(reopened.shards["long_term"].raw_vectors) == 300
+        assert results[0][0] == 250
+        assert results[0][1] == pytest.approx(1.0, abs=1e-5)
+
+
+class TestCrashRecovery:
+    """测试预写日志与快照恢复"""
+
+    def _store(self, tmp_path, **kwargs):
+        return MemoryVectorStore(FakeEmbedding(), str(tmp_path), **kwargs)
+
+    @pytest.mark.asyncio
+    async def test_replays_unsaved_writes(self, tmp_path):
+        """测试未保存的写入在重新打开后通过日志恢复"""
+        store = self._store(tmp_path)
+        for vector_id in range(1, 31):
+            await store.add_vector(vector_id, make_vector(vector_id), {"memory_type": "long_term"})
+        await store.remove_vector(3)
+        await store.update_vector(4, make_vector(400), {"memory_type": "short_term"})
+
+        reopened = self._store(tmp_path)
+
+        assert await reopened.count() == 29
+        assert (await reopened.search(make_vector(400), top_k=1))[0][0] == 4
+        assert 3 not in [vector_id for vector_id, _, _ in await reopened.search(make_vector(3), top_k=5)]
+
+    @pytest.mark.asyncio
+    async def test_snapshot_truncates_log(self, tmp_path):
+        """测试快照后日志只保留之后的记录"""
+        store = self._store(tmp_path)
+        for vector_id in range(1, 21):
+            await store.add_vector(vector_id, make_vector(vector_id), {"memory_type": "long_term"})
+        await store.save()
+        assert store.wal.record_count == 0
+
+        await store.add_vector(21, make_vector(21), {"memory_type": "long_term"})
+        await store.remove_vector(1)
+
+        reopened = self._store(tmp_path)
+
+        assert reopened.wal.record_count == 2
+        assert await reopened.count() == 20
+        assert (await reopened.search(make_vector(21), top_k=1))[0][0] == 21
+        assert reopened.shards["long_term"].live_count == 20
+
+    @pytest.mark.asyncio
+    async def test_log_fsync_is_grouped_and_off_the_event_loop(self, tmp_path):
+        """测试日志fsync在线程池中执行，并发写入共享同一次fsync"""
+        store = self._store(tmp_path)
+        fsync_threads = []
+        real_fsync = os.fsync
+
+        def slow_fsync(fd):
+            fsync_threads.append(threading.current_thread())
+            time.sleep(0.01)
+            real_fsync(fd)
+
+        with patch("app.core.vectordb.persistence.write_ahead_log.os.fsync", side_effect=slow_fsync):
+            results = await asyncio.gather(*(
+                store.add_vector(vector_id, make_vector(vector_id), {"memory_type": "long_term"})
+                for vector_id in range(1, 21)
+            ))
+        await store.save()
+
+        assert all(results)
+        assert store.wal.synced_lsn == store.wal.last_lsn
+        assert 0 < store.wal.sync_count < 20
+        assert threading.current_thread() not in fsync_threads
+        assert await self._store(tmp_path).count() == 20
+
+    @pytest.mark.asyncio
+    async def test_torn_tail_is_discarded(self, tmp_path):
+        """测试崩溃时写了一半的日志记录被丢弃"""
+        store = self._store(tmp_path)
+        for vector_id in range(1, 6):
+            await store.add_vector(vector_id, make_vector(vector_id), {"memory_type": "long_term"})
+        with open(store.wal.path, "ab") as f:
+            f.write(b"\x40\x00\x00\x00partial")
+
+        reopened = self._store(tmp_path)
+
+        assert await reopened.count() == 5
+        await reopened.add_vector(6, make_vector(6), {"memory_type": "long_term"})
+        assert await self._store(tmp_path).count() == 6
+
+    @pytest.mark.asyncio
+    async def test_evicted_shards_are_not_replayed_twice(self, tmp_path):
+        """测试换出时已落盘的分片不会重复应用日志"""
+        options = {"partition_key": "user_id", "max_resident_shards": 1}
+        store = self._store(tmp_path, **options)
+        for vector_id in range(1, 31):
+            await store.add_vector(vector_id, make_vector(vector_id), {
+                "memory_type": "long_term", "user_id": vector_id % 3
+            })
+        await store.remove_vector(10)
+
+        reopened = self._store(tmp_path, **options)
+        results = await reopened.search(make_vector(7), top_k=20, filter_metadata={"user_id": 1})
+
+        assert await reopened.count() == 29
+        assert len(results) == 9
+        assert results[0][0] == 7
+        assert 10 not in [vector_id for vector_id, _, _ in results]
+
+
+class TestMmapLoading:
+    """测试只读内存映射加载"""
+
+    def _store(self, tmp_path, **kwargs):
+        return MemoryVectorStore(FakeEmbedding(), str(tmp_path), mmap_indices=True, **kwargs)
+
+    async def _fill(self, store, count=50):
+        for vector_id in range(1, count + 1):
+            await store.add_vector(vector_id, make_vector(vector_id), {"memory_type": "long_term"})
+        await asyncio.gather(*store._promotion_tasks.values())
+        await store.save()
+
+    @pytest.mark.asyncio
+    @pytest.mark.parametrize("options", [
+        {}, {"index_type": "IVFFlat", "nlist": 4, "promotion_threshold": 40}, {"quantization": "SQ8"}
+    ])
+    async def test_mapped_shard_searches_and_copies_on_write(self, tmp_path, options):
+        """测试映射加载的分片可直接搜索，写入前复制为私有索引"""
+        await self._fill(self._store(tmp_path, **options))
+
+        reopened = self._store(tmp_path, **options)
+        results = await reopened.search(make_vector(7), top_k=3)
+        shard = reopened.shards["long_term"]
+
+        assert results[0][0] == 7
+        assert shard.mapped
+
+        await reopened.update_vector(7, make_vector(700), {"memory_type": "long_term"})
+        await reopened.remove_vector(8)
+
+        assert not shard.mapped
+        assert (await reopened.search(make_vector(700), top_k=1))[0][0] == 7
+        assert await reopened.count() == 49
+
+    @pytest.mark.asyncio
+    async def test_mapped_shard_compaction(self, tmp_path):
+        """测试映射加载的分片压缩后物理删除向量"""
+        await self._fill(self._store(tmp_path))
+
+        reopened = self._store(tmp_path)
+        for vector_id in range(1, 21):
+            await reopened.remove_vector(vector_id)
+        await reopened.save()
+
+        assert reopened.shards["long_term"].ntotal == 30
+        assert (await self._store(tmp_path).search(make_vector(30), top_k=1))[0][0] == 30
+
+
+class TestRebuildFromRows:
+    """测试从数据库保存的向量嵌入重建索引"""
+
+    @staticmethod
+    def row(memory_id, vector, memory_type="long_term"):
+        return SimpleNamespace(
+            id=memory_id,
+            conversation_id=memory_id % 2 + 1,
+            memory_type=memory_type,
+            content=f"记忆{memory_id}",
+            memory_metadata={"source": "db"},
+            created_at=datetime(2024, 1, 1),
+            embedding=MemoryStore.encode_embedding(vector, vector.dtype)
+        )
+
+    @pytest.mark.asyncio
+    async def test_rebuild_without_inference(self, tmp_path):
+        """测试分块重建、float16解码、跳过维度不符的行，且不调用向量化模型"""
+        class NoInference(FakeEmbedding):
+            async def embed_text(self, text):
+                raise AssertionError("重建不应调用向量化模型")
+
+        store = MemoryVectorStore(NoInference(), str(tmp_path), partition_key="conversation_id")
+        await store.add_vector(999, make_vector(999), {"memory_type": "long_term"})
+        chunks = [
+            [self.row(i, make_vector(i)) for i in range(1, 6)],
+            [self.row(6, make_vector(6).astype(np.float16)), self.row(7, np.ones(3, dtype=np.float32))],
+            [self.row(8, make_vector(8), memory_type="short_term")]
+        ]
+
+        assert await store.rebuild_from_rows(iter(chunks)) == 7
+
+        assert await store.count() == 7
+        assert (await store.search(make_vector(3), top_k=1))[0][0] == 3
+        assert (await store.search(make_vector(6), top_k=1))[0][0] == 6
+        results = await store.search(make_vector(8), top_k=1, filter_metadata={"memory_type": "short_term"})
+        assert results[0][0] == 8
+        assert results[0][2]["content"] == "记忆8"
+        assert results[0][2]["conversation_id"] == 1
+        assert store.metadata_manager.get_record(1)["created_at"] == "2024-01-01T00:00:00"
+
+        reopened = MemoryVectorStore(FakeEmbedding(), str(tmp_path), partition_key="conversation_id")
+        assert await reopened.count() == 7
+
+
+class OtherEmbedding(FakeEmbedding):
+    """模拟更换后的向量化模型"""
+
+    async def embed_text(self, text: str) -> np.ndarray:
+        return make_vector(sum(ord(c) for c in text) + 1000)
+
+
+class TestReembedJob:
+    """测试更换模型时的批量重新向量化"""
+
+    @pytest.mark.asyncio
+    async def test_migrates_and_catches_up(self, tmp_path):
+        """测试迁移全部记忆，并追平迁移期间的删除"""
+        source = MemoryVectorStore(FakeEmbedding(), str(tmp_path / "old"))
+        for memory_id in range(1, 11):
+            await source.add_memory(memory_id, f"记忆{memory_id}", "long_term", {})
+        await source.add_vector(99, make_vector(99), {"memory_type": "long_term"})
+        target = MemoryVectorStore(OtherEmbedding(), str(tmp_path / "new"))
+
+        job = ReembedJob(source, target, batch_size=4)
+        await job._migrate_batch([1, 2])
+        await source.remove_vector(2)
+        assert await job.start()
+
+        assert job.get_progress()["completed"]
+        assert (job.migrated, job.skipped, job.removed) == (10, 1, 1)
+        assert await target.count() == 9
+        expected = await target.embedding_service.embed_text("记忆5")
+        results = await target.search(expected, top_k=1)
+        assert results[0][0] == 5
+        assert results[0][2]["content"] == "记忆5"
+        assert target.metadata_manager.get_record(5).created_at == (
+            source.metadata_manager.get_record(5).created_at
+        )
+
+    @pytest.mark.asyncio
+    async def test_catches_up_memories_updated_during_migration(self, tmp_path):
+        """测试迁移后被改写的记忆在追平时按新内容重新迁移"""
+        source = MemoryVectorStore(FakeEmbedding(), str(tmp_path / "old"))
+        for memory_id in range(1, 4):
+            await source.add_memory(memory_id, f"记忆{memory_id}", "long_term", {})
+        target = MemoryVectorStore(OtherEmbedding(), str(tmp_path / "new"))
+
+        job = ReembedJob(source, target)
+        await job._migrate_batch([1, 2, 3])
+        await source.add_memory(1, "全新内容", "long_term", {})
+        assert await job.run()
+
+        record = target.metadata_manager.get(1)
+        assert record.metadata["content"] == "全新内容"
+        expected = await target.embedding_service.embed_text("全新内容")
+        results = await target.search(expected, top_k=1)
+        assert results[0][0] == 1
+        assert await target.count() == 3
+
+    def test_requires_separate_directory(self, tmp_path):
+        """测试目标存储不能与源存储共用目录"""
+        store = MemoryVectorStore(FakeEmbedding(), str(tmp_path))
+        with pytest.raises(ValueError):
+            ReembedJob(store, store)
+
+
+class TestIdTable:
+    """测试向量ID表"""
+
+    def test_lookup_stays_correct_after_removal(self):
+        """测试删除后查询仍然正确"""
+        table = IdTable()
+        ids = list(range(1000, 3000, 7))
+        rows = {vector_id: table.add(vector_id) for vector_id in ids}
+
+        for vector_id in ids[::3]:
+            assert table.remove(vector_id) == rows.pop(vector_id)
+
+        for vector_id, row in rows.items():
+            assert table.row_of(vector_id) == row
+            assert table.id_at(row) == vector_id
+        assert table.row_of(ids[0]) is None
+        assert len(table) == len(rows)
+
+    def test_compact_renumbers_rows(self):
+        """测试压缩后行号连续"""
+        table = IdTable.from_ids([5, 6, 7, 8])
+        table.remove(6)
+
+        assert table.compact() == 1
+        assert table.ids.tolist() == [5, 7, 8]
+        assert [table.row_of(vector_id) for vector_id in (5, 7, 8)] == [0, 1, 2]
+
+    def test_memory_per_vector(self):
+        """测试每个向量的映射开销"""
+        table = IdTable.from_ids(range(1, 100001))
+
+        assert table.nbytes / len(table) < 24
+
+
+class TestMetadataManager:
+    """测试元数据管理器"""
+
+    def test_positions_are_per_index(self, tmp_path):
+        """测试短期/长期索引各自分配行号"""
+        manager = MetadataManager(str(tmp_path))
+        manager.add(1, "short_term", {})
+        manager.add(2, "long_term", {})
+        manager.add(3, "short_term", {})
+        manager.remove(1)
+
+        assert manager.get_by_index("short_term", 1)["vector_id"] == 3
+        assert manager.get_by_index("long_term", 0)["vector_id"] == 2
+        assert manager.get_by_index("short_term", 0) is None
+
+    def test_save_and_reload(self, tmp_path):
+        """测试保存后重新加载映射"""
+        manager = MetadataManager(str(tmp_path))
+        for vector_id in (10, 11, 12):
+            manager.add(vector_id, "long_term", {"content": str(vector_id)})
+        manager.remove(11)
+        manager.save()
+
+        reloaded = MetadataManager(str(tmp_path))
+
+        assert reloaded.id_table("long_term").ids.tolist() == [10, 12]
+        assert reloaded.get(12)["metadata"]["content"] == "12"
+
+    def test_saved_records_do_not_hold_metadata(self, tmp_path):
+        """测试落盘后常驻记录不再持有元数据正文，读取时从数据库取回"""
+        manager = MetadataManager(str(tmp_path))
+        manager.add(1, "long_term", {"content": "x" * 1000, "user_id": 7})
+        manager.save()
+
+        assert manager.get_record(1).metadata is None
+        assert manager.get(1)["metadata"]["content"] == "x" * 1000
+        assert manager.get_record(1).metadata is None
+        assert manager.match_ids({"user_id": 7}) == {1}
+
+    def test_access_stats_are_batched(self, tmp_path):
+        """测试访问统计在内存中累计，保存时只写回统计"""
+        manager = MetadataManager(str(tmp_path))
+        manager.add(1, "long_term", {"content": "a"})
+        manager.add(2, "long_term", {"content": "b"})
+        manager.save()
+
+        for _ in range(3):
+            manager.get_many([1, 2])
+        assert manager.get_stats()["pending_writes"] == 0
+        assert MetadataManager(str(tmp_path)).get_record(1).access_count == 0
+
+        manager.save()
+        reloaded = MetadataManager(str(tmp_path))
+
+        assert reloaded.get_record(1).access_count == 3
+        assert reloaded.get(2)["metadata"] == {"content": "b"}
+
+    def test_loads_legacy_json(self, tmp_path):
+        """测试加载旧版本JSON元数据，迁移到SQLite后删除旧文件"""
+        legacy = {
+            "metadata": {"5": {
+                "vector_id": 5, "memory_type": "long_term", "index_name": "long_term",
+                "created_at": "2024-01-01T00:00:00", "last_accessed": "2024-01-01T00:00:00",
+                "access_count": 0, "metadata": {"user_id": 1}
+            }},
+            "id_tables": {"long_term": [5]},
+            "wal_lsn": 3
+        }
+        (tmp_path / "vector_metadata.json").write_text(json.dumps(legacy), encoding="utf-8")
+
+        manager = MetadataManager(str(tmp_path))
+        assert manager.match_ids({"user_id": 1}) == {5}
+        assert manager.wal_lsn == 3
+
+        manager.save()
+        assert not (tmp_path / "vector_metadata.json").exists()
+        assert MetadataManager(str(tmp_path)).id_table("long_term").ids.tolist() == [5]